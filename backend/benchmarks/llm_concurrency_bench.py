@@ -0,0 +1,101 @@
+"""
+Check that concurrent prompts overlap their Gemini calls instead of queueing.
+
+Runs N prompts for N different nodes through LLMService against a fake
+client whose `aio.models.generate_content` just sleeps, and asserts the
+wall-clock time stays close to one call rather than N. Needs no API key or
+database. Run from backend/:
+
+    uv run python -m benchmarks.llm_concurrency_bench
+"""
+import asyncio
+import os
+import time
+import uuid
+
+# Placeholders so the service modules import; nothing here reaches Supabase or Gemini
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+from schema.schemas import LLMServiceRequest
+from services.llm_service import LLMService
+
+CONCURRENT_PROMPTS = 16
+CALL_SECONDS = 0.25
+# Allowed overhead on top of one call before the calls count as serialized
+MAX_RATIO = 1.5
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+
+
+class FakeModels:
+    """Stands in for `client.aio.models`: every call takes CALL_SECONDS"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.calls = 0
+        self.running = 0
+        self.max_running = 0
+
+    async def generate_content(self, model: str, contents: str, config=None) -> FakeResponse:
+        self.calls += 1
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.running -= 1
+        return FakeResponse(f"answer to {len(contents)} chars")
+
+
+class FakeClient:
+    def __init__(self, delay: float):
+        self.aio = type("FakeAio", (), {})()
+        self.aio.models = FakeModels(delay)
+
+
+async def fake_fetch_node(node_id: str, board_id=None) -> dict:
+    return {"id": node_id, "board_id": board_id, "title": node_id, "role": "user", "prompt": None, "context": None}
+
+
+async def run(count: int) -> tuple:
+    client = FakeClient(CALL_SECONDS)
+    service = LLMService(client=client, max_concurrency=count)
+    service._fetch_node = fake_fetch_node
+
+    # A fresh run id keeps the prompts out of the response cache
+    run_id = uuid.uuid4().hex[:8]
+    requests = [
+        LLMServiceRequest(node_id=f"node-{i}", board_id="board-bench", prompt=f"question {run_id} {i}")
+        for i in range(count)
+    ]
+
+    started = time.perf_counter()
+    responses = await asyncio.gather(*(service.generate_content(request) for request in requests))
+    elapsed = time.perf_counter() - started
+
+    failed = [response.error for response in responses if not response.success]
+    assert not failed, f"generation failed: {failed[0]}"
+    return elapsed, client.aio.models
+
+
+def main():
+    elapsed, models = asyncio.run(run(CONCURRENT_PROMPTS))
+    ratio = elapsed / CALL_SECONDS
+    print(f"{'prompts':<22} {CONCURRENT_PROMPTS:>8}")
+    print(f"{'upstream calls':<22} {models.calls:>8}")
+    print(f"{'max calls at once':<22} {models.max_running:>8}")
+    print(f"{'one call':<22} {CALL_SECONDS * 1000:>6.0f}ms")
+    print(f"{'wall clock':<22} {elapsed * 1000:>6.0f}ms  ({ratio:.2f}x one call, serial would be {CONCURRENT_PROMPTS}x)")
+
+    assert models.calls == CONCURRENT_PROMPTS, "every prompt should reach the model once"
+    assert ratio < MAX_RATIO, f"calls did not overlap: {ratio:.2f}x one call"
+
+
+if __name__ == "__main__":
+    main()
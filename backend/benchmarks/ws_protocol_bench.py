@@ -0,0 +1,66 @@
+"""
+Compare JSON and binary WebSocket frames for the board message types.
+
+Reports frame size and encode/decode time per message. Run from backend/:
+
+    uv run python -m benchmarks.ws_protocol_bench
+"""
+import json
+import timeit
+from services.ws_protocol import encode_binary, decode_binary
+
+ITERATIONS = 20000
+
+CURSOR = {"user_id": "user-1732468800000-k3j9x2a1b", "x": 1234.5, "y": -678.25, "timestamp": 1732468800123}
+
+MESSAGES = {
+    "node_moved": {"type": "node_moved", "node_id": "node-3f9a1c2e", "x": 1234.5, "y": -678.25},
+    "cursor_moved": {"type": "cursor_moved", "cursor_data": CURSOR},
+    "cursors_snapshot (10 users)": {
+        "type": "cursors_snapshot",
+        "cursors": [dict(CURSOR, user_id=f"user-1732468800000-k3j9x2a{i}") for i in range(10)]
+    },
+    "user_joined": {"type": "user_joined", "board_id": "board-001", "user_count": 3},
+    "node_updated": {
+        "type": "node_updated",
+        "node_id": "node-3f9a1c2e",
+        "updates": {
+            "messages": [
+                {"role": "user", "content": "Summarize the trade-offs of write-behind caching."},
+                {"role": "assistant", "content": "Write-behind caching batches writes for throughput " * 5}
+            ],
+            "isResponded": True
+        }
+    },
+}
+
+
+def encode_json(message: dict) -> str:
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+def per_call_us(fn) -> float:
+    return timeit.timeit(fn, number=ITERATIONS) / ITERATIONS * 1e6
+
+
+def main():
+    header = f"{'message':<28} {'json B':>7} {'bin B':>7} {'size':>6}  {'json enc':>9} {'bin enc':>9}  {'json dec':>9} {'bin dec':>9}"
+    print(header)
+    print("-" * len(header))
+
+    for name, message in MESSAGES.items():
+        text = encode_json(message)
+        frame = encode_binary(message)
+        assert decode_binary(frame)["type"] == message["type"]
+
+        json_size = len(text.encode())
+        binary_size = len(frame)
+        print(
+            f"{name:<28} {json_size:>7} {binary_size:>7} {binary_size / json_size:>6.0%}"
+            f"  {per_call_us(lambda: encode_json(message)):>7.2f}us {per_call_us(lambda: encode_binary(message)):>7.2f}us"
+            f"  {per_call_us(lambda: json.loads(text)):>7.2f}us {per_call_us(lambda: decode_binary(frame)):>7.2f}us"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 import os
-from supabase import create_client, Client
+from typing import Optional
+import httpx
+from supabase import acreate_client, AsyncClient, AsyncClientOptions
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -12,5 +14,70 @@ SUPABASE_KEY: str = os.environ.get("SUPABASE_KEY")
 if not SUPABASE_URL or not SUPABASE_KEY:
     raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in environment variables")
 
-# Create Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
\ No newline at end of file
+# HTTP connection pool shared by every query (tunable per deployment)
+DB_MAX_CONNECTIONS: int = int(os.environ.get("DB_MAX_CONNECTIONS", "20"))
+DB_MAX_KEEPALIVE: int = int(os.environ.get("DB_MAX_KEEPALIVE", "10"))
+DB_TIMEOUT_SECONDS: float = float(os.environ.get("DB_TIMEOUT_SECONDS", "10"))
+
+
+class Database:
+    """
+    Async Supabase client shared across the app.
+
+    The client (and its pooled HTTP connections) is opened once in the FastAPI
+    lifespan and closed on shutdown, so queries are awaited instead of blocking
+    the event loop:
+
+        result = await supabase.table("nodes").select("*").eq("id", node_id).execute()
+    """
+
+    def __init__(self):
+        self._client: Optional[AsyncClient] = None
+        self._http: Optional[httpx.AsyncClient] = None
+
+    async def connect(self):
+        """Create the pooled HTTP session and the async Supabase client."""
+        if self._client is not None:
+            return
+
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=DB_MAX_CONNECTIONS,
+                max_keepalive_connections=DB_MAX_KEEPALIVE,
+            ),
+            timeout=DB_TIMEOUT_SECONDS,
+        )
+        self._client = await acreate_client(
+            SUPABASE_URL,
+            SUPABASE_KEY,
+            options=AsyncClientOptions(
+                httpx_client=self._http,
+                postgrest_client_timeout=DB_TIMEOUT_SECONDS,
+            ),
+        )
+        print(f"Connected to Supabase (pool size: {DB_MAX_CONNECTIONS})")
+
+    async def disconnect(self):
+        """Close the Supabase client and release pooled connections."""
+        if self._http is not None:
+            await self._http.aclose()
+        self._client = None
+        self._http = None
+
+    @property
+    def client(self) -> AsyncClient:
+        if self._client is None:
+            raise RuntimeError("Database is not connected - call `await supabase.connect()` first")
+        return self._client
+
+    def table(self, name: str):
+        """Start a query on a table (same builder API as the sync client)."""
+        return self.client.table(name)
+
+    def rpc(self, fn: str, params: Optional[dict] = None):
+        """Call a Postgres function (see supabase_creation_script.sql)."""
+        return self.client.rpc(fn, params or {})
+
+
+# Create singleton instance (connected in main.py's lifespan)
+supabase = Database()
@@ -1,10 +1,39 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routes import board, websocket  
+from database import supabase
+from services.broker import broker
+from routes import board, search, websocket  
+from services.context_cache import context_cache
+from services.generations import generations
+from services.jobs import jobs
+from services.position_buffer import position_buffer
+from services.presence import presence
+from services.response_cache import response_cache
+from services.websocket_manager import manager
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared resources on startup and release them on shutdown."""
+    await supabase.connect()
+    await broker.start()
+    position_buffer.start()
+    presence.start()
+    jobs.start()
+    try:
+        yield
+    finally:
+        await jobs.stop()
+        await presence.stop()
+        await position_buffer.stop()
+        await broker.stop()
+        await supabase.disconnect()
+        response_cache.close()
 
 
 # Fast API App
-app = FastAPI(title="bn.AI")
+app = FastAPI(title="bn.AI", lifespan=lifespan)
 
 # CORS configuration
 app.add_middleware(
@@ -17,6 +46,7 @@ app.add_middleware(
 
 # Include routers
 app.include_router(board.router, prefix="/api/boards")
+app.include_router(search.router, prefix="/api/search")
 app.include_router(websocket.router, prefix="/api")
 
 
@@ -31,6 +61,23 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/metrics")
+async def metrics():
+    """In-process cache and queue counters"""
+    # Imported lazily, like the routes do (constructing the service needs GEMINI_API_KEY)
+    from services.llm_service import llm_service
+    
+    return {
+        "llm": llm_service.stats(),
+        "context_cache": context_cache.stats(),
+        "jobs": jobs.stats(),
+        "generations": generations.stats(),
+        "position_buffer": position_buffer.stats(),
+        "llm_response_cache": response_cache.stats(),
+        "websockets": manager.stats(),
+    }
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -1,11 +1,18 @@
-from fastapi import APIRouter, HTTPException, Path
+from fastapi import APIRouter, HTTPException, Path, Query, Request, Response
 from typing import List
-from schema.schemas import BoardBase, BoardCreate, BoardUpdate
+from schema.schemas import BoardBase, BoardCreate, BoardUpdate, BoardSaveRequest, BoardSaveResponse
 from database import supabase
+from services.graph_index import graph_index, BoardNotFound
+from services.position_buffer import position_buffer
+from services.board_diff import diff_board
+from services.board_versions import board_versions
+from services.search_index import make_snippet
+from services.typeahead import typeahead
+from services.generations import generations
 import uuid
 
 # Import sub-routers
-from routes import board_nodes, board_edges, board_branches
+from routes import board_nodes, board_edges, board_branches, board_jobs, board_prompts
 
 router = APIRouter()
 
@@ -13,6 +20,8 @@ router = APIRouter()
 router.include_router(board_nodes.router)
 router.include_router(board_edges.router)
 router.include_router(board_branches.router)
+router.include_router(board_jobs.router)
+router.include_router(board_prompts.router)
 
 # ============================================================================
 # BOARD OPERATIONS ONLY
@@ -22,7 +31,7 @@ router.include_router(board_branches.router)
 async def list_boards():
     """List all boards"""
     try:
-        result = supabase.table("boards").select("*").execute()
+        result = await supabase.table("boards").select("*").execute()
         return result.data
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -37,30 +46,154 @@ async def create_board(board_data: BoardCreate):
             "id": board_id,
             "name": board_data.name
         }
-        result = supabase.table("boards").insert(insert_data).execute()
+        result = await supabase.table("boards").insert(insert_data).execute()
         if not result.data:
             raise HTTPException(status_code=500, detail="Failed to create board")
+        typeahead.set_board(board_id, result.data[0]["name"])
         return result.data[0]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/{board_id}", response_model=dict)
-async def get_board(board_id: str = Path(..., description="Board ID")):
-    """Get board with all its nodes and edges"""
+async def get_board(
+    request: Request,
+    response: Response,
+    board_id: str = Path(..., description="Board ID"),
+    view: str = Query("full", pattern="^(full|light)$", description="'light' returns node geometry and titles only"),
+    include_context: bool = Query(False, description="Include each node's assembled context")
+):
+    """
+    Get board with all its nodes and edges.
+    
+    `context` is left out unless asked for. In light view nodes carry no
+    prompt/response either; fetch those on demand with
+    POST /boards/{id}/nodes/bodies.
+    
+    The response carries the board's `version` (also sent as the ETag); pass
+    it to GET /boards/{id}/changes to catch up later, or send the ETag back
+    in If-None-Match to get a 304 when nothing changed.
+    """
     try:
-        board_result = supabase.table("boards").select("*").eq("id", board_id).execute()
+        # Buffered drag positions count as changes once written - write them first
+        await position_buffer.flush(board_id)
+        
+        # Read the version before the rows, so a write racing this read shows up in the next delta
+        version = board_versions.token(board_id)
+        etag = f'W/"{version}-{view}-{int(include_context)}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        
+        board_result = await supabase.table("boards").select("*").eq("id", board_id).execute()
         if not board_result.data:
             raise HTTPException(status_code=404, detail="Board not found")
         
-        nodes_result = supabase.table("nodes").select("*").eq("board_id", board_id).execute()
-        edges_result = supabase.table("edges").select("*").eq("board_id", board_id).execute()
+        columns = board_nodes.NODE_SUMMARY_COLUMNS if view == "light" else board_nodes.NODE_DEFAULT_COLUMNS
+        if include_context:
+            columns += ("context",)
+        nodes_result = await supabase.table("nodes").select(",".join(columns)).eq("board_id", board_id).execute()
+        edges_result = await supabase.table("edges").select("*").eq("board_id", board_id).execute()
         
+        response.headers["ETag"] = etag
         return {
             "board": board_result.data[0],
             "nodes": nodes_result.data or [],
-            "edges": edges_result.data or []
+            "edges": edges_result.data or [],
+            "version": version
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Get what changed on a board since a version
+@router.get("/{board_id}/changes", response_model=dict)
+async def get_board_changes(
+    board_id: str = Path(..., description="Board ID"),
+    since: str = Query(..., description="Version from a previous GET /boards/{id} or /changes"),
+    include_context: bool = Query(False, description="Include each changed node's assembled context")
+):
+    """
+    Get nodes/edges changed or deleted since `since`.
+    
+    If the server can't diff from that version (restart, another worker, or
+    too far behind) `full_sync_required` is true and the client should
+    reload the board with GET /boards/{id}.
+    """
+    try:
+        # Also makes sure the board exists
+        graph = await graph_index.get_board(board_id)
+        # Buffered drag positions count as changes once written
+        await position_buffer.flush(board_id)
+        
+        version = board_versions.token(board_id)
+        since_version = board_versions.parse_token(board_id, since)
+        if since_version is None:
+            return {"version": version, "full_sync_required": True}
+        
+        changes = board_versions.changes_since(board_id, since_version)
+        
+        board = None
+        if changes["board_changed"]:
+            board_result = await supabase.table("boards").select("*").eq("id", board_id).execute()
+            board = board_result.data[0] if board_result.data else None
+        
+        nodes = [
+            {column: graph.nodes[node_id].get(column) for column in board_nodes.NODE_DEFAULT_COLUMNS}
+            for node_id in changes["node_ids"] if node_id in graph.nodes
+        ]
+        if include_context and nodes:
+            # The graph index doesn't hold contexts
+            context_result = await supabase.table("nodes").select("id,context").eq("board_id", board_id)\
+                .in_("id", [node["id"] for node in nodes]).execute()
+            contexts = {row["id"]: row.get("context") for row in context_result.data or []}
+            for node in nodes:
+                node["context"] = contexts.get(node["id"])
+        edges = [graph.edges[edge_id] for edge_id in changes["edge_ids"] if edge_id in graph.edges]
+        
+        return {
+            "version": version,
+            "full_sync_required": False,
+            "board": board,
+            "nodes": nodes,
+            "edges": edges,
+            "deleted_node_ids": changes["deleted_node_ids"],
+            "deleted_edge_ids": changes["deleted_edge_ids"]
         }
+    except BoardNotFound:
+        raise HTTPException(status_code=404, detail="Board not found")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Full-text search over a board's nodes
+@router.get("/{board_id}/search", response_model=dict)
+async def search_board(
+    board_id: str = Path(..., description="Board ID"),
+    q: str = Query(..., description="Search query"),
+    limit: int = Query(20, ge=1, le=100, description="Maximum number of results")
+):
+    """
+    Search node titles, prompts and responses (BM25-ranked).
+    
+    Each result carries a snippet of the best field with highlight offsets,
+    so the client doesn't need the node bodies to show matches.
+    """
+    try:
+        graph = await graph_index.get_board(board_id)
+        results = []
+        for node_id, score, terms in graph.search.search(q, limit):
+            node = graph.nodes[node_id]
+            results.append({
+                "node_id": node_id,
+                "title": node.get("title"),
+                "score": round(score, 4),
+                "snippet": make_snippet(node, terms)
+            })
+        return {"query": q, "results": results}
+    except BoardNotFound:
+        raise HTTPException(status_code=404, detail="Board not found")
     except HTTPException:
         raise
     except Exception as e:
@@ -79,14 +212,16 @@ async def update_board(
             update_data["name"] = board_data.name
         
         if not update_data:
-            result = supabase.table("boards").select("*").eq("id", board_id).execute()
+            result = await supabase.table("boards").select("*").eq("id", board_id).execute()
             if not result.data:
                 raise HTTPException(status_code=404, detail="Board not found")
             return result.data[0]
         
-        result = supabase.table("boards").update(update_data).eq("id", board_id).execute()
+        result = await supabase.table("boards").update(update_data).eq("id", board_id).execute()
         if not result.data:
             raise HTTPException(status_code=404, detail="Board not found")
+        board_versions.record(board_id, "board", board_id)
+        typeahead.set_board(board_id, result.data[0]["name"])
         return result.data[0]
     except HTTPException:
         raise
@@ -98,11 +233,14 @@ async def update_board(
 async def delete_board(board_id: str = Path(..., description="Board ID")):
     """Delete board (cascades to nodes/edges)"""
     try:
-        check = supabase.table("boards").select("id").eq("id", board_id).execute()
+        check = await supabase.table("boards").select("id").eq("id", board_id).execute()
         if not check.data:
             raise HTTPException(status_code=404, detail="Board not found")
         
-        supabase.table("boards").delete().eq("id", board_id).execute()
+        generations.cancel(board_id, reason="board deleted")
+        await supabase.table("boards").delete().eq("id", board_id).execute()
+        graph_index.invalidate(board_id)
+        typeahead.remove_board(board_id)
         return {"message": "Board deleted successfully", "board_id": board_id}
     except HTTPException:
         raise
@@ -114,18 +252,125 @@ async def delete_board(board_id: str = Path(..., description="Board ID")):
 async def reset_board(board_id: str = Path(..., description="Board ID")):
     """Reset board - delete all nodes and edges except for the root node"""
     try:
-        check = supabase.table("boards").select("id").eq("id", board_id).execute()
+        check = await supabase.table("boards").select("id").eq("id", board_id).execute()
         if not check.data:
             raise HTTPException(status_code=404, detail="Board not found")
         
+        # Stop generations that would otherwise write into the wiped nodes
+        generations.cancel(board_id, reason="board reset")
+        
         # Delete edges
-        supabase.table("edges").delete().eq("board_id", board_id).execute()
+        await supabase.table("edges").delete().eq("board_id", board_id).execute()
 
         # Delete nodes except for the root node
-        supabase.table("nodes").delete().eq("board_id", board_id).neq("is_root", True).execute()
+        await supabase.table("nodes").delete().eq("board_id", board_id).neq("is_root", True).execute()
+        graph_index.invalidate(board_id)
+        await typeahead.reload_board_nodes(board_id)
         
         return {"message": "Board reset successfully", "board_id": board_id}
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def claim_new_rows(table: str, rows: List[dict], board_id: str):
+    """
+    Split rows the diff thinks are new into (inserts, updates).
+
+    One lookup checks their ids: an id owned by another board is rejected
+    (409) rather than moved over, and one already stored in this board (our
+    graph copy was behind) becomes an update.
+    """
+    if not rows:
+        return [], []
+    result = await supabase.table(table).select("id,board_id").in_("id", [row["id"] for row in rows]).execute()
+    owners = {existing["id"]: existing["board_id"] for existing in result.data or []}
+    foreign = [row_id for row_id, owner in owners.items() if owner != board_id]
+    if foreign:
+        raise HTTPException(status_code=409, detail=f"Ids already used by another board in {table}: {', '.join(foreign)}")
+    # A save never overwrites a stored node's context (see board_diff.NODE_COLUMNS)
+    updates = [{column: value for column, value in row.items() if column != "context"} for row in rows if row["id"] in owners]
+    return [row for row in rows if row["id"] not in owners], updates
+
+
+# Save a whole React Flow board, writing only what changed
+@router.post("/{board_id}/save", response_model=BoardSaveResponse)
+async def save_board(
+    board_id: str = Path(..., description="Board ID"),
+    board_data: BoardSaveRequest = None
+):
+    """
+    Save the submitted nodes/edges as the board's full state.
+
+    The submission is diffed against the stored board; new rows are
+    inserted, changed ones upserted and missing ones deleted, one batched
+    statement per kind. Ids owned by another board are rejected with 409.
+    """
+    try:
+        check = await supabase.table("boards").select("id").eq("id", board_id).execute()
+        if not check.data:
+            raise HTTPException(status_code=404, detail="Board not found")
+
+        node_ids = {node.id for node in board_data.nodes}
+        for edge in board_data.edges:
+            if edge.source not in node_ids or edge.target not in node_ids:
+                raise HTTPException(status_code=400, detail=f"Edge {edge.id} references a node that isn't in the board")
+
+        graph = await graph_index.get_board(board_id)
+        diff = diff_board(board_id, graph.nodes, graph.edges, board_data.nodes, board_data.edges)
+        node_inserts, stale_node_updates = await claim_new_rows("nodes", diff["node_inserts"], board_id)
+        edge_inserts, stale_edge_updates = await claim_new_rows("edges", diff["edge_inserts"], board_id)
+        node_updates = diff["node_updates"] + stale_node_updates
+        edge_updates = diff["edge_updates"] + stale_edge_updates
+
+        # Order matters: edges may point at new nodes, and removed nodes cascade their edges.
+        # New rows are inserted, never upserted, so a save can't take over another board's rows
+        if diff["edge_deletes"]:
+            await supabase.table("edges").delete().eq("board_id", board_id).in_("id", diff["edge_deletes"]).execute()
+        saved_nodes = []
+        if node_inserts:
+            result = await supabase.table("nodes").insert(node_inserts).execute()
+            saved_nodes += result.data or []
+        if node_updates:
+            result = await supabase.table("nodes").upsert(node_updates).execute()
+            saved_nodes += result.data or []
+        saved_edges = []
+        if edge_inserts:
+            result = await supabase.table("edges").insert(edge_inserts).execute()
+            saved_edges += result.data or []
+        if edge_updates:
+            result = await supabase.table("edges").upsert(edge_updates).execute()
+            saved_edges += result.data or []
+        if diff["node_deletes"]:
+            # Don't let running generations finish and write into the deleted nodes
+            for node_id in diff["node_deletes"]:
+                generations.cancel(board_id, node_id, "node deleted")
+            await supabase.table("nodes").delete().eq("board_id", board_id).in_("id", diff["node_deletes"]).execute()
+
+        for edge_id in diff["edge_deletes"]:
+            graph_index.remove_edge(board_id, edge_id)
+        for node in saved_nodes:
+            graph_index.upsert_node(board_id, node)
+            # The saved position supersedes any buffered drag
+            position_buffer.discard(board_id, node["id"])
+        for edge in saved_edges:
+            graph_index.upsert_edge(board_id, edge)
+        for node_id in diff["node_deletes"]:
+            graph_index.remove_node(board_id, node_id)
+            position_buffer.discard(board_id, node_id)
+
+        return BoardSaveResponse(
+            message=(
+                f"Board saved: nodes {len(node_inserts)} added, {len(node_updates)} updated, "
+                f"{len(diff['node_deletes'])} deleted; edges {len(edge_inserts)} added, "
+                f"{len(edge_updates)} updated, {len(diff['edge_deletes'])} deleted"
+            ),
+            nodes_saved=len(saved_nodes),
+            edges_saved=len(saved_edges)
+        )
+    except BoardNotFound:
+        raise HTTPException(status_code=404, detail="Board not found")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
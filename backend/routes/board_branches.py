@@ -1,15 +1,53 @@
-from fastapi import APIRouter, HTTPException, Path
-from schema.schemas import BranchHighlightRequest, BranchFullRequest, BranchCreateResponse
+from fastapi import APIRouter, HTTPException, Path, Query
+from fastapi.responses import JSONResponse
+from schema.schemas import BranchHighlightRequest, BranchFullRequest, BranchCreateResponse, LLMPriority
 from database import supabase
 from services.context_service import update_node_context
+from services.graph_index import graph_index
+from routes.board_nodes import submit_job
+from services.generations import generations, GenerationCancelled
 import uuid
 
 router = APIRouter()
 
+async def generate_branch_response(board_id: str, node_id: str, prompt: str, since=None,
+                                   priority: LLMPriority = LLMPriority.INTERACTIVE) -> dict:
+    """Generate a branch node's answer and store it (as the node's tracked generation); returns the updated row"""
+    return await generations.run(board_id, node_id, lambda: store_branch_response(board_id, node_id, prompt, priority), since)
+
+
+async def store_branch_response(board_id: str, node_id: str, prompt: str, priority: LLMPriority) -> dict:
+    from services.llm_service import llm_service
+    from schema.schemas import LLMServiceRequest
+    
+    llm_request = LLMServiceRequest(
+        node_id=node_id,
+        prompt=prompt,
+        board_id=board_id,
+        priority=priority,
+    )
+    
+    llm_response = await llm_service.generate_content(llm_request)
+    if not llm_response.success:
+        raise HTTPException(status_code=llm_response.status_code or 500, detail=f"LLM call failed: {llm_response.error}")
+    
+    # Update node with LLM response (the update returns the refreshed row)
+    updated_node = await supabase.table("nodes").update({
+        "response": llm_response.generated_content,
+        "role": "assistant"
+    }).eq("id", node_id).execute()
+    
+    if not updated_node.data:
+        raise HTTPException(status_code=500, detail="Failed to update branch node")
+    graph_index.upsert_node(board_id, updated_node.data[0])
+    return updated_node.data[0]
+
+
 @router.post("/{board_id}/branches/highlight", response_model=BranchCreateResponse)
 async def branch_highlight(
     board_id: str = Path(..., description="Board ID"),
-    branch_data: BranchHighlightRequest = None
+    branch_data: BranchHighlightRequest = None,
+    job: bool = Query(False, description="Generate in a background job: returns 202 with the node, edge and job id")
 ):
     """
     Create a new node from highlighted text in a parent node.
@@ -22,17 +60,15 @@ async def branch_highlight(
     """
     try:
         # Validate board exists
-        board_check = supabase.table("boards").select("id").eq("id", board_id).execute()
+        board_check = await supabase.table("boards").select("id").eq("id", board_id).execute()
         if not board_check.data:
             raise HTTPException(status_code=404, detail="Board not found")
         
         # Get source node to copy some properties
-        source_node_result = supabase.table("nodes").select("*").eq("id", branch_data.source_node_id).eq("board_id", board_id).execute()
-        if not source_node_result.data:
+        source_node = await graph_index.get_node(board_id, branch_data.source_node_id)
+        if not source_node:
             raise HTTPException(status_code=404, detail="Source node not found")
         
-        source_node = source_node_result.data[0]
-        
         # Calculate position for new node (to the right of source)
         pos_x = branch_data.position.x if branch_data.position else source_node["x"] + 500
         pos_y = branch_data.position.y if branch_data.position else source_node["y"]
@@ -70,9 +106,10 @@ async def branch_highlight(
         }
         
         # Insert node
-        node_result = supabase.table("nodes").insert(node_insert).execute()
+        node_result = await supabase.table("nodes").insert(node_insert).execute()
         if not node_result.data:
             raise HTTPException(status_code=500, detail="Failed to create branch node")
+        graph_index.upsert_node(board_id, node_result.data[0])
         
         # Create edge connecting source to new node
         edge_insert = {
@@ -84,21 +121,20 @@ async def branch_highlight(
             "label": None
         }
         
-        edge_result = supabase.table("edges").insert(edge_insert).execute()
+        edge_result = await supabase.table("edges").insert(edge_insert).execute()
         if not edge_result.data:
             # Rollback: delete the node if edge creation fails
-            supabase.table("nodes").delete().eq("id", new_node_id).execute()
+            await supabase.table("nodes").delete().eq("id", new_node_id).execute()
+            graph_index.remove_node(board_id, new_node_id)
             raise HTTPException(status_code=500, detail="Failed to create branch edge")
+        graph_index.upsert_edge(board_id, edge_result.data[0])
         
         # Build full context from parent nodes (includes parent's conversation)
         # This will merge the highlighted text context with parent's context
-        full_context = update_node_context(new_node_id, board_id)
+        full_context = await update_node_context(new_node_id, board_id)
         
         # If auto_generate is True, call LLM immediately
         if branch_data.auto_generate:
-            from services.llm_service import llm_service
-            from schema.schemas import LLMServiceRequest
-            
             # Build prompt that emphasizes the highlighted text
             enhanced_prompt = f"""Based on this highlighted text from the parent conversation:
 
@@ -106,24 +142,27 @@ async def branch_highlight(
 
 {branch_data.user_question}"""
             
-            llm_request = LLMServiceRequest(
-                node_id=new_node_id,
-                prompt=enhanced_prompt,
-            )
-            
-            llm_response = await llm_service.generate_content(llm_request)
+            if job:
+                # Node and edge exist already; the answer follows from the job workers
+                since = generations.epoch(board_id, new_node_id)
+                submitted = submit_job(
+                    board_id, "branch_response",
+                    lambda: generate_branch_response(board_id, new_node_id, enhanced_prompt, since, LLMPriority.BACKGROUND),
+                    node_id=new_node_id
+                )
+                return JSONResponse(status_code=202, content={
+                    "node": node_result.data[0],
+                    "edge": edge_result.data[0],
+                    "job_id": submitted["id"]
+                })
             
-            if llm_response.success:
-                # Update node with LLM response
-                supabase.table("nodes").update({
-                    "response": llm_response.generated_content,
-                    "role": "assistant"
-                }).eq("id", new_node_id).execute()
-                
-                # Refresh node data to return updated version
-                updated_node = supabase.table("nodes").select("*").eq("id", new_node_id).execute()
-                if updated_node.data:
-                    node_result.data[0] = updated_node.data[0]
+            try:
+                node_result.data[0] = await generate_branch_response(board_id, new_node_id, enhanced_prompt)
+            except HTTPException as e:
+                # The branch still exists without an answer; the user can re-prompt it
+                print(f"Branch generation failed for {new_node_id}: {e.detail}")
+            except GenerationCancelled as e:
+                print(f"Branch generation cancelled for {new_node_id}: {e}")
         
         return {
             "node": node_result.data[0],
@@ -143,14 +182,14 @@ async def branch_full(
 ):
     """Create full branch"""
     try:
-        board_check = supabase.table("boards").select("id").eq("id", board_id).execute()
+        board_check = await supabase.table("boards").select("id").eq("id", board_id).execute()
         if not board_check.data:
             raise HTTPException(status_code=404, detail="Board not found")
         
         new_node_id = f"node-{uuid.uuid4().hex[:8]}"
         new_edge_id = f"edge-{uuid.uuid4().hex[:8]}"
         
-        source_node = supabase.table("nodes").select("*").eq("id", branch_data.source_node_id).eq("board_id", board_id).execute()
+        source_node = await supabase.table("nodes").select("*").eq("id", branch_data.source_node_id).eq("board_id", board_id).execute()
         if not source_node.data:
             raise HTTPException(status_code=404, detail="Source node not found")
         
@@ -180,9 +219,10 @@ async def branch_full(
             "metadata": new_data.get("metadata", {})
         }
         
-        node_result = supabase.table("nodes").insert(node_insert).execute()
+        node_result = await supabase.table("nodes").insert(node_insert).execute()
         if not node_result.data:
             raise HTTPException(status_code=500, detail="Failed to create branch node")
+        graph_index.upsert_node(board_id, node_result.data[0])
         
         edge_insert = {
             "id": new_edge_id,
@@ -193,10 +233,12 @@ async def branch_full(
             "label": None
         }
         
-        edge_result = supabase.table("edges").insert(edge_insert).execute()
+        edge_result = await supabase.table("edges").insert(edge_insert).execute()
         if not edge_result.data:
-            supabase.table("nodes").delete().eq("id", new_node_id).execute()
+            await supabase.table("nodes").delete().eq("id", new_node_id).execute()
+            graph_index.remove_node(board_id, new_node_id)
             raise HTTPException(status_code=500, detail="Failed to create branch edge")
+        graph_index.upsert_edge(board_id, edge_result.data[0])
         
         return {
             "node": node_result.data[0],
@@ -2,6 +2,7 @@ from fastapi import APIRouter, HTTPException, Path
 from typing import List
 from schema.schemas import EdgeBase
 from database import supabase
+from services.graph_index import graph_index
 
 router = APIRouter()
 
@@ -10,7 +11,7 @@ router = APIRouter()
 async def get_board_edges(board_id: str = Path(..., description="Board ID")):
     """Get all edges for a board"""
     try:
-        result = supabase.table("edges").select("*").eq("board_id", board_id).execute()
+        result = await supabase.table("edges").select("*").eq("board_id", board_id).execute()
         return result.data
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -23,7 +24,7 @@ async def create_edge(
 ):
     """Create an edge in this board"""
     try:
-        board_check = supabase.table("boards").select("id").eq("id", board_id).execute()
+        board_check = await supabase.table("boards").select("id").eq("id", board_id).execute()
         if not board_check.data:
             raise HTTPException(status_code=404, detail="Board not found")
         
@@ -35,9 +36,10 @@ async def create_edge(
             "edge_type": edge_data.edge_type or "default"
         }
         
-        result = supabase.table("edges").insert(insert_data).execute()
+        result = await supabase.table("edges").insert(insert_data).execute()
         if not result.data:
             raise HTTPException(status_code=500, detail="Failed to create edge")
+        graph_index.upsert_edge(result.data[0]["board_id"], result.data[0])
         return result.data[0]
     except HTTPException:
         raise
@@ -52,7 +54,7 @@ async def get_edge(
 ):
     """Get a specific edge"""
     try:
-        result = supabase.table("edges").select("*").eq("id", edge_id).eq("board_id", board_id).execute()
+        result = await supabase.table("edges").select("*").eq("id", edge_id).eq("board_id", board_id).execute()
         if not result.data:
             raise HTTPException(status_code=404, detail="Edge not found")
         return result.data[0]
@@ -70,7 +72,7 @@ async def update_edge(
 ):
     """Update an edge"""
     try:
-        check = supabase.table("edges").select("*").eq("id", edge_id).eq("board_id", board_id).execute()
+        check = await supabase.table("edges").select("*").eq("id", edge_id).eq("board_id", board_id).execute()
         if not check.data:
             raise HTTPException(status_code=404, detail="Edge not found in this board")
         
@@ -87,9 +89,10 @@ async def update_edge(
         if not update_data:
             return check.data[0]
         
-        result = supabase.table("edges").update(update_data).eq("id", edge_id).execute()
+        result = await supabase.table("edges").update(update_data).eq("id", edge_id).execute()
         if not result.data:
             raise HTTPException(status_code=500, detail="Failed to update edge")
+        graph_index.upsert_edge(board_id, result.data[0])
         return result.data[0]
     except HTTPException:
         raise
@@ -104,11 +107,12 @@ async def delete_edge(
 ):
     """Delete an edge"""
     try:
-        check = supabase.table("edges").select("id").eq("id", edge_id).eq("board_id", board_id).execute()
+        check = await supabase.table("edges").select("id").eq("id", edge_id).eq("board_id", board_id).execute()
         if not check.data:
             raise HTTPException(status_code=404, detail="Edge not found in this board")
         
-        supabase.table("edges").delete().eq("id", edge_id).execute()
+        await supabase.table("edges").delete().eq("id", edge_id).execute()
+        graph_index.remove_edge(board_id, edge_id)
         return {"message": "Edge deleted successfully", "edge_id": edge_id}
     except HTTPException:
         raise
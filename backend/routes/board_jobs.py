@@ -0,0 +1,26 @@
+from fastapi import APIRouter, HTTPException, Path
+from services.jobs import jobs
+
+router = APIRouter()
+
+# Get the status of a background generation job
+@router.get("/{board_id}/jobs/{job_id}")
+async def get_job(
+    board_id: str = Path(..., description="Board ID"),
+    job_id: str = Path(..., description="Job ID")
+):
+    """
+    Get a job's status (queued, running, succeeded, failed, cancelled).
+    
+    Once it succeeded, `result` holds its result - on the worker that ran
+    it; other workers return the status with `result` null.
+    """
+    try:
+        job = jobs.get(job_id)
+        if job is None or job["board_id"] != board_id:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return job
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
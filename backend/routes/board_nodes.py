@@ -1,19 +1,242 @@
-from fastapi import APIRouter, HTTPException, Path, Body
+from fastapi import APIRouter, HTTPException, Path, Body, Query
+from fastapi.responses import JSONResponse
 from typing import List, Optional
-from schema.schemas import NodeCreate, NodeBase, NodeUpdate, NodePosition
+from contextlib import aclosing
+import asyncio
+import math
+from schema.schemas import NodeCreate, NodeBase, NodeUpdate, NodePosition, NodeBodiesRequest, LLMPriority
 from database import supabase
 from services.context_service import update_node_context
 from services.websocket_manager import manager
+from services.graph_index import graph_index, BoardNotFound
+from services.position_buffer import position_buffer
+from services.jobs import jobs, JobQueueFull
+from services.generations import generations, GenerationCancelled, prompt_key
 
 router = APIRouter()
 
-# Get all nodes for a board
+
+# Columns a node update may change (None means "leave as is")
+UPDATABLE_NODE_FIELDS = (
+    "x", "y", "width", "height", "title", "prompt", "response", "context",
+    "role", "is_root", "is_collapsed", "is_starred", "model",
+)
+
+# Column projections for board loads: geometry and titles only, and everything
+# but the (often huge) assembled `context`
+NODE_SUMMARY_COLUMNS = (
+    "id", "board_id", "x", "y", "width", "height", "title", "role", "is_root",
+    "is_collapsed", "is_starred", "is_responded", "color", "icon", "model",
+)
+NODE_BODY_COLUMNS = ("prompt", "response", "metadata")
+NODE_DEFAULT_COLUMNS = NODE_SUMMARY_COLUMNS + NODE_BODY_COLUMNS
+
+
+def node_update_fields(node_data) -> dict:
+    """Collect the non-None updatable fields of a NodeUpdate/NodeBase payload."""
+    update_data = {}
+    for field in UPDATABLE_NODE_FIELDS:
+        value = getattr(node_data, field)
+        if value is not None:
+            update_data[field] = value
+    return update_data
+
+
+async def stream_llm_response(board_id: str, node_id: str, llm_request) -> str:
+    """
+    Relay Gemini output to the board as it is generated.
+    
+    Each chunk is broadcast to the room as a `node_response_delta` message so
+    collaborators see the answer appear live; `index` numbers the chunks of
+    one stream from 0. Returns the full response text.
+    """
+    from services.llm_service import llm_service, upstream_status, RETRYABLE_STATUS_CODES
+    
+    chunks = []
+    try:
+        async with aclosing(llm_service.generate_content_stream(llm_request)) as stream:
+            async for delta in stream:
+                chunks.append(delta)
+                try:
+                    await manager.broadcast_to_room(
+                        board_id,
+                        {
+                            "type": "node_response_delta",
+                            "node_id": node_id,
+                            "index": len(chunks) - 1,
+                            "delta": delta
+                        }
+                    )
+                except Exception as e:
+                    print(f"Error broadcasting response delta: {e}")
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=500, detail=f"LLM call failed: timed out after {llm_service.timeout}s")
+    except Exception as e:
+        status = upstream_status(e)
+        raise HTTPException(status_code=status if status in RETRYABLE_STATUS_CODES else 500, detail=f"LLM call failed: {e}")
+    
+    return "".join(chunks)
+
+
+async def announce_stream_failed(board_id: str, node_id: str, reason: str):
+    """Tell the room a streamed answer won't be completed, so clients drop the partial text."""
+    try:
+        await manager.broadcast_to_room(
+            board_id,
+            {
+                "type": "node_response_failed",
+                "node_id": node_id,
+                "reason": reason
+            }
+        )
+    except Exception as e:
+        print(f"Error broadcasting response failure: {e}")
+
+
+def parse_bbox(bbox: str):
+    """Parse a `minX,minY,maxX,maxY` query value."""
+    try:
+        min_x, min_y, max_x, max_y = (float(value) for value in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be minX,minY,maxX,maxY")
+    if not all(math.isfinite(value) for value in (min_x, min_y, max_x, max_y)):
+        raise HTTPException(status_code=400, detail="bbox values must be finite numbers")
+    if min_x > max_x or min_y > max_y:
+        raise HTTPException(status_code=400, detail="bbox min must not exceed max")
+    return (min_x, min_y, max_x, max_y)
+
+
+async def prompt_node(board_id: str, node_id: str, prompt: str, stream: bool = False,
+                      since=None, priority: LLMPriority = LLMPriority.INTERACTIVE) -> dict:
+    """
+    Ask Gemini `prompt` on a node and store the answer.
+    
+    Builds the node's context, generates (streaming deltas to the room if
+    `stream`), writes prompt/response and broadcasts `node_updated`.
+    Returns the updated node row. Runs as the node's tracked generation:
+    the same prompt already generating on the node is joined, and it raises
+    GenerationCancelled if the node is re-prompted differently, deleted or
+    reset meanwhile (or was since the epoch `since`) - without writing.
+    Work nobody is waiting on (jobs, batches) should pass BACKGROUND
+    `priority` so it doesn't hold up interactive prompts.
+    """
+    return await generations.run(
+        board_id, node_id,
+        lambda: generate_node_response(board_id, node_id, prompt, stream, priority),
+        since, prompt_key(prompt)
+    )
+
+
+async def generate_node_response(board_id: str, node_id: str, prompt: str, stream: bool,
+                                 priority: LLMPriority) -> dict:
+    from schema.schemas import LLMServiceRequest
+    
+    # **NEW: Build context from parent nodes before LLM call**
+    context = await update_node_context(node_id, board_id)
+    print(f"Built context for node {node_id}: {context[:100] if context else 'None'}...")  # Debug log
+    
+    llm_request = LLMServiceRequest(
+        node_id=node_id,
+        prompt=prompt,
+        board_id=board_id,
+        priority=priority,
+    )
+    
+    try:
+        return await store_node_response(board_id, node_id, prompt, stream, llm_request)
+    except asyncio.CancelledError:
+        if stream:
+            await announce_stream_failed(board_id, node_id, "cancelled")
+        raise
+    except Exception as e:
+        if stream:
+            await announce_stream_failed(board_id, node_id, str(getattr(e, "detail", None) or e))
+        raise
+
+
+async def store_node_response(board_id: str, node_id: str, prompt: str, stream: bool, llm_request) -> dict:
+    """Generate the answer, write it to the node and broadcast `node_updated`; returns the updated row"""
+    from services.llm_service import llm_service
+    
+    if stream:
+        # Deltas go out over the WebSocket; the final text is persisted once below
+        generated_content = await stream_llm_response(board_id, node_id, llm_request)
+    else:
+        llm_response = await llm_service.generate_content(llm_request)
+        if not llm_response.success:
+            # 429/503 from upstream (after retries) are passed on so clients can back off
+            raise HTTPException(status_code=llm_response.status_code or 500, detail=f"LLM call failed: {llm_response.error}")
+        generated_content = llm_response.generated_content
+    
+    update_data = {
+        "prompt": prompt,
+        "response": generated_content,
+        "role": "assistant",
+        "is_responded": True  # NEW: Mark node as responded to
+    }
+    result = await supabase.table("nodes").update(update_data).eq("id", node_id).execute()
+    if not result.data:
+        raise HTTPException(status_code=500, detail="Failed to update node")
+    graph_index.upsert_node(board_id, result.data[0])
+    
+    # Build messages array for WebSocket broadcast
+    messages = []
+    if prompt:
+        messages.append({"role": "user", "content": prompt})
+    if generated_content:
+        messages.append({"role": "assistant", "content": generated_content})
+    
+    # Broadcast update to all clients via WebSocket
+    try:
+        await manager.broadcast_to_room(
+            board_id,
+            {
+                "type": "node_updated",
+                "node_id": node_id,
+                "updates": {
+                    "messages": messages,
+                    "isResponded": True
+                }
+            }
+        )
+    except Exception as e:
+        print(f"Error broadcasting node update: {e}")
+        # Don't fail the request if broadcast fails
+    
+    return result.data[0]
+
+
+def submit_job(board_id: str, kind: str, work, node_id: Optional[str] = None) -> dict:
+    """Queue a background job, turning a full queue into a 503"""
+    try:
+        return jobs.submit(board_id, kind, work, node_id=node_id)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=f"Too many queued jobs, try again later ({e})")
+
+
+# Get all nodes for a board (or only those in a viewport)
 @router.get("/{board_id}/nodes", response_model=List[NodeBase])
-async def get_board_nodes(board_id: str = Path(..., description="Board ID")):
-    """Get all nodes for a board"""
+async def get_board_nodes(
+    board_id: str = Path(..., description="Board ID"),
+    bbox: Optional[str] = Query(None, description="Viewport as minX,minY,maxX,maxY - only intersecting nodes are returned")
+):
+    """Get all nodes for a board, or those intersecting `bbox` (answered from the spatial index)"""
     try:
-        result = supabase.table("nodes").select("*").eq("board_id", board_id).execute()
+        if bbox is not None:
+            rect = parse_bbox(bbox)
+            graph = await graph_index.get_board(board_id)
+            # Same columns as a default board load - never the (often huge) context
+            return [
+                {column: node.get(column) for column in NODE_DEFAULT_COLUMNS}
+                for node in graph.nodes_in_rect(rect)
+            ]
+        
+        result = await supabase.table("nodes").select("*").eq("board_id", board_id).execute()
         return result.data
+    except BoardNotFound:
+        raise HTTPException(status_code=404, detail="Board not found")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -25,7 +248,7 @@ async def create_node(
 ):
     """Create a node in this board"""
     try:
-        board_check = supabase.table("boards").select("id").eq("id", board_id).execute()
+        board_check = await supabase.table("boards").select("id").eq("id", board_id).execute()
         if not board_check.data:
             raise HTTPException(status_code=404, detail="Board not found")
         
@@ -47,15 +270,102 @@ async def create_node(
             "is_root": node_data.is_root,
         }
         
-        result = supabase.table("nodes").insert(insert_data).execute()
+        result = await supabase.table("nodes").insert(insert_data).execute()
         if not result.data:
             raise HTTPException(status_code=500, detail="Failed to create node")
+        graph_index.upsert_node(board_id, result.data[0])
         return result.data[0]
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Bulk update multiple nodes
+@router.patch("/{board_id}/nodes/bulk", response_model=dict)
+async def bulk_update_nodes(
+    board_id: str = Path(..., description="Board ID"),
+    bulk_data: List[NodeBase] = None
+):
+    """
+    Bulk update multiple nodes in this board.
+    
+    All updates go to the database in a single `bulk_update_nodes` call, which
+    only touches nodes that belong to this board - any id it doesn't return is
+    reported in `not_found_ids`.
+    """
+    if not bulk_data: #error handling
+        return {
+            "updated_count": 0,
+            "updated_nodes": [],
+            "not_found_ids": [],
+            "errors": []
+        }
+    
+    # One entry per node id (a later entry for the same node wins)
+    updates = {}
+    for node_update in bulk_data:
+        updates[node_update.id] = {"id": node_update.id, **node_update_fields(node_update)}
+    
+    try:
+        result = await supabase.rpc("bulk_update_nodes", {
+            "board_id_param": board_id,
+            "updates": list(updates.values())
+        }).execute()
+    except Exception as e:
+        return {
+            "updated_count": 0,
+            "updated_nodes": [],
+            "not_found_ids": [],
+            "errors": [f"{node_id}: {str(e)}" for node_id in updates]
+        }
+    
+    updated_nodes = result.data or []
+    for node in updated_nodes:
+        graph_index.upsert_node(board_id, node)
+        # This write supersedes any buffered drag position for the node
+        position_buffer.discard(board_id, node["id"])
+    
+    updated_ids = {node["id"] for node in updated_nodes}
+    return {
+        "updated_count": len(updated_nodes),
+        "updated_nodes": updated_nodes,
+        "not_found_ids": [node_id for node_id in updates if node_id not in updated_ids],
+        "errors": []
+    }
+
+# Fetch node bodies on demand (pairs with GET /boards/{id}?view=light)
+@router.post("/{board_id}/nodes/bodies", response_model=dict)
+async def get_node_bodies(
+    board_id: str = Path(..., description="Board ID"),
+    bodies_request: NodeBodiesRequest = None
+):
+    """
+    Get prompt/response (and optionally context) for a list of nodes.
+    
+    Clients that loaded the board in light view call this for the nodes they
+    expand or scroll into view. Ids not on this board are reported in
+    `not_found_ids`.
+    """
+    try:
+        if not bodies_request.node_ids:
+            return {"nodes": [], "not_found_ids": []}
+        
+        columns = ("id",) + NODE_BODY_COLUMNS
+        if bodies_request.include_context:
+            columns += ("context",)
+        
+        node_ids = list(dict.fromkeys(bodies_request.node_ids))
+        result = await supabase.table("nodes").select(",".join(columns)).eq("board_id", board_id).in_("id", node_ids).execute()
+        nodes = result.data or []
+        
+        found_ids = {node["id"] for node in nodes}
+        return {
+            "nodes": nodes,
+            "not_found_ids": [node_id for node_id in node_ids if node_id not in found_ids]
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Get a specific node
 @router.get("/{board_id}/nodes/{id}", response_model=NodeBase)
 async def get_node(
@@ -64,7 +374,7 @@ async def get_node(
 ):
     """Get a specific node"""
     try:
-        result = supabase.table("nodes").select("*").eq("id", id).eq("board_id", board_id).execute()
+        result = await supabase.table("nodes").select("*").eq("id", id).eq("board_id", board_id).execute()
         if not result.data:
             raise HTTPException(status_code=404, detail="Node not found")
         return result.data[0]
@@ -78,108 +388,48 @@ async def get_node(
 async def update_node(
     board_id: str = Path(..., description="Board ID"),
     id: str = Path(..., description="Node ID"),
-    node_data: NodeUpdate = None
+    node_data: NodeUpdate = None,
+    stream: bool = Query(False, description="Stream the LLM response to the room as it is generated"),
+    job: bool = Query(False, description="Generate in a background job: returns 202 with a job id")
 ):
     """Update a node"""
     try:
-        check = supabase.table("nodes").select("*").eq("id", id).eq("board_id", board_id).execute()
-        if not check.data:
+        existing = await graph_index.get_node(board_id, id)
+        if not existing:
             raise HTTPException(status_code=404, detail="Node not found in this board")
         
         # Handle LLM calls if prompt provided
         if node_data and hasattr(node_data, 'prompt') and node_data.prompt:
-            from services.llm_service import llm_service
-            from schema.schemas import LLMServiceRequest
-            
-            # **NEW: Build context from parent nodes before LLM call**
-            context = update_node_context(id, board_id)
-            print(f"Built context for node {id}: {context[:100] if context else 'None'}...")  # Debug log
-            
-            llm_request = LLMServiceRequest(
-                node_id=id,
-                prompt=node_data.prompt,
-            )
-            
-            llm_response = await llm_service.generate_content(llm_request)
-            if not llm_response.success:
-                raise HTTPException(status_code=500, detail=f"LLM call failed: {llm_response.error}")
-            
-            update_data = {
-                "prompt": node_data.prompt,
-                "response": llm_response.generated_content,
-                "role": "assistant",
-                "is_responded": True  # NEW: Mark node as responded to
-            }
-            result = supabase.table("nodes").update(update_data).eq("id", id).execute()
-            if not result.data:
-                raise HTTPException(status_code=500, detail="Failed to update node")
-            
-            # Build messages array for WebSocket broadcast
-            messages = []
-            if node_data.prompt:
-                messages.append({"role": "user", "content": node_data.prompt})
-            if llm_response.generated_content:
-                messages.append({"role": "assistant", "content": llm_response.generated_content})
-            
-            # Broadcast update to all clients via WebSocket
-            try:
-                await manager.broadcast_to_room(
-                    board_id,
-                    {
-                        "type": "node_updated",
-                        "node_id": id,
-                        "updates": {
-                            "messages": messages,
-                            "isResponded": True
-                        }
-                    }
+            # A new prompt supersedes whatever the node is still generating (or has queued);
+            # repeating the running prompt joins it instead
+            generations.cancel(board_id, id, "superseded", keep=prompt_key(node_data.prompt))
+            if job:
+                # Answer now; generation runs on the job workers and is announced to the room
+                since = generations.epoch(board_id, id)
+                submitted = submit_job(
+                    board_id, "node_prompt",
+                    lambda: prompt_node(board_id, id, node_data.prompt, stream, since, LLMPriority.BACKGROUND),
+                    node_id=id
                 )
-            except Exception as e:
-                print(f"Error broadcasting node update: {e}")
-                # Don't fail the request if broadcast fails
-            
-            return result.data[0]
+                return JSONResponse(status_code=202, content={"job_id": submitted["id"], "status": submitted["status"]})
+            return await prompt_node(board_id, id, node_data.prompt, stream)
         
         # Regular update
         if not node_data:
-            return check.data[0]
+            return existing
             
-        update_data = {}
-        if node_data.x is not None:
-            update_data["x"] = node_data.x
-        if node_data.y is not None:
-            update_data["y"] = node_data.y
-        if node_data.width is not None:
-            update_data["width"] = node_data.width
-        if node_data.height is not None:
-            update_data["height"] = node_data.height
-        if node_data.title is not None:
-            update_data["title"] = node_data.title
-        if node_data.prompt is not None:
-            update_data["prompt"] = node_data.prompt
-        if node_data.response is not None:
-            update_data["response"] = node_data.response
-        if node_data.context is not None:  # NEW
-            update_data["context"] = node_data.context
-        if node_data.role is not None:
-            update_data["role"] = node_data.role
-        if node_data.is_root is not None:
-            update_data["is_root"] = node_data.is_root
-        if node_data.is_collapsed is not None:
-            update_data["is_collapsed"] = node_data.is_collapsed
-        if node_data.is_starred is not None:
-            update_data["is_starred"] = node_data.is_starred
-        if node_data.model is not None:
-            update_data["model"] = node_data.model
-
+        update_data = node_update_fields(node_data)
         
         if not update_data:
-            return check.data[0]
+            return existing
         
-        result = supabase.table("nodes").update(update_data).eq("id", id).execute()
+        result = await supabase.table("nodes").update(update_data).eq("id", id).execute()
         if not result.data:
             raise HTTPException(status_code=500, detail="Failed to update node")
+        graph_index.upsert_node(board_id, result.data[0])
         return result.data[0]
+    except GenerationCancelled as e:
+        raise HTTPException(status_code=409, detail=f"Generation cancelled: {e}")
     except HTTPException:
         raise
     except Exception as e:
@@ -194,7 +444,7 @@ async def update_node_position(
 ):
     """Update a node position"""
     try:
-        check = supabase.table("nodes").select("id").eq("id", id).eq("board_id", board_id).execute()
+        check = await supabase.table("nodes").select("id").eq("id", id).eq("board_id", board_id).execute()
         if not check.data:
             raise HTTPException(status_code=404, detail="Node not found in this board")
         
@@ -202,9 +452,12 @@ async def update_node_position(
             "x": position.x,
             "y": position.y,
         }
-        result = supabase.table("nodes").update(update_data).eq("id", id).execute()
+        # This write supersedes any buffered drag position for the node
+        position_buffer.discard(board_id, id)
+        result = await supabase.table("nodes").update(update_data).eq("id", id).execute()
         if not result.data:
             raise HTTPException(status_code=500, detail="Failed to update node position")
+        graph_index.upsert_node(board_id, result.data[0])
         return result.data[0]
     except HTTPException:
         raise
@@ -219,87 +472,36 @@ async def delete_node(
 ):
     """Delete a node"""
     try:
-        check = supabase.table("nodes").select("id").eq("id", id).eq("board_id", board_id).execute()
+        check = await supabase.table("nodes").select("id").eq("id", id).eq("board_id", board_id).execute()
         if not check.data:
             raise HTTPException(status_code=404, detail="Node not found in this board")
         
-        supabase.table("nodes").delete().eq("id", id).execute()
+        # Don't let a running generation finish and write into the deleted node
+        generations.cancel(board_id, id, "node deleted")
+        await supabase.table("nodes").delete().eq("id", id).execute()
+        graph_index.remove_node(board_id, id)
         return {"message": "Node deleted successfully", "id": id}
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-# Bulk update multiple nodes
-@router.patch("/{board_id}/nodes/bulk", response_model=dict)
-async def bulk_update_nodes(
+# Cancel a node's generation
+@router.post("/{board_id}/nodes/{id}/cancel", response_model=dict)
+async def cancel_node_generation(
     board_id: str = Path(..., description="Board ID"),
-    bulk_data: List[NodeBase] = None
+    id: str = Path(..., description="Node ID")
 ):
-    """Bulk update multiple nodes in this board"""
-    updated_nodes = []
-    not_found_ids = []
-    errors = []
-
-    if not bulk_data: #error handling
-        return {
-            "updated_count": 0,
-            "updated_nodes": [],
-            "not_found_ids": [],
-            "errors": []
-        }
-    
-    for node_update in bulk_data:
-        try:
-            check = supabase.table("nodes").select("id").eq("id", node_update.id).eq("board_id", board_id).execute()
-            if not check.data:
-                not_found_ids.append(node_update.id)
-                continue
-            
-            update_data = {}
-            if node_update.x is not None:
-                update_data["x"] = node_update.x
-            if node_update.y is not None:
-                update_data["y"] = node_update.y
-            if node_update.width is not None:
-                update_data["width"] = node_update.width
-            if node_update.height is not None:
-                update_data["height"] = node_update.height
-            if node_update.title is not None:
-                update_data["title"] = node_update.title
-            if node_update.prompt is not None:
-                update_data["prompt"] = node_update.prompt
-            if node_update.response is not None:
-                update_data["response"] = node_update.response            
-            if node_update.context is not None:  # NEW
-                update_data["context"] = node_update.context
-            if node_update.role is not None:
-                update_data["role"] = node_update.role
-            if node_update.is_root is not None:
-                update_data["is_root"] = node_update.is_root
-            if node_update.is_collapsed is not None:
-                update_data["is_collapsed"] = node_update.is_collapsed
-            if node_update.is_starred is not None:
-                update_data["is_starred"] = node_update.is_starred
-            if node_update.model is not None:
-                update_data["model"] = node_update.model
-            
-            if update_data:
-                result = supabase.table("nodes").update(update_data).eq("id", node_update.id).execute()
-                if result.data:
-                    updated_nodes.append(result.data[0])
-                else:
-                    errors.append(node_update.id)
-            else:
-                existing = supabase.table("nodes").select("*").eq("id", node_update.id).execute()
-                if existing.data:
-                    updated_nodes.append(existing.data[0])
-        except Exception as e:
-            errors.append(f"{node_update.id}: {str(e)}")
+    """
+    Cancel the node's running generation and any queued job for it.
     
-    return {
-        "updated_count": len(updated_nodes),
-        "updated_nodes": updated_nodes,
-        "not_found_ids": not_found_ids,
-        "errors": errors
-    }
\ No newline at end of file
+    `cancelled` counts generations stopped on this worker; the cancel is
+    relayed to the other workers as well.
+    """
+    try:
+        cancelled = generations.cancel(board_id, id)
+        return {"node_id": id, "cancelled": cancelled}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,114 @@
+from fastapi import APIRouter, HTTPException, Path, Query
+from fastapi.responses import JSONResponse
+from typing import Dict, List
+import asyncio
+import os
+from schema.schemas import PromptBatchRequest, PromptBatchItem, LLMPriority
+from services.websocket_manager import manager
+from services.graph_index import graph_index
+from services.generations import generations, GenerationCancelled, prompt_key
+from routes.board_nodes import prompt_node, submit_job
+
+router = APIRouter()
+
+# Nodes of one batch prompted at the same time (Gemini calls are still capped by LLM_MAX_CONCURRENCY)
+PROMPT_BATCH_CONCURRENCY: int = int(os.environ.get("PROMPT_BATCH_CONCURRENCY", "32"))
+# Most prompts accepted in one batch
+PROMPT_BATCH_MAX_ITEMS: int = int(os.environ.get("PROMPT_BATCH_MAX_ITEMS", "100"))
+
+
+async def run_prompt_batch(board_id: str, job_id: str, items: List[PromptBatchItem],
+                           epochs: Dict[str, tuple], stream: bool) -> List[dict]:
+    """
+    Prompt every node of a batch concurrently (up to PROMPT_BATCH_CONCURRENCY at once).
+
+    Each node goes through prompt_node - context, generation, write and
+    `node_updated` - and its outcome is sent to the room as a
+    `prompt_batch_item` message as soon as it finishes. Returns the outcomes
+    in completion order. Batch calls run at BACKGROUND priority, so they
+    queue behind interactive prompts rather than starve them.
+    """
+    semaphore = asyncio.Semaphore(PROMPT_BATCH_CONCURRENCY)
+    results = []
+
+    async def run_item(item: PromptBatchItem):
+        async with semaphore:
+            try:
+                await prompt_node(board_id, item.node_id, item.prompt, stream, epochs[item.node_id], LLMPriority.BACKGROUND)
+                outcome = {"node_id": item.node_id, "status": "succeeded", "error": None}
+            except GenerationCancelled as e:
+                outcome = {"node_id": item.node_id, "status": "cancelled", "error": str(e)}
+            except Exception as e:
+                outcome = {"node_id": item.node_id, "status": "failed", "error": str(getattr(e, "detail", None) or e)}
+        results.append(outcome)
+
+        try:
+            await manager.broadcast_to_room(
+                board_id,
+                {
+                    "type": "prompt_batch_item",
+                    "job_id": job_id,
+                    **outcome,
+                    "completed": len(results),
+                    "total": len(items)
+                }
+            )
+        except Exception as e:
+            print(f"Error broadcasting batch item: {e}")
+
+    await asyncio.gather(*(run_item(item) for item in items))
+    return results
+
+
+# Prompt many nodes at once
+@router.post("/{board_id}/prompts/batch", status_code=202)
+async def prompt_batch(
+    board_id: str = Path(..., description="Board ID"),
+    batch: PromptBatchRequest = None,
+    stream: bool = Query(False, description="Stream each node's LLM response to the room as it is generated")
+):
+    """
+    Ask a question of many nodes in one request.
+
+    Answers 202 with a job id right away. The nodes are prompted concurrently
+    in a background job; each result arrives as a `prompt_batch_item`
+    WebSocket message (plus the usual `node_updated`), and `job_completed`
+    follows once every node is done. GET /jobs/{job_id} returns the per-node
+    outcomes.
+    """
+    try:
+        items = batch.prompts if batch else []
+        if not items:
+            raise HTTPException(status_code=400, detail="No prompts given")
+        if len(items) > PROMPT_BATCH_MAX_ITEMS:
+            raise HTTPException(status_code=400, detail=f"At most {PROMPT_BATCH_MAX_ITEMS} prompts per batch")
+        node_ids = [item.node_id for item in items]
+        if len(set(node_ids)) != len(node_ids):
+            raise HTTPException(status_code=400, detail="Each node may appear only once per batch")
+        if not all(item.prompt for item in items):
+            raise HTTPException(status_code=400, detail="Every prompt must be non-empty")
+
+        missing = [node_id for node_id in node_ids if not await graph_index.get_node(board_id, node_id)]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Nodes not found in this board: {', '.join(missing)}")
+
+        # The batch supersedes whatever these nodes are still generating
+        epochs = {}
+        for item in items:
+            generations.cancel(board_id, item.node_id, "superseded", keep=prompt_key(item.prompt))
+            epochs[item.node_id] = generations.epoch(board_id, item.node_id)
+
+        # Workers pick the job up only after this handler yields, by which time `submitted` is set
+        submitted = submit_job(
+            board_id, "prompt_batch",
+            lambda: run_prompt_batch(board_id, submitted["id"], items, epochs, stream)
+        )
+        return JSONResponse(status_code=202, content={
+            "job_id": submitted["id"],
+            "status": submitted["status"],
+            "node_ids": node_ids
+        })
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
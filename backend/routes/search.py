@@ -0,0 +1,22 @@
+from fastapi import APIRouter, HTTPException, Query
+from services.typeahead import typeahead
+
+router = APIRouter()
+
+
+# Typeahead over board names and node titles across all boards
+@router.get("/typeahead", response_model=dict)
+async def search_typeahead(
+    prefix: str = Query(..., min_length=1, description="What the user has typed so far"),
+    limit: int = Query(10, ge=1, le=50, description="Maximum number of matches")
+):
+    """
+    Boards and nodes whose name/title has a word starting with `prefix`.
+    
+    Answered from the in-memory typeahead index; each match carries its
+    board id (and board name) so the client can navigate straight to it.
+    """
+    try:
+        return {"prefix": prefix, "results": await typeahead.lookup(prefix, limit)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,7 +1,10 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from services.websocket_manager import manager
-from database import supabase
-import json
+from services.graph_index import graph_index
+from services.position_buffer import position_buffer
+from services.presence import presence
+from services.generations import generations
+from services.ws_protocol import negotiate, decode_frame, ProtocolError
 
 router = APIRouter()
 
@@ -18,27 +21,23 @@ async def websocket_endpoint(websocket: WebSocket, board_id: str):
     3. Client can send messages (node moved, edge created, etc.)
     4. Server broadcasts to all other users in the room
     5. When client disconnects, server removes from room
-    """
-    # VALIDATION WE DON'T NEED FOR NOW
-    # await websocket.accept()
-    # # Verify board exists
-    # try:
-    #     board_check = supabase.table("boards").select("id").eq("id", board_id).execute()
-    #     if not board_check.data:
-    #         await websocket.close(code=1008, reason="Board not found")
-    #         return
-    # except Exception as e:
-    #     await websocket.close(code=1011, reason="Database error")
-    #     return
     
-    # Connect the user to the board's room
-    await manager.connect(websocket, board_id)
+    Frames are JSON text by default; clients offering the `weaver.bin.v2`
+    subprotocol get compact binary frames (see services/ws_protocol.py).
+    """
+    # Connect the user to the board's room, agreeing on the wire encoding
+    subprotocol = negotiate(websocket.scope.get("subprotocols", []))
+    await manager.connect(websocket, board_id, subprotocol=subprotocol)
     
     try:
         # Keep connection alive and listen for messages
         while True:
             try:
-                data = await websocket.receive_text()
+                frame = await websocket.receive()
+                if frame["type"] == "websocket.disconnect":
+                    # Normal disconnect - break out of loop
+                    break
+                data = frame["bytes"] if frame.get("bytes") is not None else frame.get("text")
             except WebSocketDisconnect:
                 # Normal disconnect - break out of loop
                 break
@@ -48,7 +47,7 @@ async def websocket_endpoint(websocket: WebSocket, board_id: str):
                 break
             
             try:
-                message = json.loads(data)
+                message = decode_frame(data)
                 message_type = message.get("type")
                 
                 # Handle explicit disconnect message
@@ -77,6 +76,9 @@ async def websocket_endpoint(websocket: WebSocket, board_id: str):
                 elif message_type == "cursor_moved":
                     await handle_cursor_moved(board_id, message, websocket)
                 
+                elif message_type == "cancel_generation":
+                    handle_cancel_generation(board_id, message)
+                
                 else:
                     # Unknown message type
                     await manager.send_personal_message({
@@ -84,10 +86,10 @@ async def websocket_endpoint(websocket: WebSocket, board_id: str):
                         "message": f"Unknown message type: {message_type}"
                     }, websocket)
             
-            except json.JSONDecodeError:
+            except ProtocolError as e:
                 await manager.send_personal_message({
                     "type": "error",
-                    "message": "Invalid JSON"
+                    "message": str(e)
                 }, websocket)
             
             except Exception as e:
@@ -107,23 +109,12 @@ async def websocket_endpoint(websocket: WebSocket, board_id: str):
         # Always clean up on disconnect (whether normal or error)
         user_id = manager.disconnect(websocket)
         
-        # If we have a user_id for this connection, broadcast cursor removal
+        # Persist this board's buffered drag positions right away
+        await position_buffer.flush(board_id)
+        
+        # If we have a user_id for this connection, remove their cursor on the next tick
         if user_id:
-            try:
-                await manager.broadcast_to_room(
-                    board_id,
-                    {
-                        "type": "cursor_moved",
-                        "cursor_data": {
-                            "user_id": user_id,
-                            "x": None,
-                            "y": None,
-                            "timestamp": None
-                        }
-                    }
-                )
-            except Exception as e:
-                print(f"Error broadcasting cursor removal: {e}")
+            presence.remove(board_id, user_id)
         
         # Notify others that someone left
         try:
@@ -152,14 +143,10 @@ async def handle_node_moved(board_id: str, message: dict, sender_websocket: WebS
     if not node_id or x is None or y is None:
         return
     
-    # Update in database
-    try:
-        supabase.table("nodes").update({
-            "x": x,
-            "y": y
-        }).eq("id", node_id).eq("board_id", board_id).execute()
-    except Exception as e:
-        print(f"Error updating node position: {e}")
+    # Keep only the latest position; the buffer writes it to the database in batches
+    # (and records it as a board change once written)
+    position_buffer.record(board_id, node_id, x, y)
+    graph_index.move_node(board_id, node_id, x, y)
     
     # Broadcast to all other users in the room
     await manager.broadcast_to_room(
@@ -279,12 +266,15 @@ async def handle_cursor_moved(board_id: str, message: dict, sender_websocket: We
     if user_id:
         manager.set_user_id(sender_websocket, user_id)
     
-    # Broadcast to all other users (so they can see this user's cursor)
-    await manager.broadcast_to_room(
-        board_id,
-        {
-            "type": "cursor_moved",
-            "cursor_data": cursor_data
-        },
-        exclude=sender_websocket
-    )
\ No newline at end of file
+    # Sent to the room in the next batched cursors_snapshot frame
+    presence.update(board_id, cursor_data)
+
+def handle_cancel_generation(board_id: str, message: dict):
+    """Handle when a user stops a node's generation (same as POST .../nodes/{id}/cancel)."""
+    node_id = message.get("node_id")
+    
+    if not node_id:
+        return
+    
+    # The room hears about it as generation_cancelled once the generation stops
+    generations.cancel(board_id, node_id)
@@ -19,11 +19,16 @@ class EdgeType(str, Enum):
     REF = "ref"
 
 
+class LLMPriority(str, Enum):
+    INTERACTIVE = "interactive"
+    BACKGROUND = "background"
+
+
 # ---------------------------- React Flow Core Schemas ----------------------------------#
 
 class Position(BaseModel):
     # React Flow position object
-    id: str
+    id: Optional[str] = None
     x: float
     y: float
 
@@ -157,6 +162,11 @@ class NodePosition(BaseModel):
     x: float
     y: float
 
+class NodeBodiesRequest(BaseModel):
+    """Schema for lazily fetching node bodies (prompt/response) by id"""
+    node_ids: List[str]
+    include_context: bool = False
+
 # ---------------------------- Database Edge Schemas (for Supabase storage) ----------------------------------#
 
 class EdgeBase(BaseModel):
@@ -269,6 +279,19 @@ class BranchCreateResponse(BaseModel):
     edge: ReactFlowEdge
 
 
+# ---------------------------- Prompt Batch API Schemas ----------------------------------#
+class PromptBatchItem(BaseModel):
+    """One node to prompt in a batch"""
+    node_id: str  # React Flow node ID
+    prompt: str
+
+
+class PromptBatchRequest(BaseModel):
+    # POST /api/boards/:boardId/prompts/batch
+    
+    prompts: List[PromptBatchItem]
+
+
 # ---------------------------- Merge API Schema ----------------------------------#
 class MergeNodesRequest(BaseModel):
     # POST /api/boards/:boardId/nodes/merge
@@ -342,7 +365,9 @@ class LLMServiceRequest(BaseModel):
     """Request to generate content using LLM with node context"""
     node_id: str  # React Flow node ID (string)
     prompt: str
+    board_id: Optional[str] = None  # Lets the service read the node from the graph index
     operation_type: Optional[str] = None  # e.g., "enhance", "expand", "summarize"
+    priority: LLMPriority = LLMPriority.INTERACTIVE  # Scheduling priority of the Gemini call
 
 
 class LLMServiceResponse(BaseModel):
@@ -351,5 +376,15 @@ class LLMServiceResponse(BaseModel):
     node_id: str
     generated_content: Optional[str] = None
     error: Optional[str] = None
+    status_code: Optional[int] = None  # Upstream status when the failure is retryable later (429 rate limited, 503 overloaded)
     metadata: Optional[Dict[str, Any]] = None
-    timestamp: datetime
\ No newline at end of file
+    timestamp: datetime
+
+
+# ---------------------------- Context Service Schemas ----------------------------------#
+class AncestorContext(BaseModel):
+    """Context assembled from every ancestor of a node (each ancestor appears once)"""
+    node_id: str
+    context: Optional[str] = None
+    ancestor_ids: List[str] = Field(default_factory=list)  # Topological order, roots first
+    char_count: int = 0
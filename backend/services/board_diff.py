@@ -0,0 +1,151 @@
+"""
+Diff a React Flow board (as sent by the frontend) against the stored board.
+
+Used by POST /api/boards/{id}/save so only nodes and edges that were added,
+changed or removed are written.
+"""
+from typing import Dict, List, Optional
+from schema.schemas import ReactFlowNode, ReactFlowEdge, EdgeType
+
+# Every column of the `nodes` table but `context` - written rows always carry all of them.
+# The context is assembled by the server (see context_service.py) and isn't in the
+# graph index, so a save only sets it on new nodes and never overwrites it
+NODE_COLUMNS = (
+    "id", "board_id", "x", "y", "width", "height", "title", "prompt", "response",
+    "role", "is_root", "is_collapsed", "is_starred", "is_responded",
+    "color", "icon", "model", "metadata",
+)
+
+# Column values for a node that isn't stored yet
+NODE_DEFAULTS = {
+    "role": "user",
+    "is_root": False,
+    "is_collapsed": False,
+    "is_starred": False,
+    "is_responded": False,
+    "metadata": {},
+}
+
+# node.data key(s) → column (snake_case as stored, camelCase as the frontend uses)
+NODE_DATA_FIELDS = {
+    "title": ("title", "label"),
+    "prompt": ("prompt",),
+    "response": ("response",),
+    "context": ("context",),
+    "role": ("role",),
+    "is_root": ("is_root", "isRoot"),
+    "is_collapsed": ("is_collapsed", "isCollapsed"),
+    "is_starred": ("is_starred", "isStarred"),
+    "is_responded": ("is_responded", "isResponded"),
+    "color": ("color",),
+    "icon": ("icon",),
+    "model": ("model",),
+    "metadata": ("metadata",),
+}
+
+EDGE_TYPES = {edge_type.value for edge_type in EdgeType}
+
+
+def node_fields(node: ReactFlowNode) -> dict:
+    """Columns carried by a React Flow node (keys the client didn't send are left out)."""
+    fields = {"x": node.position.x, "y": node.position.y}
+    if node.width is not None:
+        fields["width"] = node.width
+    if node.height is not None:
+        fields["height"] = node.height
+
+    data = node.data or {}
+    for column, keys in NODE_DATA_FIELDS.items():
+        for key in keys:
+            if key in data:
+                fields[column] = data[key]
+                break
+
+    # The chat UI keeps prompt/response as a messages list
+    for message in data.get("messages") or []:
+        if message.get("role") == "user":
+            fields.setdefault("prompt", message.get("content"))
+        elif message.get("role") == "assistant":
+            fields.setdefault("response", message.get("content"))
+
+    return fields
+
+
+def edge_row(edge: ReactFlowEdge, board_id: str) -> dict:
+    """Full `edges` row for a React Flow edge."""
+    data = edge.data or {}
+    edge_type = data.get("edge_type") or edge.type
+    return {
+        "id": edge.id,
+        "board_id": board_id,
+        "source_node_id": edge.source,
+        "target_node_id": edge.target,
+        "edge_type": edge_type if edge_type in EDGE_TYPES else "default",
+        "label": data.get("label"),
+    }
+
+
+def _merge_node(stored: Optional[dict], fields: dict, node_id: str, board_id: str) -> dict:
+    base = stored or NODE_DEFAULTS
+    row = {column: base.get(column) for column in NODE_COLUMNS}
+    row.update(fields)
+    row["id"] = node_id
+    row["board_id"] = board_id
+    return row
+
+
+def diff_board(board_id: str, stored_nodes: Dict[str, dict], stored_edges: Dict[str, dict],
+               nodes: List[ReactFlowNode], edges: List[ReactFlowEdge]) -> dict:
+    """
+    Work out what has to be written for the submitted board.
+
+    Ids not stored in this board are inserts; they must not be upserted, as
+    an id that belongs to another board would take that row over.
+
+    Returns:
+        {
+            "node_inserts": [full rows of nodes not stored in this board],
+            "node_updates": [full rows of stored nodes that changed],
+            "node_deletes": [ids of stored nodes missing from the submission],
+            "edge_inserts": [full rows of edges not stored in this board],
+            "edge_updates": [full rows of stored edges that changed],
+            "edge_deletes": [ids of stored edges missing from the submission],
+        }
+    """
+    node_inserts = []
+    node_updates = []
+    submitted_node_ids = set()
+    for node in nodes:
+        submitted_node_ids.add(node.id)
+        stored = stored_nodes.get(node.id)
+        fields = node_fields(node)
+        if stored is None:
+            row = _merge_node(None, fields, node.id, board_id)
+            # Same keys on every insert, so a bulk insert doesn't null out anything
+            row.setdefault("context", None)
+            node_inserts.append(row)
+            continue
+        fields.pop("context", None)
+        if any(stored.get(column) != value for column, value in fields.items()):
+            node_updates.append(_merge_node(stored, fields, node.id, board_id))
+
+    edge_inserts = []
+    edge_updates = []
+    submitted_edge_ids = set()
+    for edge in edges:
+        submitted_edge_ids.add(edge.id)
+        row = edge_row(edge, board_id)
+        stored = stored_edges.get(edge.id)
+        if stored is None:
+            edge_inserts.append(row)
+        elif any(stored.get(column) != value for column, value in row.items()):
+            edge_updates.append(row)
+
+    return {
+        "node_inserts": node_inserts,
+        "node_updates": node_updates,
+        "node_deletes": [node_id for node_id in stored_nodes if node_id not in submitted_node_ids],
+        "edge_inserts": edge_inserts,
+        "edge_updates": edge_updates,
+        "edge_deletes": [edge_id for edge_id in stored_edges if edge_id not in submitted_edge_ids],
+    }
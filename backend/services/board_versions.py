@@ -0,0 +1,161 @@
+"""
+Per-board versions and change log, for delta sync.
+
+Every node/edge mutation bumps the board's version and records which row
+changed (or was deleted) at that version. A client that remembers the
+version it last saw can then ask GET /boards/{id}/changes?since=<version>
+for just the rows that changed after it, instead of refetching the board.
+
+Versions are tokens of the form "<epoch>.<n>": `n` comes from one counter
+shared by all boards (so it never repeats, even for a board whose log was
+dropped) and `epoch` identifies this worker process, so a token issued
+before a restart (or by another worker) is recognised as unknown and the
+client is told to do a full reload. Changes made on other workers are
+relayed through the broker so every worker's log sees every row change.
+
+Logs are kept for a bounded number of boards, and dropped along with the
+board in the graph index; a board without a log can only be diffed from
+tokens issued after the last log was dropped.
+"""
+from typing import Dict, Optional
+from collections import OrderedDict
+from services.broker import broker
+import os
+import uuid
+
+# Change-log entries kept per board; clients further behind than this do a full reload
+BOARD_CHANGELOG_MAX_ENTRIES: int = int(os.environ.get("BOARD_CHANGELOG_MAX_ENTRIES", "10000"))
+# Boards with a change log; the least recently changed one is dropped beyond this
+BOARD_CHANGELOG_MAX_BOARDS: int = int(os.environ.get("BOARD_CHANGELOG_MAX_BOARDS", "256"))
+
+
+class BoardChangeLog:
+    """Version counter plus the latest change per node/edge id for one board."""
+
+    def __init__(self, horizon: int):
+        self.version = horizon
+        # Oldest version the log can still diff from
+        self.horizon = horizon
+        # (kind, id) → (version, deleted), oldest change first
+        self.entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+    def record(self, kind: str, row_id: str, deleted: bool, version: int, max_entries: int):
+        self.version = version
+        key = (kind, row_id)
+        self.entries.pop(key, None)
+        self.entries[key] = (version, deleted)
+        while len(self.entries) > max_entries:
+            _, (version, _) = self.entries.popitem(last=False)
+            self.horizon = version
+
+
+class BoardVersions:
+    """Tracks BoardChangeLogs for every board touched since startup."""
+
+    def __init__(self, max_entries: int = BOARD_CHANGELOG_MAX_ENTRIES, max_boards: int = BOARD_CHANGELOG_MAX_BOARDS):
+        self.max_entries = max_entries
+        self.max_boards = max_boards
+        self.epoch = uuid.uuid4().hex[:8]
+        # Last version handed out, across all boards
+        self.version = 0
+        # Version at which a log was last dropped: boards without a log may have changed up to here
+        self.forgotten = 0
+        # Least recently changed first
+        self._logs: "OrderedDict[str, BoardChangeLog]" = OrderedDict()
+
+        broker.subscribe("board_change", self._on_remote_change)
+
+    def _log(self, board_id: str) -> BoardChangeLog:
+        log = self._logs.get(board_id)
+        if log is None:
+            log = self._logs[board_id] = BoardChangeLog(self.forgotten)
+            while len(self._logs) > self.max_boards:
+                self.forget(next(iter(self._logs)))
+        else:
+            self._logs.move_to_end(board_id)
+        return log
+
+    def forget(self, board_id: str):
+        """Drop a board's log (tokens issued for it before now will need a full reload)."""
+        if self._logs.pop(board_id, None) is not None:
+            self.forgotten = self.version
+
+    def token(self, board_id: str) -> str:
+        """Current version token for a board."""
+        log = self._logs.get(board_id)
+        return f"{self.epoch}.{log.version if log else self.version}"
+
+    # ---------------------------- Recording ----------------------------
+
+    def record(self, board_id: str, kind: str, row_id: str, deleted: bool = False, notify: bool = True):
+        """
+        Bump the board's version for a change.
+
+        kind is "node" or "edge" (with the row id), or "board" (with the
+        board id) for changes to the board row itself.
+        """
+        log = self._log(board_id)
+        self.version += 1
+        log.record(kind, row_id, deleted, self.version, self.max_entries)
+        if notify:
+            broker.publish("board_change", {"board_id": board_id, "kind": kind, "id": row_id, "deleted": deleted})
+
+    def reset(self, board_id: str, notify: bool = True):
+        """Forget the board's history (board deleted or reset) - older tokens need a full reload."""
+        log = self._log(board_id)
+        self.version += 1
+        log.version = log.horizon = self.version
+        log.entries.clear()
+        if notify:
+            broker.publish("board_change", {"board_id": board_id, "kind": "reset"})
+
+    def _on_remote_change(self, payload: dict):
+        if payload["kind"] == "reset":
+            self.reset(payload["board_id"], notify=False)
+        else:
+            self.record(payload["board_id"], payload["kind"], payload["id"], payload.get("deleted", False), notify=False)
+
+    # ---------------------------- Reading ----------------------------
+
+    def parse_token(self, board_id: str, token: str) -> Optional[int]:
+        """Version number in a token, or None if the log can't diff from it."""
+        epoch, _, version = token.partition(".")
+        if epoch != self.epoch or not version.isdigit():
+            return None
+        log = self._logs.get(board_id)
+        since = int(version)
+        horizon = log.horizon if log else self.forgotten
+        if since > self.version or since < horizon:
+            return None
+        return since
+
+    def changes_since(self, board_id: str, since: int) -> dict:
+        """
+        What changed after version `since`:
+            {"board_changed", "node_ids", "edge_ids", "deleted_node_ids", "deleted_edge_ids"}
+        """
+        changes = {
+            "board_changed": False,
+            "node_ids": [],
+            "edge_ids": [],
+            "deleted_node_ids": [],
+            "deleted_edge_ids": [],
+        }
+        log = self._logs.get(board_id)
+        if log is None:
+            return changes
+
+        # Entries are ordered by version, so walk back until we pass `since`
+        for (kind, row_id), (version, deleted) in reversed(log.entries.items()):
+            if version <= since:
+                break
+            if kind == "board":
+                changes["board_changed"] = True
+                continue
+            key = f"deleted_{kind}_ids" if deleted else f"{kind}_ids"
+            changes[key].append(row_id)
+        return changes
+
+
+# Create singleton instance
+board_versions = BoardVersions()
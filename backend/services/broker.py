@@ -0,0 +1,274 @@
+"""
+Pub/sub broker that relays board events between server workers.
+
+With a single uvicorn worker every room lives in one ConnectionManager and
+the in-process broker (the default) does nothing. With several workers, the
+Unix-socket broker relays room messages, room counts and cache
+invalidations so users on the same board see each other regardless of which
+worker they're connected to.
+
+Select with WS_BROKER=memory|unix (socket path: WS_BROKER_PATH).
+
+Unix-socket broker: the first worker to take an exclusive lock on
+`<path>.lock` binds the socket and acts as hub; every worker (the hub
+included) connects to it as a client. Frames are newline-delimited JSON
+envelopes: {"kind": ..., "worker": ..., "payload": {...}}. The hub forwards
+each frame to every other client through a bounded per-client queue; a
+client that falls too far behind is disconnected (like a slow WebSocket
+client) and reconnects, and the others are told it went away. If the hub dies, the remaining
+workers re-elect one and reconnect.
+"""
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Optional
+import asyncio
+import fcntl
+import json
+import os
+import uuid
+
+WS_BROKER: str = os.environ.get("WS_BROKER", "memory")
+WS_BROKER_PATH: str = os.environ.get("WS_BROKER_PATH", "/tmp/weaver-broker.sock")
+# Frames buffered for the hub while it is slow or being re-elected
+WS_BROKER_QUEUE_SIZE: int = int(os.environ.get("WS_BROKER_QUEUE_SIZE", "10000"))
+# Largest frame relayed (bytes); bigger events are dropped rather than breaking the link
+WS_BROKER_MAX_FRAME_BYTES: int = int(os.environ.get("WS_BROKER_MAX_FRAME_BYTES", str(16 * 1024 * 1024)))
+# Bytes the hub buffers for one worker that isn't reading; beyond that (or
+# WS_BROKER_QUEUE_SIZE frames) the worker is disconnected and has to resync
+WS_BROKER_PEER_BUFFER_BYTES: int = int(os.environ.get("WS_BROKER_PEER_BUFFER_BYTES", str(64 * 1024 * 1024)))
+
+# Local-only event fired after (re)connecting to the hub
+CONNECTED = "broker_connected"
+# Fired by the hub when a worker's connection goes away
+WORKER_GONE = "worker_gone"
+
+
+class Broker(ABC):
+    """
+    Interface shared by all brokers.
+
+    Producers call `publish(kind, payload)`; the payload is delivered to the
+    handler subscribed for `kind` on every *other* worker.
+    """
+
+    def __init__(self):
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._handlers: Dict[str, Callable[[dict], None]] = {}
+
+    def subscribe(self, kind: str, handler: Callable[[dict], None]):
+        self._handlers[kind] = handler
+
+    @abstractmethod
+    def publish(self, kind: str, payload: dict):
+        """Send an event to the other workers (fire and forget)."""
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def _dispatch(self, kind: str, payload: dict):
+        handler = self._handlers.get(kind)
+        if handler is None:
+            return
+        try:
+            handler(payload)
+        except Exception as e:
+            print(f"Error handling broker event {kind}: {e}")
+
+
+class InProcessBroker(Broker):
+    """Single-worker broker - there is nobody else to tell."""
+
+    def publish(self, kind: str, payload: dict):
+        pass
+
+
+class HubPeer:
+    """A worker connected to the hub: frames waiting to be written to it, and their size."""
+
+    def __init__(self, writer: asyncio.StreamWriter, queue_size: int):
+        self.writer = writer
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.queued_bytes = 0
+
+
+class UnixSocketBroker(Broker):
+    """Relays events between workers on one host through a Unix-socket hub."""
+
+    def __init__(self, path: str = WS_BROKER_PATH, queue_size: int = WS_BROKER_QUEUE_SIZE,
+                 max_frame_bytes: int = WS_BROKER_MAX_FRAME_BYTES,
+                 peer_buffer_bytes: int = WS_BROKER_PEER_BUFFER_BYTES):
+        super().__init__()
+        self.path = path
+        self.queue_size = queue_size
+        self.max_frame_bytes = max_frame_bytes
+        self.peer_buffer_bytes = peer_buffer_bytes
+        self._outgoing: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._client_task: Optional[asyncio.Task] = None
+        # Hub state (only on the elected worker)
+        self._lock_fd: Optional[int] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._peers: Dict[asyncio.StreamWriter, HubPeer] = {}
+        self.dropped = 0
+        self.oversized = 0
+        self.slow_peers = 0
+
+    def publish(self, kind: str, payload: dict):
+        line = json.dumps({"kind": kind, "worker": self.worker_id, "payload": payload}, separators=(",", ":")).encode() + b"\n"
+        if len(line) > self.max_frame_bytes:
+            # Peers couldn't read it (StreamReader limit) and would drop the connection
+            self.oversized += 1
+            print(f"Broker event {kind} too large to relay ({len(line)} bytes)")
+            return
+        try:
+            self._outgoing.put_nowait(line)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def start(self):
+        if self._client_task is None:
+            self._client_task = asyncio.create_task(self._run_client())
+
+    async def stop(self):
+        if self._client_task is not None:
+            self._client_task.cancel()
+            try:
+                await self._client_task
+            except asyncio.CancelledError:
+                pass
+            self._client_task = None
+        if self._server is not None:
+            self._server.close()
+            for peer in list(self._peers):
+                peer.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    # ---------------------------- Hub ----------------------------
+
+    async def _try_become_hub(self):
+        """Bind the socket if no other worker holds the hub lock."""
+        if self._server is not None:
+            return
+        fd = os.open(self.path + ".lock", os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return
+
+        # We hold the lock, so any existing socket file is left over from a dead hub
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._lock_fd = fd
+        self._server = await asyncio.start_unix_server(self._serve_peer, path=self.path, limit=self.max_frame_bytes)
+        print(f"Broker hub listening on {self.path} (worker {self.worker_id})")
+
+    async def _serve_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Forward every frame from one worker to all the others."""
+        peer = self._peers[writer] = HubPeer(writer, self.queue_size)
+        sender = asyncio.create_task(self._send_to_peer(peer))
+        peer_worker = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if peer_worker is None:
+                    peer_worker = json.loads(line).get("worker")
+                for other in list(self._peers.values()):
+                    if other is not peer:
+                        self._forward(other, line)
+        except (ConnectionError, ValueError) as e:
+            print(f"Broker peer error: {e}")
+        finally:
+            self._peers.pop(writer, None)
+            sender.cancel()
+            writer.close()
+            if peer_worker:
+                gone = json.dumps({"kind": WORKER_GONE, "worker": peer_worker, "payload": {"worker": peer_worker}})
+                for other in list(self._peers.values()):
+                    self._forward(other, gone.encode() + b"\n")
+
+    def _forward(self, peer: HubPeer, line: bytes):
+        """Queue a frame for a worker, disconnecting it if it has fallen too far behind."""
+        if peer.queued_bytes + len(line) <= self.peer_buffer_bytes:
+            try:
+                peer.queue.put_nowait(line)
+                peer.queued_bytes += len(line)
+                return
+            except asyncio.QueueFull:
+                pass
+        print(f"Disconnecting slow broker peer ({peer.queue.qsize()} frames, {peer.queued_bytes} bytes queued)")
+        self.slow_peers += 1
+        # Abort rather than close: close() would wait to flush what the peer isn't reading.
+        # Its _serve_peer then sees the connection end and cleans up (announcing WORKER_GONE)
+        self._peers.pop(peer.writer, None)
+        peer.writer.transport.abort()
+
+    async def _send_to_peer(self, peer: HubPeer):
+        """Write a worker's queued frames, waiting for each to drain."""
+        try:
+            while True:
+                line = await peer.queue.get()
+                peer.writer.write(line)
+                await peer.writer.drain()
+                peer.queued_bytes -= len(line)
+        except ConnectionError:
+            pass
+
+    # ---------------------------- Client ----------------------------
+
+    async def _run_client(self):
+        """Stay connected to the hub, electing a new one if it disappears."""
+        backoff = 0.1
+        while True:
+            try:
+                await self._try_become_hub()
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=self.max_frame_bytes)
+            except OSError:
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 2.0)
+                continue
+
+            backoff = 0.1
+            sender = asyncio.create_task(self._send_loop(writer))
+            try:
+                # The first frame identifies this worker to the hub
+                self.publish("hello", {})
+                self._dispatch(CONNECTED, {})
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    envelope = json.loads(line)
+                    if envelope.get("worker") != self.worker_id:
+                        self._dispatch(envelope["kind"], envelope.get("payload") or {})
+            except (ConnectionError, ValueError) as e:
+                print(f"Broker connection error: {e}")
+            finally:
+                sender.cancel()
+                writer.close()
+            print("Lost connection to broker hub, reconnecting...")
+
+    async def _send_loop(self, writer: asyncio.StreamWriter):
+        while True:
+            line = await self._outgoing.get()
+            writer.write(line)
+            await writer.drain()
+
+
+def create_broker(kind: str = WS_BROKER) -> Broker:
+    if kind == "unix":
+        return UnixSocketBroker()
+    if kind == "memory":
+        return InProcessBroker()
+    raise ValueError(f"Unknown WS_BROKER: {kind} (expected 'memory' or 'unix')")
+
+
+# Create singleton instance (started in main.py's lifespan)
+broker = create_broker()
@@ -0,0 +1,99 @@
+"""
+Content-addressed cache of assembled ancestor contexts.
+
+Siblings under the same parent chain share an identical ancestor set, so the
+context string is built once and reused until any ancestor's content changes
+(which changes the key).
+"""
+from typing import Dict, Iterable, Optional
+from collections import OrderedDict
+import hashlib
+import os
+
+# Eviction bounds: number of cached contexts and their total size in characters
+CONTEXT_CACHE_MAX_ENTRIES: int = int(os.environ.get("CONTEXT_CACHE_MAX_ENTRIES", "2048"))
+CONTEXT_CACHE_MAX_CHARS: int = int(os.environ.get("CONTEXT_CACHE_MAX_CHARS", str(64 * 1024 * 1024)))
+
+# Node fields that end up in the rendered context
+_CONTENT_FIELDS = ("title", "prompt", "response")
+
+
+def _update_field(digest, value: Optional[str]):
+    """Feed one field into the digest as <length><bytes>; None is length -1."""
+    if value is None:
+        digest.update((-1).to_bytes(8, "little", signed=True))
+        return
+    data = str(value).encode()
+    digest.update(len(data).to_bytes(8, "little", signed=True))
+    digest.update(data)
+
+
+class ContextCache:
+    """LRU cache mapping a content key → assembled context string."""
+
+    def __init__(self, max_entries: int = CONTEXT_CACHE_MAX_ENTRIES, max_chars: int = CONTEXT_CACHE_MAX_CHARS):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._chars = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(ancestor_ids: Iterable[str], nodes: Dict[str, dict]) -> str:
+        """
+        Key an ordered ancestor list by ids and content.
+
+        Every id and content field is hashed length-prefixed (None apart from
+        ""), so two different chains can't produce the same byte stream.
+        """
+        digest = hashlib.sha256()
+        for ancestor_id in ancestor_ids:
+            node = nodes[ancestor_id]
+            _update_field(digest, ancestor_id)
+            for field in _CONTENT_FIELDS:
+                _update_field(digest, node.get(field))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        context = self._entries.get(key)
+        if context is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return context
+
+    def put(self, key: str, context: str):
+        if len(context) > self.max_chars:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._chars -= len(previous)
+        self._entries[key] = context
+        self._chars += len(context)
+
+        while len(self._entries) > self.max_entries or self._chars > self.max_chars:
+            _, evicted = self._entries.popitem(last=False)
+            self._chars -= len(evicted)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._chars = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "chars": self._chars,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# Create singleton instance
+context_cache = ContextCache()
@@ -1,78 +1,97 @@
 """
 Context service for building LLM context from parent nodes
 """
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple
 from database import supabase
+from schema.schemas import AncestorContext
+from services.graph_index import graph_index
+from services.context_cache import context_cache
 
 
-def get_parent_nodes(node_id: str, board_id: str) -> List[Dict]:
+async def get_parent_nodes(node_id: str, board_id: str) -> List[Dict]:
     """
-    Get all parent nodes of a given node by traversing edges.
+    Get all parent nodes of a given node from the board's graph index.
     Returns a list of parent node data.
     """
     try:
-        # Find all edges where this node is the target
-        edges_result = supabase.table("edges")\
-            .select("source_node_id")\
-            .eq("target_node_id", node_id)\
-            .eq("board_id", board_id)\
-            .execute()
-        
-        if not edges_result.data:
-            return []
-        
-        # Get all parent node IDs
-        parent_ids = [edge["source_node_id"] for edge in edges_result.data]
-        
-        # Fetch parent node data
-        parents_result = supabase.table("nodes")\
-            .select("id, title, prompt, response, context")\
-            .in_("id", parent_ids)\
-            .execute()
-        
-        return parents_result.data if parents_result.data else []
+        graph = await graph_index.get_board(board_id)
+        return graph.get_parents(node_id)
     
     except Exception as e:
         print(f"Error getting parent nodes: {e}")
         return []
 
 
-def build_context_from_parents(node_id: str, board_id: str) -> Optional[str]:
+async def get_ancestor_graph(node_id: str, board_id: str) -> Tuple[Dict[str, List[str]], Dict[str, Dict]]:
     """
-    Build context string from parent nodes.
+    Get the adjacency and node rows needed to walk a node's ancestors.
     
-    Format:
-    === Parent Context ===
-    
-    [Parent Title]
-    User: [parent prompt]
-    Assistant: [parent response]
+    Served from the in-memory graph index (loaded once per board), so walking
+    the ancestor DAG costs no database round trips.
     
-    [Parent's Context (if exists)]
+    Returns (parents, nodes):
+    - parents: node_id -> list of parent node ids
+    - nodes: node_id -> node row
+    """
+    graph = await graph_index.get_board(board_id)
+    return graph.parents, graph.nodes
+
+
+def order_ancestors(node_id: str, parents: Dict[str, List[str]]) -> List[str]:
+    """
+    Topologically order the ancestors of a node, roots first.
     
-    =====================
+    Iterative post-order DFS over parent links: every ancestor is visited once
+    and always comes after its own ancestors. Cycles are ignored.
+    """
+    order = []
+    visited = {node_id}
+    stack = [(node_id, iter(parents.get(node_id, [])))]
+    
+    while stack:
+        current, remaining = stack[-1]
+        for parent_id in remaining:
+            if parent_id not in visited:
+                visited.add(parent_id)
+                stack.append((parent_id, iter(parents.get(parent_id, []))))
+                break
+        else:
+            stack.pop()
+            if current != node_id:
+                order.append(current)
+    
+    return order
+
+
+def format_ancestor_context(ancestors: List[Dict]) -> Optional[str]:
     """
-    parents = get_parent_nodes(node_id, board_id)
+    Render ancestors (already in topological order) as one context block.
     
-    if not parents:
+    Format:
+    === Context from Parent Nodes ===
+    
+    [Ancestor Title]
+    User: [ancestor prompt]
+    Assistant: [ancestor response]
+    
+    --------------------------------------------------
+    ...
+    =================================
+    """
+    if not ancestors:
         return None
     
     context_parts = ["=== Context from Parent Nodes ===\n"]
     
-    for parent in parents:
-        # Add parent's conversation
-        if parent.get("title"):
-            context_parts.append(f"\n[{parent['title']}]")
+    for ancestor in ancestors:
+        if ancestor.get("title"):
+            context_parts.append(f"\n[{ancestor['title']}]")
         
-        if parent.get("prompt"):
-            context_parts.append(f"User: {parent['prompt']}")
+        if ancestor.get("prompt"):
+            context_parts.append(f"User: {ancestor['prompt']}")
         
-        if parent.get("response"):
-            context_parts.append(f"Assistant: {parent['response']}")
-        
-        # Add parent's context (which may include grandparents)
-        if parent.get("context"):
-            context_parts.append(f"\n{parent['context']}")
+        if ancestor.get("response"):
+            context_parts.append(f"Assistant: {ancestor['response']}")
         
         context_parts.append("\n" + "-" * 50 + "\n")
     
@@ -81,20 +100,56 @@ def build_context_from_parents(node_id: str, board_id: str) -> Optional[str]:
     return "\n".join(context_parts)
 
 
-def update_node_context(node_id: str, board_id: str) -> Optional[str]:
+async def build_ancestor_context(node_id: str, board_id: str) -> AncestorContext:
+    """
+    Build context from the node's full ancestor DAG.
+    
+    Each ancestor's own prompt/response is emitted exactly once (stored
+    `context` columns are not re-embedded), so size grows linearly with the
+    number of ancestors instead of with the number of paths to them.
+    """
+    parents, nodes = await get_ancestor_graph(node_id, board_id)
+    ordered_ids = [ancestor_id for ancestor_id in order_ancestors(node_id, parents) if ancestor_id in nodes]
+    
+    # Siblings share the same ancestors, so reuse their assembled context
+    context = None
+    if ordered_ids:
+        cache_key = context_cache.make_key(ordered_ids, nodes)
+        context = context_cache.get(cache_key)
+        if context is None:
+            context = format_ancestor_context([nodes[ancestor_id] for ancestor_id in ordered_ids])
+            context_cache.put(cache_key, context)
+    
+    return AncestorContext(
+        node_id=node_id,
+        context=context,
+        ancestor_ids=ordered_ids,
+        char_count=len(context) if context else 0
+    )
+
+
+async def build_context_from_parents(node_id: str, board_id: str) -> Optional[str]:
+    """Build the context string for a node from all of its ancestors."""
+    result = await build_ancestor_context(node_id, board_id)
+    print(f"Context for node {node_id}: {len(result.ancestor_ids)} ancestors, {result.char_count} chars")
+    return result.context
+
+
+async def update_node_context(node_id: str, board_id: str) -> Optional[str]:
     """
     Build and update the context for a node based on its parents.
     Returns the built context string.
     """
     try:
-        context = build_context_from_parents(node_id, board_id)
+        context = await build_context_from_parents(node_id, board_id)
         
         if context:
             # Update the node's context in the database
-            supabase.table("nodes")\
+            await supabase.table("nodes")\
                 .update({"context": context})\
                 .eq("id", node_id)\
                 .execute()
+            graph_index.update_node(board_id, node_id, {"context": context})
         
         return context
     
@@ -103,23 +158,23 @@ def update_node_context(node_id: str, board_id: str) -> Optional[str]:
         return None
 
 # Add this function to handle highlighted text in context
-def build_context_with_highlight(parent_node_id: str, highlighted_text: str, board_id: str) -> str:
+async def build_context_with_highlight(parent_node_id: str, highlighted_text: str, board_id: str) -> str:
     """
     Build context that emphasizes highlighted text from parent.
     """
     # Get parent node's full conversation
-    parent_result = supabase.table("nodes").select("prompt, response, context").eq("id", parent_node_id).execute()
+    parent = await graph_index.get_node(board_id, parent_node_id)
     
-    if not parent_result.data:
+    if not parent:
         return None
     
-    parent = parent_result.data[0]
-    
     context_parts = []
     
-    # Add parent's existing context (if any)
-    if parent.get("context"):
-        context_parts.append(parent["context"])
+    # Add parent's existing context (if any) - the graph index doesn't hold contexts
+    context_result = await supabase.table("nodes").select("context").eq("id", parent_node_id).execute()
+    parent_context = context_result.data[0].get("context") if context_result.data else None
+    if parent_context:
+        context_parts.append(parent_context)
         context_parts.append("\n" + "=" * 50 + "\n")
     
     # Add parent's conversation
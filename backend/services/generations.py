@@ -0,0 +1,170 @@
+"""
+In-flight generations, tracked per node so they can be cancelled.
+
+A node's generation is superseded when the node is prompted again and
+orphaned when the node is deleted or its board reset; either way it is
+cancelled instead of finishing the Gemini call and writing a stale
+response. Clients can also cancel explicitly (POST .../nodes/{id}/cancel or
+the `cancel_generation` WebSocket message).
+
+Prompting a node again with the prompt it is already generating for is not
+a new generation: the caller joins the running one (so identical requests
+still share one Gemini call), and it is only cancelled once every caller
+has gone away.
+
+Every cancellation bumps the node's (or board's) epoch. Work queued before
+that - a background job still waiting for a worker - passes the epoch it saw
+as `since` and is dropped without calling Gemini. Cancellations are relayed
+to the other workers through the broker.
+"""
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from services.broker import broker
+from services.websocket_manager import manager
+import asyncio
+import hashlib
+
+# (board epoch, node epoch) - changes whenever the node's work is cancelled
+Epoch = Tuple[int, int]
+
+
+def prompt_key(prompt: str) -> str:
+    """Identity of a prompt, used to tell a repeated prompt from a new one."""
+    return hashlib.sha256(prompt.encode()).hexdigest()
+
+
+class GenerationCancelled(Exception):
+    """Raised by GenerationRegistry.run when the generation was cancelled; the message is the reason."""
+
+
+class GenerationRegistry:
+    """Running generation per (board_id, node_id), plus cancellation epochs."""
+
+    def __init__(self):
+        # (board_id, node_id) → {"task", "prompt_key", "waiters"}
+        self._running: Dict[Tuple[str, str], dict] = {}
+        # Tasks cancelled by us (rather than by their callers) → reason
+        self._reasons: Dict[asyncio.Task, str] = {}
+        self._board_epochs: Dict[str, int] = {}
+        # board_id → node_id → epoch
+        self._node_epochs: Dict[str, Dict[str, int]] = {}
+        self.cancelled = 0
+        self.skipped = 0
+        self.joined = 0
+
+        broker.subscribe("generation_cancel", self._on_remote_cancel)
+
+    def epoch(self, board_id: str, node_id: str) -> Epoch:
+        """Current epoch of a node; pass it to run() as `since` for deferred work."""
+        return self._board_epochs.get(board_id, 0), self._node_epochs.get(board_id, {}).get(node_id, 0)
+
+    async def run(self, board_id: str, node_id: str, work: Callable[[], Awaitable[Any]],
+                  since: Optional[Epoch] = None, key: Optional[str] = None) -> Any:
+        """
+        Run `work` (an async callable) as the node's generation and return its result.
+
+        If the node is already generating for the same `key` (see prompt_key),
+        wait for that generation instead; a different key supersedes it.
+        Raises GenerationCancelled if the node was cancelled after `since` or
+        while the work runs. Once every caller has been cancelled, so is the work.
+        """
+        node = (board_id, node_id)
+        if since is not None and since != self.epoch(board_id, node_id):
+            self.skipped += 1
+            raise GenerationCancelled("cancelled before it started")
+
+        entry = self._running.get(node)
+        if entry is not None and key is not None and entry["prompt_key"] == key and not entry["task"].done():
+            entry["waiters"] += 1
+            self.joined += 1
+        else:
+            if entry is not None:
+                self._cancel_task(entry["task"], "superseded")
+            entry = {"task": asyncio.ensure_future(work()), "prompt_key": key, "waiters": 1}
+            self._running[node] = entry
+
+        task = entry["task"]
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            reason = self._reasons.get(task)
+            if reason is None:
+                # Our caller went away
+                raise
+            if entry["waiters"] == 1:
+                # Told once, by the last caller to find out
+                await self._announce(board_id, node_id, reason)
+            raise GenerationCancelled(reason)
+        finally:
+            entry["waiters"] -= 1
+            if not entry["waiters"]:
+                if not task.done():
+                    # Orphaned: nobody is waiting for the answer any more
+                    task.cancel()
+                self._reasons.pop(task, None)
+                if self._running.get(node) is entry:
+                    del self._running[node]
+
+    def cancel(self, board_id: str, node_id: Optional[str] = None, reason: str = "cancelled",
+               notify: bool = True, keep: Optional[str] = None) -> int:
+        """
+        Cancel a node's generation, or every generation on the board if `node_id` is None.
+
+        A generation for the prompt key `keep` is left running (a repeated
+        prompt joins it rather than superseding it). Returns how many running
+        generations were cancelled on this worker.
+        """
+        if node_id is None:
+            self._board_epochs[board_id] = self._board_epochs.get(board_id, 0) + 1
+            # The board epoch outdates every node epoch of the board
+            self._node_epochs.pop(board_id, None)
+            targets = [entry for (entry_board_id, _), entry in self._running.items() if entry_board_id == board_id]
+        else:
+            node_epochs = self._node_epochs.setdefault(board_id, {})
+            node_epochs[node_id] = node_epochs.get(node_id, 0) + 1
+            entry = self._running.get((board_id, node_id))
+            targets = [entry] if entry is not None else []
+
+        count = sum(
+            self._cancel_task(entry["task"], reason)
+            for entry in targets if keep is None or entry["prompt_key"] != keep
+        )
+        if notify:
+            broker.publish("generation_cancel", {"board_id": board_id, "node_id": node_id, "reason": reason, "keep": keep})
+        return count
+
+    def _on_remote_cancel(self, payload: dict):
+        self.cancel(payload["board_id"], payload.get("node_id"), payload.get("reason", "cancelled"),
+                    notify=False, keep=payload.get("keep"))
+
+    def _cancel_task(self, task: asyncio.Task, reason: str) -> bool:
+        if task.done():
+            return False
+        self._reasons[task] = reason
+        task.cancel()
+        self.cancelled += 1
+        return True
+
+    async def _announce(self, board_id: str, node_id: str, reason: str):
+        try:
+            await manager.broadcast_to_room(
+                board_id,
+                {
+                    "type": "generation_cancelled",
+                    "node_id": node_id,
+                    "reason": reason
+                }
+            )
+        except Exception as e:
+            print(f"Error broadcasting generation cancel: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "running": len(self._running),
+            "cancelled": self.cancelled,
+            "skipped": self.skipped,
+            "joined": self.joined,
+        }
+
+
+# Create singleton instance
+generations = GenerationRegistry()
@@ -0,0 +1,323 @@
+"""
+In-memory graph index for boards.
+
+Keeps, per board, the node rows plus parent/child adjacency lists so context
+assembly and node lookups don't need a Supabase round trip each time. A board
+is loaded on first access and kept current by the REST routes and WebSocket
+handlers that mutate it; cold boards are evicted LRU-first. Ids without a
+board row are never cached, and the assembled `context` column is left in
+the database.
+"""
+from typing import Dict, List, Optional
+from collections import OrderedDict
+from database import supabase
+from services.broker import broker
+from services.spatial_index import SpatialGrid, node_rect
+from services.search_index import SearchIndex, SEARCH_FIELD_WEIGHTS
+from services.board_versions import board_versions
+from services.typeahead import typeahead
+import asyncio
+import os
+
+# Eviction bounds: number of cached boards and total cached nodes across boards
+GRAPH_INDEX_MAX_BOARDS: int = int(os.environ.get("GRAPH_INDEX_MAX_BOARDS", "64"))
+GRAPH_INDEX_MAX_NODES: int = int(os.environ.get("GRAPH_INDEX_MAX_NODES", "50000"))
+
+# Node fields that move or resize a node's rectangle
+GEOMETRY_FIELDS = {"x", "y", "width", "height"}
+
+# Node columns kept in memory: everything the indexes and the context builder
+# read, but not the (often huge) assembled `context` - read that from the database
+GRAPH_NODE_COLUMNS = (
+    "id", "board_id", "x", "y", "width", "height", "title", "prompt", "response",
+    "role", "is_root", "is_collapsed", "is_starred", "is_responded", "color", "icon",
+    "model", "metadata",
+)
+UNINDEXED_NODE_FIELDS = ("context",)
+
+
+class BoardNotFound(Exception):
+    """Raised by GraphIndex.get_board for a board id with no `boards` row."""
+
+
+def _indexed_fields(node: dict) -> dict:
+    return {field: value for field, value in node.items() if field not in UNINDEXED_NODE_FIELDS}
+
+
+class BoardGraph:
+    """Nodes and adjacency lists for a single board."""
+
+    def __init__(self, board_id: str):
+        self.board_id = board_id
+        # node_id → node row (same shape as the `nodes` table)
+        self.nodes: Dict[str, dict] = {}
+        # edge_id → edge row
+        self.edges: Dict[str, dict] = {}
+        # node_id → parent / child node ids (lists keep edge insertion order)
+        self.parents: Dict[str, List[str]] = {}
+        self.children: Dict[str, List[str]] = {}
+        # Node rectangles, for viewport queries
+        self.spatial = SpatialGrid()
+        # Full-text index over titles, prompts and responses
+        self.search = SearchIndex()
+
+    def upsert_node(self, node: dict):
+        """Insert a node row, or merge fields into the cached row (minus UNINDEXED_NODE_FIELDS)."""
+        node = _indexed_fields(node)
+        existing = self.nodes.get(node["id"])
+        if existing is not None:
+            existing.update(node)
+        else:
+            existing = self.nodes[node["id"]] = dict(node)
+        self._index_position(existing)
+        self.search.index(existing)
+
+    def update_node(self, node_id: str, fields: dict):
+        """Merge fields into a cached node (no-op if the node isn't cached)."""
+        node = self.nodes.get(node_id)
+        if node is not None:
+            node.update(_indexed_fields(fields))
+            if not fields.keys().isdisjoint(GEOMETRY_FIELDS):
+                self._index_position(node)
+            if not fields.keys().isdisjoint(SEARCH_FIELD_WEIGHTS):
+                self.search.index(node)
+
+    def _index_position(self, node: dict):
+        if node.get("x") is None or node.get("y") is None:
+            self.spatial.remove(node["id"])
+        else:
+            self.spatial.insert(node["id"], node_rect(node))
+
+    def remove_node(self, node_id: str):
+        """Remove a node and its incident edges (mirrors ON DELETE CASCADE)."""
+        self.nodes.pop(node_id, None)
+        self.spatial.remove(node_id)
+        self.search.remove(node_id)
+        incident = [
+            edge_id for edge_id, edge in self.edges.items()
+            if edge["source_node_id"] == node_id or edge["target_node_id"] == node_id
+        ]
+        for edge_id in incident:
+            self.remove_edge(edge_id)
+        self.parents.pop(node_id, None)
+        self.children.pop(node_id, None)
+
+    def upsert_edge(self, edge: dict):
+        """Insert an edge, replacing any cached edge with the same id."""
+        if edge["id"] in self.edges:
+            self.remove_edge(edge["id"])
+        self.edges[edge["id"]] = dict(edge)
+        self.parents.setdefault(edge["target_node_id"], []).append(edge["source_node_id"])
+        self.children.setdefault(edge["source_node_id"], []).append(edge["target_node_id"])
+
+    def remove_edge(self, edge_id: str):
+        edge = self.edges.pop(edge_id, None)
+        if edge is None:
+            return
+        _remove_once(self.parents, edge["target_node_id"], edge["source_node_id"])
+        _remove_once(self.children, edge["source_node_id"], edge["target_node_id"])
+
+    def get_parents(self, node_id: str) -> List[dict]:
+        """Parent node rows of a node."""
+        return [self.nodes[parent_id] for parent_id in self.parents.get(node_id, []) if parent_id in self.nodes]
+
+    def nodes_in_rect(self, rect) -> List[dict]:
+        """Node rows intersecting a (min_x, min_y, max_x, max_y) rectangle."""
+        return [self.nodes[node_id] for node_id in self.spatial.query(rect)]
+
+
+def _remove_once(adjacency: Dict[str, List[str]], key: str, value: str):
+    neighbours = adjacency.get(key)
+    if not neighbours:
+        return
+    try:
+        neighbours.remove(value)
+    except ValueError:
+        pass
+    if not neighbours:
+        del adjacency[key]
+
+
+class GraphIndex:
+    """
+    LRU cache of BoardGraphs, shared across the app.
+
+    Mutation hooks only touch boards that are already loaded; a board that
+    isn't cached will simply be read fresh from the database on next access.
+    Other workers are told to drop their copy through the broker.
+    """
+
+    def __init__(self, max_boards: int = GRAPH_INDEX_MAX_BOARDS, max_nodes: int = GRAPH_INDEX_MAX_NODES):
+        self.max_boards = max_boards
+        self.max_nodes = max_nodes
+        self._boards: "OrderedDict[str, BoardGraph]" = OrderedDict()
+        # Per-board load locks so concurrent first accesses share one load
+        self._load_locks: Dict[str, asyncio.Lock] = {}
+        # Per-board mutation counters, used to discard loads that raced with a write
+        self._mutations: Dict[str, int] = {}
+
+        broker.subscribe("graph_invalidate", self._on_remote_invalidate)
+        broker.subscribe("graph_position", self._on_remote_position)
+
+    async def get_board(self, board_id: str) -> BoardGraph:
+        """
+        Return the board's graph, loading it from the database on a miss.
+
+        Raises BoardNotFound (and caches nothing) if the board doesn't exist.
+        """
+        graph = self._boards.get(board_id)
+        if graph is not None:
+            self._boards.move_to_end(board_id)
+            return graph
+
+        lock = self._load_locks.setdefault(board_id, asyncio.Lock())
+        try:
+            async with lock:
+                graph = self._boards.get(board_id)
+                if graph is not None:
+                    self._boards.move_to_end(board_id)
+                    return graph
+
+                mutations_before = self._mutations.get(board_id, 0)
+                graph = await self._load(board_id)
+
+                # A write landed while we were reading - serve this copy but don't cache it
+                if self._mutations.get(board_id, 0) == mutations_before:
+                    self._boards[board_id] = graph
+                    self._evict(keep=board_id)
+        finally:
+            self._load_locks.pop(board_id, None)
+        return graph
+
+    async def get_node(self, board_id: str, node_id: str) -> Optional[dict]:
+        """Return a node row (without `context`) from the board's graph, or None."""
+        try:
+            graph = await self.get_board(board_id)
+        except BoardNotFound:
+            return None
+        return graph.nodes.get(node_id)
+
+    async def _load(self, board_id: str) -> BoardGraph:
+        board_result, nodes_result, edges_result = await asyncio.gather(
+            supabase.table("boards").select("id").eq("id", board_id).execute(),
+            supabase.table("nodes").select(",".join(GRAPH_NODE_COLUMNS)).eq("board_id", board_id).execute(),
+            supabase.table("edges").select("*").eq("board_id", board_id).execute(),
+        )
+        if not board_result.data:
+            raise BoardNotFound(board_id)
+
+        graph = BoardGraph(board_id)
+        for node in nodes_result.data or []:
+            graph.upsert_node(node)
+        for edge in edges_result.data or []:
+            graph.upsert_edge(edge)
+        return graph
+
+    def _evict(self, keep: str):
+        """Drop least recently used boards until both bounds are satisfied."""
+        total_nodes = sum(len(graph.nodes) for graph in self._boards.values())
+        while len(self._boards) > 1 and (len(self._boards) > self.max_boards or total_nodes > self.max_nodes):
+            board_id, graph = next(iter(self._boards.items()))
+            if board_id == keep:
+                break
+            del self._boards[board_id]
+            total_nodes -= len(graph.nodes)
+            # Its change log goes too; clients holding older tokens do a full reload
+            board_versions.forget(board_id)
+
+    def _loaded(self, board_id: str, notify: bool = True) -> Optional[BoardGraph]:
+        self._mutations[board_id] = self._mutations.get(board_id, 0) + 1
+        if notify:
+            broker.publish("graph_invalidate", {"board_id": board_id})
+        return self._boards.get(board_id)
+
+    def _on_remote_invalidate(self, payload: dict):
+        board_id = payload["board_id"]
+        self._mutations[board_id] = self._mutations.get(board_id, 0) + 1
+        self._boards.pop(board_id, None)
+
+    def _on_remote_position(self, payload: dict):
+        """Another worker wrote dragged positions: update our copy instead of dropping the board."""
+        board_id = payload["board_id"]
+        # A load racing with this may have read the older rows
+        self._mutations[board_id] = self._mutations.get(board_id, 0) + 1
+        graph = self._boards.get(board_id)
+        if graph is not None:
+            for node_id, (x, y) in payload["positions"].items():
+                graph.update_node(node_id, {"x": x, "y": y})
+
+    # ---------------------------- Mutation hooks ----------------------------
+    # Every hook also bumps the board's version (see board_versions.py) and
+    # keeps node titles in the typeahead index current
+
+    def upsert_node(self, board_id: str, node: dict):
+        board_versions.record(board_id, "node", node["id"])
+        if "title" in node:
+            typeahead.set_node(board_id, node["id"], node["title"])
+        graph = self._loaded(board_id)
+        if graph is not None:
+            graph.upsert_node(node)
+
+    def update_node(self, board_id: str, node_id: str, fields: dict):
+        board_versions.record(board_id, "node", node_id)
+        if "title" in fields:
+            typeahead.set_node(board_id, node_id, fields["title"])
+        graph = self._loaded(board_id)
+        if graph is not None:
+            graph.update_node(node_id, fields)
+
+    def move_node(self, board_id: str, node_id: str, x: float, y: float):
+        """
+        A drag frame: move the node in our copy only.
+
+        Not a recorded change yet - the position buffer calls positions_written
+        once it has stored the drag, so versions and other workers see one
+        change per flush instead of one per mouse move.
+        """
+        graph = self._boards.get(board_id)
+        if graph is not None:
+            graph.update_node(node_id, {"x": x, "y": y})
+
+    def positions_written(self, board_id: str, positions: Dict[str, tuple]):
+        """Dragged positions ({node_id → (x, y)}) reached the database: record them and tell other workers."""
+        for node_id in positions:
+            board_versions.record(board_id, "node", node_id)
+        # Position changes don't affect context, so other workers keep their copy and take the new positions
+        graph = self._loaded(board_id, notify=False)
+        broker.publish("graph_position", {"board_id": board_id, "positions": positions})
+        if graph is not None:
+            for node_id, (x, y) in positions.items():
+                graph.update_node(node_id, {"x": x, "y": y})
+
+    def remove_node(self, board_id: str, node_id: str):
+        graph = self._loaded(board_id)
+        if graph is not None:
+            # Incident edges go with the node (ON DELETE CASCADE)
+            for edge_id, edge in graph.edges.items():
+                if edge["source_node_id"] == node_id or edge["target_node_id"] == node_id:
+                    board_versions.record(board_id, "edge", edge_id, deleted=True)
+            graph.remove_node(node_id)
+        board_versions.record(board_id, "node", node_id, deleted=True)
+        typeahead.remove_node(node_id)
+
+    def upsert_edge(self, board_id: str, edge: dict):
+        board_versions.record(board_id, "edge", edge["id"])
+        graph = self._loaded(board_id)
+        if graph is not None:
+            graph.upsert_edge(edge)
+
+    def remove_edge(self, board_id: str, edge_id: str):
+        board_versions.record(board_id, "edge", edge_id, deleted=True)
+        graph = self._loaded(board_id)
+        if graph is not None:
+            graph.remove_edge(edge_id)
+
+    def invalidate(self, board_id: str):
+        """Forget a board entirely (board deleted or reset)."""
+        board_versions.reset(board_id)
+        self._loaded(board_id)
+        self._boards.pop(board_id, None)
+
+
+# Create singleton instance
+graph_index = GraphIndex()
@@ -0,0 +1,165 @@
+"""
+Background generation jobs.
+
+Prompting a node with `?job=true` doesn't hold the HTTP request open for
+the Gemini call: the route submits the work here, answers 202 with a job id
+right away, and a pool of worker tasks runs it. Clients poll
+GET /boards/{id}/jobs/{job_id} or wait for the `job_completed` WebSocket
+message. Job state is relayed to other workers through the broker, so a
+poll can land on any worker. The relayed copy leaves out `result` (a job's
+result can be a whole node row), so only the worker that ran the job
+returns it; the others report the status and the node is read as usual.
+
+Jobs for a node that is re-prompted, deleted or reset before they finish
+end up `cancelled` (see services/generations.py).
+"""
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from collections import OrderedDict
+from datetime import datetime
+from services.broker import broker
+from services.generations import GenerationCancelled
+from services.websocket_manager import manager
+import asyncio
+import os
+import uuid
+
+# Worker tasks running jobs, jobs allowed to wait, and finished jobs remembered for polling
+LLM_JOB_WORKERS: int = int(os.environ.get("LLM_JOB_WORKERS", "8"))
+LLM_JOB_QUEUE_SIZE: int = int(os.environ.get("LLM_JOB_QUEUE_SIZE", "1000"))
+LLM_JOB_RETENTION: int = int(os.environ.get("LLM_JOB_RETENTION", "5000"))
+
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while the queue is full."""
+
+
+class JobManager:
+    """Queue plus worker pool for generation jobs; job state is a plain dict."""
+
+    def __init__(self, workers: int = LLM_JOB_WORKERS, queue_size: int = LLM_JOB_QUEUE_SIZE,
+                 retention: int = LLM_JOB_RETENTION):
+        self.worker_count = workers
+        self.retention = retention
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        # job_id → job dict, oldest first
+        self._jobs: "OrderedDict[str, dict]" = OrderedDict()
+        self._workers: List[asyncio.Task] = []
+        self.completed = 0
+        self.failed = 0
+
+        broker.subscribe("job_update", self._on_remote_update)
+
+    def submit(self, board_id: str, kind: str, work: Callable[[], Awaitable[Any]],
+               node_id: Optional[str] = None) -> dict:
+        """
+        Queue `work` (an async callable) and return the new job.
+
+        Raises JobQueueFull if too many jobs are already waiting.
+        """
+        job = {
+            "id": f"job-{uuid.uuid4().hex[:12]}",
+            "board_id": board_id,
+            "node_id": node_id,
+            "kind": kind,
+            "status": "queued",
+            "created_at": datetime.now().isoformat(),
+            "started_at": None,
+            "finished_at": None,
+            "error": None,
+            "result": None,
+        }
+        try:
+            self._queue.put_nowait((job, work))
+        except asyncio.QueueFull:
+            raise JobQueueFull(f"{self._queue.qsize()} jobs already queued")
+        self._store(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self._jobs.get(job_id)
+
+    def _store(self, job: dict, notify: bool = True):
+        self._jobs[job["id"]] = job
+        self._jobs.move_to_end(job["id"])
+        while len(self._jobs) > self.retention:
+            self._jobs.popitem(last=False)
+        if notify:
+            broker.publish("job_update", {**job, "result": None})
+
+    def _on_remote_update(self, payload: dict):
+        self._store(dict(payload), notify=False)
+
+    async def _run(self):
+        while True:
+            job, work = await self._queue.get()
+            job["status"] = "running"
+            job["started_at"] = datetime.now().isoformat()
+            self._store(job)
+            try:
+                job["result"] = await work()
+                job["status"] = "succeeded"
+                self.completed += 1
+            except asyncio.CancelledError:
+                job["status"] = "cancelled"
+                raise
+            except GenerationCancelled as e:
+                # Superseded by a newer prompt, or the node/board went away
+                job["error"] = str(e)
+                job["status"] = "cancelled"
+            except Exception as e:
+                # HTTPExceptions raised by the route helpers carry their message in `detail`
+                job["error"] = str(getattr(e, "detail", None) or e)
+                job["status"] = "failed"
+                self.failed += 1
+            finally:
+                job["finished_at"] = datetime.now().isoformat()
+                self._store(job)
+                self._queue.task_done()
+            await self._announce(job)
+
+    async def _announce(self, job: dict):
+        try:
+            await manager.broadcast_to_room(
+                job["board_id"],
+                {
+                    "type": "job_completed",
+                    "job_id": job["id"],
+                    "kind": job["kind"],
+                    "node_id": job["node_id"],
+                    "status": job["status"],
+                    "error": job["error"]
+                }
+            )
+        except Exception as e:
+            print(f"Error broadcasting job completion: {e}")
+
+    def start(self):
+        """Start the worker pool (called from the app lifespan)."""
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._run()) for _ in range(self.worker_count)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        for worker in self._workers:
+            try:
+                await worker
+            except asyncio.CancelledError:
+                pass
+        self._workers = []
+
+    def stats(self) -> dict:
+        statuses: Dict[str, int] = {}
+        for job in self._jobs.values():
+            statuses[job["status"]] = statuses.get(job["status"], 0) + 1
+        return {
+            "workers": len(self._workers),
+            "queued": self._queue.qsize(),
+            "completed": self.completed,
+            "failed": self.failed,
+            "jobs_by_status": statuses,
+        }
+
+
+# Create singleton instance (started in main.py's lifespan)
+jobs = JobManager()
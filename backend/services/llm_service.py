@@ -1,22 +1,239 @@
-from typing import Optional
+from typing import Dict, Optional, AsyncIterator
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from google import genai
 from google.genai import types
 from schema.schemas import LLMServiceRequest, LLMServiceResponse, LLMNodeContext
 from database import supabase
+from services.graph_index import graph_index
+from services.response_cache import response_cache
 from datetime import datetime
+import asyncio
 import os
+import random
+import time
 load_dotenv() # this must exist before genai.configure()
 
+# Upper bound on simultaneous Gemini calls and how long a single call may take
+LLM_MAX_CONCURRENCY: int = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+LLM_TIMEOUT_SECONDS: float = float(os.environ.get("LLM_TIMEOUT_SECONDS", "30"))
+# Gemini quota: requests and tokens per minute (0 disables that limit)
+LLM_REQUESTS_PER_MINUTE: int = int(os.environ.get("LLM_REQUESTS_PER_MINUTE", "60"))
+LLM_TOKENS_PER_MINUTE: int = int(os.environ.get("LLM_TOKENS_PER_MINUTE", "250000"))
+# Retries on rate-limit/overload errors, with jittered exponential backoff
+LLM_MAX_RETRIES: int = int(os.environ.get("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_SECONDS: float = float(os.environ.get("LLM_RETRY_BASE_SECONDS", "1.0"))
+LLM_RETRY_MAX_SECONDS: float = float(os.environ.get("LLM_RETRY_MAX_SECONDS", "20"))
+
+# Request priorities, in dispatch order
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BACKGROUND = "background"
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND)
+
+# Upstream statuses worth retrying: rate limited, overloaded
+RETRYABLE_STATUS_CODES = {429, 503}
+
+
+def upstream_status(error: Exception) -> Optional[int]:
+    """HTTP status carried by an SDK error, if any"""
+    status = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status
+    if "RESOURCE_EXHAUSTED" in str(error):
+        return 429
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    return upstream_status(error) in RETRYABLE_STATUS_CODES
+
+
+class TokenBucket:
+    """Refills `per_minute` units per minute, holding at most one minute's worth"""
+    
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def delay_for(self, amount: float) -> float:
+        """Seconds until `amount` units are available (0 = now)"""
+        if self.capacity <= 0:
+            return 0.0
+        self._refill()
+        missing = min(amount, self.capacity) - self.tokens
+        return missing / self.rate if missing > 0 else 0.0
+    
+    def take(self, amount: float):
+        if self.capacity > 0:
+            self.tokens -= min(amount, self.capacity)
+    
+    def drain(self):
+        """Empty the bucket (upstream told us we're over quota)"""
+        if self.capacity > 0:
+            self._refill()
+            self.tokens = min(self.tokens, 0.0)
+
+
+class LLMScheduler:
+    """
+    Decides which queued Gemini call runs next.
+    
+    Calls wait in per-board FIFO queues, one set per priority. Interactive
+    calls always go before background ones; within a priority, boards take
+    turns (round robin), so one board's big batch can't starve the others.
+    A call is dispatched when a concurrency slot is free and the
+    requests-per-minute and tokens-per-minute buckets can cover it.
+    """
+    
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 requests_per_minute: int = LLM_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: int = LLM_TOKENS_PER_MINUTE):
+        self.max_concurrency = max_concurrency
+        self._running = 0
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        # priority → board_id → waiting (future, estimated tokens, enqueued at); board order is the rotation
+        self._queues: Dict[str, "OrderedDict[str, deque]"] = {priority: OrderedDict() for priority in PRIORITIES}
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        self.dispatched = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.rate_limited = 0
+        self.retries = 0
+    
+    @asynccontextmanager
+    async def slot(self, board_id: Optional[str], priority: str = PRIORITY_INTERACTIVE, tokens: int = 0):
+        """Wait for this call's turn, then hold a concurrency slot for the block"""
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority: {priority}")
+        board_key = board_id or ""
+        entry = (asyncio.get_running_loop().create_future(), tokens, time.monotonic())
+        self._queues[priority].setdefault(board_key, deque()).append(entry)
+        self._dispatch()
+        try:
+            await entry[0]
+        except asyncio.CancelledError:
+            if entry[0].cancelled():
+                self._discard(priority, board_key, entry)
+            else:
+                # Dispatched just as we were cancelled - give the slot back
+                self._release()
+            raise
+        try:
+            yield
+        finally:
+            self._release()
+    
+    def note_rate_limited(self):
+        """Upstream rejected a call for quota - pause dispatching until the buckets refill"""
+        self.rate_limited += 1
+        self._requests.drain()
+    
+    def _next_board(self):
+        for priority in PRIORITIES:
+            boards = self._queues[priority]
+            if boards:
+                board_key = next(iter(boards))
+                return boards, board_key
+        return None
+    
+    def _dispatch(self):
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+        
+        while self._running < self.max_concurrency:
+            picked = self._next_board()
+            if picked is None:
+                return
+            boards, board_key = picked
+            queue = boards[board_key]
+            future, tokens, enqueued_at = queue[0]
+            
+            delay = max(self._requests.delay_for(1), self._tokens.delay_for(tokens))
+            if delay > 0:
+                self._wakeup = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            
+            queue.popleft()
+            # Round robin: this board goes to the back of the rotation
+            del boards[board_key]
+            if queue:
+                boards[board_key] = queue
+            
+            self._requests.take(1)
+            self._tokens.take(tokens)
+            self._running += 1
+            waited = time.monotonic() - enqueued_at
+            self.dispatched += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            future.set_result(None)
+    
+    def _discard(self, priority: str, board_key: str, entry: tuple):
+        boards = self._queues[priority]
+        queue = boards.get(board_key)
+        if queue is None:
+            return
+        try:
+            queue.remove(entry)
+        except ValueError:
+            pass
+        if not queue:
+            del boards[board_key]
+    
+    def _release(self):
+        self._running -= 1
+        self._dispatch()
+    
+    def stats(self) -> dict:
+        return {
+            "running": self._running,
+            "queued": {
+                priority: sum(len(queue) for queue in boards.values())
+                for priority, boards in self._queues.items()
+            },
+            "boards_waiting": len({board for boards in self._queues.values() for board in boards}),
+            "dispatched": self.dispatched,
+            "avg_wait_ms": 1000 * self.total_wait / self.dispatched if self.dispatched else 0.0,
+            "max_wait_ms": 1000 * self.max_wait,
+            "rate_limited": self.rate_limited,
+            "retries": self.retries,
+        }
+
 
 class LLMService:
     """Service layer for LLM operations"""
     
-    def __init__(self):
-        api_key = os.environ.get("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY must be set in environment variables")
-        self.client = genai.Client(api_key=api_key)  # Pass API key here
+    def __init__(self, client: Optional[genai.Client] = None,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 timeout: float = LLM_TIMEOUT_SECONDS,
+                 max_retries: int = LLM_MAX_RETRIES):
+        if client is None:
+            api_key = os.environ.get("GEMINI_API_KEY")
+            if not api_key:
+                raise ValueError("GEMINI_API_KEY must be set in environment variables")
+            client = genai.Client(api_key=api_key)  # Pass API key here
+        # Any object exposing `aio.models.generate_content` works (e.g. a fake provider)
+        self.client = client
+        self.timeout = timeout
+        self.max_retries = max_retries
+        # Queues upstream calls: concurrency cap, quota buckets, per-board fairness
+        self.scheduler = LLMScheduler(max_concurrency)
+        # Single flight: node id + cache key → the upstream call duplicates wait on
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        # Callers still waiting on each flight; a call nobody waits for is cancelled
+        self._waiters: Dict[asyncio.Future, int] = {}
+        self.coalesced = 0
+        self.abandoned = 0
         self.default_model = "gemini-2.5-flash-lite"
         self.default_temperature = 0.5
         self.default_max_tokens = 250
@@ -34,14 +251,19 @@ Details: [2-3 clear paragraphs in plain text]
 Key Point: [one important takeaway]""",
         }
         
-    def _get_node_context(self, node_id: str) -> Optional[LLMNodeContext]:
-        """Fetch node data from database to use as context"""
+    async def _fetch_node(self, node_id: str, board_id: Optional[str] = None) -> Optional[dict]:
+        """Fetch a node row - from the graph index when the board is known, else from the database"""
+        if board_id:
+            return await graph_index.get_node(board_id, node_id)
+        result = await supabase.table("nodes").select("*").eq("id", node_id).execute()
+        return result.data[0] if result.data else None
+    
+    async def _get_node_context(self, node_id: str, board_id: Optional[str] = None) -> Optional[LLMNodeContext]:
+        """Fetch node data to use as context"""
         try:
-            result = supabase.table("nodes").select("*").eq("id", node_id).execute()
+            node = await self._fetch_node(node_id, board_id)
             
-            if result.data and len(result.data) > 0:
-                node = result.data[0]
-                
+            if node:
                 return LLMNodeContext(
                     node_id=node_id,
                     title=node.get("title"),
@@ -57,14 +279,14 @@ Key Point: [one important takeaway]""",
             traceback.print_exc()
             return None
     
-    def _build_prompt(self, request: LLMServiceRequest, node_context: Optional[LLMNodeContext]) -> str:
+    async def _build_prompt(self, request: LLMServiceRequest, node_context: Optional[LLMNodeContext]) -> str:
         """Build the full prompt with node context"""
         prompt_parts = []
         
-        # NEW: Get stored context from database (parent nodes)
+        # NEW: Get stored context (parent nodes) - not kept in the graph index, so read the column
         try:
-            node_result = supabase.table("nodes").select("context").eq("id", request.node_id).execute()
-            stored_context = node_result.data[0].get("context") if node_result.data else None
+            result = await supabase.table("nodes").select("context").eq("id", request.node_id).execute()
+            stored_context = result.data[0].get("context") if result.data else None
             
             if stored_context:
                 prompt_parts.append(self.formatting_styles["plain"])
@@ -90,6 +312,127 @@ Key Point: [one important takeaway]""",
         
         return "\n".join(prompt_parts)
     
+    def _build_config(self) -> types.GenerateContentConfig:
+        """Generation settings shared by every call"""
+        # NEW: Add configuration for concise responses
+        return types.GenerateContentConfig(
+            system_instruction="You are a helpful assistant. Be concise and direct. Keep responses brief (2-3 sentences) unless more detail is explicitly requested.",
+            max_output_tokens=250,  # Reasonable limit for concise answers
+            thinking_config=types.ThinkingConfig(
+                thinking_budget=0  # Turn off thinking for simple tasks = faster responses
+            )
+        )
+    
+    def _cache_key(self, contents: str, config: types.GenerateContentConfig) -> str:
+        """Response cache key for a call (model + config + assembled prompt)"""
+        return response_cache.make_key(self.default_model, config.model_dump(mode="json", exclude_none=True), contents)
+    
+    def _estimate_tokens(self, contents: str, config: types.GenerateContentConfig) -> int:
+        """Rough token cost of a call for the tokens-per-minute bucket (~4 chars per token)"""
+        return len(contents) // 4 + (config.max_output_tokens or 0)
+    
+    def _retry_delay(self, attempt: int) -> float:
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** attempt))
+    
+    async def _call_model(self, contents: str, config: types.GenerateContentConfig,
+                          board_id: Optional[str] = None, priority: str = PRIORITY_INTERACTIVE):
+        """
+        Call Gemini through the SDK's async client.
+        
+        Waits for the scheduler to grant a slot, then bounds the upstream call
+        by `self.timeout` (raises asyncio.TimeoutError). Rate-limit/overload
+        errors are retried with jittered backoff, outside the slot.
+        """
+        attempt = 0
+        while True:
+            async with self.scheduler.slot(board_id, priority, self._estimate_tokens(contents, config)):
+                try:
+                    return await asyncio.wait_for(
+                        self.client.aio.models.generate_content(
+                            model=self.default_model,
+                            contents=contents,
+                            config=config
+                        ),
+                        timeout=self.timeout
+                    )
+                except Exception as e:
+                    if not is_retryable(e) or attempt >= self.max_retries:
+                        raise
+                    self.scheduler.note_rate_limited()
+            attempt += 1
+            self.scheduler.retries += 1
+            await asyncio.sleep(self._retry_delay(attempt))
+    
+    async def _call_and_cache(self, cache_key: str, contents: str, config: types.GenerateContentConfig,
+                              board_id: Optional[str], priority: str) -> dict:
+        """One upstream call; returns {"text", "metadata"} and caches the answer"""
+        response = await self._call_model(contents, config, board_id, priority)
+        
+        # Extract metadata if available
+        metadata = {}
+        if hasattr(response, 'usage_metadata'):
+            usage = response.usage_metadata
+            metadata = {
+                "prompt_tokens": getattr(usage, 'prompt_token_count', None),
+                "completion_tokens": getattr(usage, 'candidates_token_count', None),
+                "total_tokens": getattr(usage, 'total_token_count', None),
+                "model": self.default_model
+            }
+        
+        if response.text:
+            await response_cache.put(cache_key, response.text, metadata)
+        return {"text": response.text, "metadata": metadata}
+    
+    async def _generate_once(self, flight_key: str, cache_key: str, contents: str,
+                             config: types.GenerateContentConfig, board_id: Optional[str],
+                             priority: str) -> dict:
+        """
+        Single flight: concurrent requests for the same node and prompt share one call.
+        
+        The first caller starts the upstream call as a task; duplicates that
+        arrive while it runs await the same task. A caller giving up (e.g. the
+        client disconnected) doesn't cancel the call for the others - but once
+        the last one has gone, the call is cancelled.
+        """
+        flight = self._in_flight.get(flight_key)
+        if flight is None:
+            flight = asyncio.ensure_future(self._call_and_cache(cache_key, contents, config, board_id, priority))
+            self._track_flight(flight_key, flight)
+        else:
+            self.coalesced += 1
+        return await self._wait_flight(flight_key, flight)
+    
+    async def _wait_flight(self, flight_key: str, flight: asyncio.Future) -> dict:
+        """Await a flight shielded from our own cancellation, counting waiters"""
+        self._waiters[flight] = self._waiters.get(flight, 0) + 1
+        try:
+            return await asyncio.shield(flight)
+        finally:
+            remaining = self._waiters.pop(flight) - 1
+            if remaining:
+                self._waiters[flight] = remaining
+            elif not flight.done() and isinstance(flight, asyncio.Task):
+                # Everyone went away (superseded, node deleted, client gone): stop the upstream call.
+                # A streamed flight is driven by its leader, which decides for itself.
+                flight.cancel()
+                self.abandoned += 1
+                # New callers start afresh rather than join the dying call
+                if self._in_flight.get(flight_key) is flight:
+                    del self._in_flight[flight_key]
+    
+    def _track_flight(self, flight_key: str, flight: asyncio.Future):
+        self._in_flight[flight_key] = flight
+        
+        def _done(finished: asyncio.Future):
+            if self._in_flight.get(flight_key) is finished:
+                del self._in_flight[flight_key]
+            # Mark the error as retrieved even if every waiter has gone away
+            if not finished.cancelled():
+                finished.exception()
+        
+        flight.add_done_callback(_done)
+    
     async def generate_content(self, request: LLMServiceRequest) -> LLMServiceResponse:
         """
         Main method to generate content using LLM with node context
@@ -102,7 +445,7 @@ Key Point: [one important takeaway]""",
         """
         try:
             # Get node context
-            node_context = self._get_node_context(request.node_id)
+            node_context = await self._get_node_context(request.node_id, request.board_id)
             
             if not node_context:
                 return LLMServiceResponse(
@@ -113,50 +456,148 @@ Key Point: [one important takeaway]""",
                 )
             
             # Build prompt with context
-            full_prompt = self._build_prompt(request, node_context)
-            
-            # NEW: Add configuration for concise responses
-            config = types.GenerateContentConfig(
-                system_instruction="You are a helpful assistant. Be concise and direct. Keep responses brief (2-3 sentences) unless more detail is explicitly requested.",
-                max_output_tokens=250,  # Reasonable limit for concise answers
-                thinking_config=types.ThinkingConfig(
-                    thinking_budget=0  # Turn off thinking for simple tasks = faster responses
+            full_prompt = await self._build_prompt(request, node_context)
+            config = self._build_config()
+            
+            # Same model, config and prompt as an earlier call - reuse its answer
+            cache_key = self._cache_key(full_prompt, config)
+            cached = await response_cache.get(cache_key)
+            if cached is not None:
+                return LLMServiceResponse(
+                    success=True,
+                    node_id=request.node_id,
+                    generated_content=cached["text"],
+                    metadata={**cached["metadata"], "cached": True},
+                    timestamp=datetime.now()
                 )
-            )
             
-            response = self.client.models.generate_content(
-                model=self.default_model,
-                contents=full_prompt,
-                config=config
+            result = await self._generate_once(
+                f"{request.node_id}:{cache_key}", cache_key, full_prompt, config,
+                request.board_id, request.priority
             )
             
-            # Extract metadata if available
-            metadata = {}
-            if hasattr(response, 'usage_metadata'):
-                usage = response.usage_metadata
-                metadata = {
-                    "prompt_tokens": getattr(usage, 'prompt_token_count', None),
-                    "completion_tokens": getattr(usage, 'candidates_token_count', None),
-                    "total_tokens": getattr(usage, 'total_token_count', None),
-                    "model": self.default_model
-                }
-            
             return LLMServiceResponse(
                 success=True,
                 node_id=request.node_id,
-                generated_content=response.text,
-                metadata=metadata,
+                generated_content=result["text"],
+                metadata=result["metadata"],
+                timestamp=datetime.now()
+            )
+        
+        except asyncio.TimeoutError:
+            return LLMServiceResponse(
+                success=False,
+                node_id=request.node_id,
+                error=f"LLM call timed out after {self.timeout}s",
                 timestamp=datetime.now()
             )
             
         except Exception as e:
+            status = upstream_status(e)
             return LLMServiceResponse(
                 success=False,
                 node_id=request.node_id,
                 error=str(e),
+                status_code=status if status in RETRYABLE_STATUS_CODES else None,
                 timestamp=datetime.now()
             )
     
+    async def generate_content_stream(self, request: LLMServiceRequest) -> AsyncIterator[str]:
+        """
+        Stream generated text chunk by chunk (same prompt as generate_content)
+        
+        Args:
+            request: LLMServiceRequest with node_id and prompt
+            
+        Yields:
+            Text deltas in the order Gemini produces them
+            
+        Raises:
+            ValueError if the node does not exist, asyncio.TimeoutError if the
+            stream stalls for longer than `self.timeout`, or the SDK's error.
+        """
+        node_context = await self._get_node_context(request.node_id, request.board_id)
+        if not node_context:
+            raise ValueError(f"Node {request.node_id} not found")
+        
+        full_prompt = await self._build_prompt(request, node_context)
+        config = self._build_config()
+        
+        # A cached answer is sent as a single chunk
+        cache_key = self._cache_key(full_prompt, config)
+        cached = await response_cache.get(cache_key)
+        if cached is not None:
+            yield cached["text"]
+            return
+        
+        # Same node and prompt already generating: wait for it and send the answer in one chunk
+        flight_key = f"{request.node_id}:{cache_key}"
+        flight = self._in_flight.get(flight_key)
+        if flight is not None:
+            self.coalesced += 1
+            result = await self._wait_flight(flight_key, flight)
+            if result["text"]:
+                yield result["text"]
+            return
+        
+        # Lead the flight: duplicates arriving meanwhile wait on this future
+        flight = asyncio.get_running_loop().create_future()
+        self._track_flight(flight_key, flight)
+        chunks = []
+        try:
+            attempt = 0
+            while True:
+                # Hold the scheduler slot for the lifetime of the stream
+                async with self.scheduler.slot(request.board_id, request.priority, self._estimate_tokens(full_prompt, config)):
+                    try:
+                        stream = await asyncio.wait_for(
+                            self.client.aio.models.generate_content_stream(
+                                model=self.default_model,
+                                contents=full_prompt,
+                                config=config
+                            ),
+                            timeout=self.timeout
+                        )
+                    except Exception as e:
+                        # Only opening the stream is retried - once text has been sent it can't be taken back
+                        if not is_retryable(e) or attempt >= self.max_retries:
+                            raise
+                        self.scheduler.note_rate_limited()
+                        stream = None
+                    
+                    while stream is not None:
+                        try:
+                            # Timeout applies per chunk, so long answers are fine as long as they keep flowing
+                            chunk = await asyncio.wait_for(stream.__anext__(), timeout=self.timeout)
+                        except StopAsyncIteration:
+                            break
+                        if chunk.text:
+                            chunks.append(chunk.text)
+                            yield chunk.text
+                if stream is not None:
+                    break
+                attempt += 1
+                self.scheduler.retries += 1
+                await asyncio.sleep(self._retry_delay(attempt))
+        except BaseException as e:
+            # Stream failed or was abandoned by its consumer - fail the waiters too
+            flight.set_exception(e if isinstance(e, Exception) else RuntimeError("Generation was abandoned"))
+            raise
+        
+        result = {"text": "".join(chunks), "metadata": {"model": self.default_model}}
+        # Only complete streams are cached
+        if chunks:
+            await response_cache.put(cache_key, result["text"], result["metadata"])
+        flight.set_result(result)
+    
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._in_flight),
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+            "scheduler": self.scheduler.stats(),
+        }
+    
     async def enhance_node_content(self, node_id: str, prompt: str, operation_type: str = "enhance") -> LLMServiceResponse:
         """
         Convenience method for enhancing node content
@@ -0,0 +1,117 @@
+"""
+Write-behind buffer for node positions.
+
+Dragging a node sends `node_moved` many times per second. Instead of one
+UPDATE per message, only the latest (x, y) per node is kept in memory and
+written to the database in one batched call per flush interval, on
+disconnect, and on shutdown. Written positions are then handed to the graph
+index, which records them as board changes and relays them to the other
+workers - once per flush rather than once per frame.
+"""
+from typing import Dict, Optional, Tuple
+from database import supabase
+from services.graph_index import graph_index
+import asyncio
+import os
+
+# How often pending positions are written to the database (seconds)
+POSITION_FLUSH_INTERVAL: float = float(os.environ.get("POSITION_FLUSH_INTERVAL", "1.0"))
+
+
+class PositionBuffer:
+    """Coalesces node position updates and flushes them in batches."""
+
+    def __init__(self, flush_interval: float = POSITION_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        # board_id → {node_id → (x, y)}; only the latest position survives
+        self._pending: Dict[str, Dict[str, Tuple[float, float]]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.received = 0
+        self.written = 0
+
+    def record(self, board_id: str, node_id: str, x: float, y: float):
+        """Remember the latest position for a node (overwrites older ones)."""
+        self._pending.setdefault(board_id, {})[node_id] = (x, y)
+        self.received += 1
+
+    def discard(self, board_id: str, node_id: Optional[str] = None):
+        """Drop pending positions for a node (or a whole board) written elsewhere."""
+        if node_id is None:
+            self._pending.pop(board_id, None)
+            return
+        board_pending = self._pending.get(board_id)
+        if board_pending:
+            board_pending.pop(node_id, None)
+
+    async def flush(self, board_id: Optional[str] = None):
+        """
+        Write pending positions to the database in one batched call.
+
+        Flushes a single board, or every board when board_id is None. On
+        failure the positions are put back unless a newer one arrived.
+        """
+        async with self._flush_lock:
+            if board_id is None:
+                batch, self._pending = self._pending, {}
+            else:
+                board_pending = self._pending.pop(board_id, None)
+                batch = {board_id: board_pending} if board_pending else {}
+
+            positions = [
+                {"id": node_id, "board_id": pending_board_id, "x": x, "y": y}
+                for pending_board_id, board_pending in batch.items()
+                for node_id, (x, y) in board_pending.items()
+            ]
+            if not positions:
+                return
+
+            try:
+                await supabase.rpc("update_node_positions", {"positions": positions}).execute()
+                self.written += len(positions)
+            except Exception as e:
+                print(f"Error flushing node positions: {e}")
+                for pending_board_id, board_pending in batch.items():
+                    current = self._pending.setdefault(pending_board_id, {})
+                    for node_id, position in board_pending.items():
+                        current.setdefault(node_id, position)
+                return
+
+            for written_board_id, board_pending in batch.items():
+                # A node dragged again meanwhile is recorded when its newer position is written
+                newer = self._pending.get(written_board_id, {})
+                written = {node_id: position for node_id, position in board_pending.items() if node_id not in newer}
+                if written:
+                    graph_index.positions_written(written_board_id, written)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        """Start the periodic flush task (called from the app lifespan)."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the periodic flush and write whatever is still pending."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending": sum(len(board_pending) for board_pending in self._pending.values()),
+            "received": self.received,
+            "written": self.written,
+        }
+
+
+# Create singleton instance (started in main.py's lifespan)
+position_buffer = PositionBuffer()
@@ -0,0 +1,78 @@
+"""
+Tick-based cursor presence.
+
+Instead of rebroadcasting every `cursor_moved` message to every other user
+(M users x K updates/sec x M recipients), the latest cursor per user_id is
+kept per room and one batched `cursors_snapshot` frame is sent per tick.
+"""
+from typing import Dict, Optional
+from services.websocket_manager import manager
+import asyncio
+import os
+
+# Cursor frames per second sent to each room (only when something changed)
+CURSOR_TICK_HZ: float = float(os.environ.get("CURSOR_TICK_HZ", "20"))
+
+
+class PresenceTicker:
+    """Collects cursor updates per room and broadcasts them once per tick."""
+
+    def __init__(self, tick_hz: float = CURSOR_TICK_HZ):
+        self.tick_interval = 1.0 / tick_hz
+        # board_id → {user_id → latest cursor_data} changed since the last tick
+        self._changed: Dict[str, Dict[str, dict]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def update(self, board_id: str, cursor_data: dict):
+        """Record a user's latest cursor (older updates in the same tick are dropped)."""
+        user_id = cursor_data.get("user_id")
+        if not user_id:
+            return
+        self._changed.setdefault(board_id, {})[user_id] = cursor_data
+
+    def remove(self, board_id: str, user_id: str):
+        """Queue a cursor removal (null position) for a user who left."""
+        self._changed.setdefault(board_id, {})[user_id] = {
+            "user_id": user_id,
+            "x": None,
+            "y": None,
+            "timestamp": None
+        }
+
+    async def tick(self):
+        """Send one `cursors_snapshot` frame to every room with cursor changes."""
+        batch, self._changed = self._changed, {}
+        for board_id, cursors in batch.items():
+            try:
+                await manager.broadcast_to_room(
+                    board_id,
+                    {
+                        "type": "cursors_snapshot",
+                        "cursors": list(cursors.values())
+                    }
+                )
+            except Exception as e:
+                print(f"Error broadcasting cursors snapshot: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick_interval)
+            await self.tick()
+
+    def start(self):
+        """Start the presence ticker (called from the app lifespan)."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Create singleton instance (started in main.py's lifespan)
+presence = PresenceTicker()
@@ -0,0 +1,197 @@
+"""
+Two-tier cache of LLM responses.
+
+Keyed on everything that determines the answer: model, generation config
+(which includes the system instruction) and the fully assembled prompt. So
+asking the same thing of the same context - re-asking after an undo,
+identical branches, demo boards after a reset - is answered without calling
+Gemini.
+
+Tier 1 is an in-memory LRU. Tier 2 is an optional SQLite file (set
+LLM_CACHE_DISK_PATH) that survives restarts and is shared by workers on the
+same host. Both tiers expire entries after LLM_CACHE_TTL_SECONDS.
+"""
+from typing import Optional
+from collections import OrderedDict
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Memory tier bounds: number of responses and their total size in characters
+LLM_CACHE_MAX_ENTRIES: int = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "1024"))
+LLM_CACHE_MAX_CHARS: int = int(os.environ.get("LLM_CACHE_MAX_CHARS", str(16 * 1024 * 1024)))
+# How long a cached response stays valid (both tiers)
+LLM_CACHE_TTL_SECONDS: float = float(os.environ.get("LLM_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+# Disk tier: SQLite file path (empty disables it) and its entry bound
+LLM_CACHE_DISK_PATH: str = os.environ.get("LLM_CACHE_DISK_PATH", "")
+LLM_CACHE_DISK_MAX_ENTRIES: int = int(os.environ.get("LLM_CACHE_DISK_MAX_ENTRIES", "100000"))
+
+# Disk writes between pruning passes
+_PRUNE_EVERY = 100
+
+
+class DiskTier:
+    """SQLite-backed response store; every method blocks, so call through asyncio.to_thread."""
+
+    def __init__(self, path: str, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_expires_at ON responses (expires_at)")
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[tuple]:
+        """(value dict, expires_at) or None if missing/expired."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def put(self, key: str, value: dict, expires_at: float):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at)
+            )
+            self._writes += 1
+            if self._writes % _PRUNE_EVERY == 0:
+                self._prune()
+            self._db.commit()
+
+    def _prune(self):
+        self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+        # Entries expiring soonest are the oldest ones
+        self._db.execute(
+            "DELETE FROM responses WHERE key IN ("
+            " SELECT key FROM responses ORDER BY expires_at ASC"
+            " LIMIT max(0, (SELECT COUNT(*) FROM responses) - ?))",
+            (self.max_entries,)
+        )
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class ResponseCache:
+    """Memory LRU in front of an optional disk tier; values are {"text", "metadata"} dicts."""
+
+    def __init__(self, max_entries: int = LLM_CACHE_MAX_ENTRIES, max_chars: int = LLM_CACHE_MAX_CHARS,
+                 ttl: float = LLM_CACHE_TTL_SECONDS, disk_path: str = LLM_CACHE_DISK_PATH,
+                 disk_max_entries: int = LLM_CACHE_DISK_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.ttl = ttl
+        # key → (value, expires_at)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._chars = 0
+        self._disk: Optional[DiskTier] = DiskTier(disk_path, disk_max_entries) if disk_path else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.errors = 0
+
+    @staticmethod
+    def make_key(model: str, config: dict, prompt: str) -> str:
+        """Hash of the model, generation config (incl. system instruction) and assembled prompt."""
+        digest = hashlib.sha256()
+        digest.update(model.encode())
+        digest.update(b"\x00")
+        digest.update(json.dumps(config, sort_keys=True, default=str).encode())
+        digest.update(b"\x00")
+        digest.update(prompt.encode())
+        return digest.hexdigest()
+
+    async def get(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[1] > time.time():
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return entry[0]
+            self._remember_remove(key)
+
+        if self._disk is not None:
+            try:
+                found = await asyncio.to_thread(self._disk.get, key)
+            except Exception as e:
+                print(f"LLM response cache disk read failed: {e}")
+                self.errors += 1
+                found = None
+            if found is not None:
+                value, expires_at = found
+                self._remember(key, value, expires_at)
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, text: str, metadata: Optional[dict] = None):
+        value = {"text": text, "metadata": metadata or {}}
+        expires_at = time.time() + self.ttl
+        self._remember(key, value, expires_at)
+        self.stores += 1
+        if self._disk is not None:
+            try:
+                await asyncio.to_thread(self._disk.put, key, value, expires_at)
+            except Exception as e:
+                print(f"LLM response cache disk write failed: {e}")
+                self.errors += 1
+
+    def _remember(self, key: str, value: dict, expires_at: float):
+        size = len(value["text"])
+        if size > self.max_chars:
+            return
+        self._remember_remove(key)
+        self._entries[key] = (value, expires_at)
+        self._chars += size
+        while len(self._entries) > self.max_entries or self._chars > self.max_chars:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self._chars -= len(evicted["text"])
+            self.evictions += 1
+
+    def _remember_remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._chars -= len(entry[0]["text"])
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "chars": self._chars,
+            "disk_enabled": self._disk is not None,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "errors": self.errors,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+
+# Create singleton instance
+response_cache = ResponseCache()
@@ -0,0 +1,166 @@
+"""
+Per-board full-text search over node titles, prompts and responses.
+
+Each BoardGraph keeps an inverted index (term → {node_id: weighted term
+frequency}) that is updated as nodes are created and edited, and ranked with
+BM25. Title matches count for more than body matches, and the last query
+term also matches as a prefix so results appear while the user is typing.
+"""
+from typing import Dict, List, Optional, Tuple
+import bisect
+import heapq
+import math
+import re
+
+# Fields indexed, with their weight in the term frequency
+SEARCH_FIELD_WEIGHTS = {"title": 3.0, "prompt": 1.0, "response": 1.0}
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Prefix matching of the trailing (partial) query term: shortest prefix
+# expanded, and how many vocabulary terms it may expand to
+MIN_PREFIX_LENGTH = 3
+MAX_PREFIX_EXPANSIONS = 50
+
+# Characters of context shown around the first match in a snippet
+SNIPPET_RADIUS = 80
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+class SearchIndex:
+    """Inverted index over one board's nodes."""
+
+    def __init__(self):
+        # term → {node_id → weighted term frequency}
+        self._postings: Dict[str, Dict[str, float]] = {}
+        # node_id → (indexed field texts, {term → weighted tf}, weighted length)
+        self._docs: Dict[str, Tuple[tuple, Dict[str, float], float]] = {}
+        self._total_length = 0.0
+        # Sorted vocabulary, for prefix lookups; built (one sort) on the first
+        # prefix lookup so bulk indexing a board doesn't insort term by term
+        self._vocabulary: Optional[List[str]] = None
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def index(self, node: dict):
+        """(Re)index a node row; a no-op if its text fields didn't change."""
+        node_id = node["id"]
+        texts = tuple(node.get(field) or "" for field in SEARCH_FIELD_WEIGHTS)
+        existing = self._docs.get(node_id)
+        if existing is not None and existing[0] == texts:
+            return
+        self.remove(node_id)
+
+        terms: Dict[str, float] = {}
+        for text, weight in zip(texts, SEARCH_FIELD_WEIGHTS.values()):
+            for term in tokenize(text):
+                terms[term] = terms.get(term, 0.0) + weight
+        length = sum(terms.values())
+
+        for term, frequency in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                if self._vocabulary is not None:
+                    bisect.insort(self._vocabulary, term)
+            postings[node_id] = frequency
+        self._docs[node_id] = (texts, terms, length)
+        self._total_length += length
+
+    def remove(self, node_id: str):
+        doc = self._docs.pop(node_id, None)
+        if doc is None:
+            return
+        _, terms, length = doc
+        self._total_length -= length
+        for term in terms:
+            postings = self._postings[term]
+            del postings[node_id]
+            if not postings:
+                del self._postings[term]
+                if self._vocabulary is not None:
+                    position = bisect.bisect_left(self._vocabulary, term)
+                    del self._vocabulary[position]
+
+    def _prefix_terms(self, prefix: str) -> List[str]:
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        matches = []
+        for term in self._vocabulary[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not term.startswith(prefix):
+                break
+            matches.append(term)
+        return matches
+
+    def search(self, query: str, limit: int = 20) -> List[Tuple[str, float, List[str]]]:
+        """
+        Rank nodes for a query.
+
+        Returns (node_id, score, matched terms) tuples, best first.
+        """
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        if not query_terms or not self._docs:
+            return []
+
+        # A query still being typed: let its last term match as a prefix too
+        expanded = [[term] for term in query_terms]
+        last = query_terms[-1]
+        if not query[-1].isspace() and len(last) >= MIN_PREFIX_LENGTH:
+            expanded[-1] = [last] + [term for term in self._prefix_terms(last) if term != last]
+
+        doc_count = len(self._docs)
+        average_length = self._total_length / doc_count or 1.0
+        scores: Dict[str, float] = {}
+        matched: Dict[str, List[str]] = {}
+        for alternatives in expanded:
+            for term in alternatives:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for node_id, frequency in postings.items():
+                    length = self._docs[node_id][2]
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                    scores[node_id] = scores.get(node_id, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+                    matched.setdefault(node_id, []).append(term)
+
+        ranked = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [(node_id, score, matched[node_id]) for node_id, score in ranked]
+
+
+def make_snippet(node: dict, terms: List[str]) -> Optional[dict]:
+    """
+    Excerpt of the first field containing one of `terms`, with highlights.
+
+    Returns {"field", "text", "highlights": [[start, end], ...]} (offsets into
+    `text`), or None if no field contains a term.
+    """
+    if not terms:
+        return None
+    pattern = re.compile(r"\b(?:" + "|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True)) + r")\w*", re.IGNORECASE)
+    for field in SEARCH_FIELD_WEIGHTS:
+        text = node.get(field) or ""
+        first = pattern.search(text)
+        if first is None:
+            continue
+
+        start = max(0, first.start() - SNIPPET_RADIUS)
+        end = min(len(text), first.end() + SNIPPET_RADIUS)
+        excerpt = text[start:end]
+        prefix = "…" if start > 0 else ""
+        suffix = "…" if end < len(text) else ""
+        highlights = [
+            [match.start() + len(prefix), match.end() + len(prefix)]
+            for match in pattern.finditer(excerpt)
+        ]
+        return {"field": field, "text": prefix + excerpt + suffix, "highlights": highlights}
+    return None
@@ -0,0 +1,99 @@
+"""
+Uniform-grid spatial index over node rectangles.
+
+Each board's BoardGraph keeps one, so viewport queries
+(GET /boards/{id}/nodes?bbox=...) only look at the grid cells the viewport
+covers instead of every node on the board.
+"""
+from typing import Dict, List, Set, Tuple
+import math
+import os
+
+# Grid cell edge length in canvas units (a few nodes per cell works well)
+SPATIAL_GRID_CELL_SIZE: float = float(os.environ.get("SPATIAL_GRID_CELL_SIZE", "1024"))
+
+# Size assumed for nodes without a stored width/height (ChatNode defaults to 400px wide, auto height)
+DEFAULT_NODE_WIDTH = 400.0
+DEFAULT_NODE_HEIGHT = 300.0
+
+Rect = Tuple[float, float, float, float]  # min_x, min_y, max_x, max_y
+Cell = Tuple[int, int]
+
+
+def node_rect(node: dict) -> Rect:
+    """Bounding rectangle of a node row."""
+    x, y = node["x"], node["y"]
+    width = node.get("width") or DEFAULT_NODE_WIDTH
+    height = node.get("height") or DEFAULT_NODE_HEIGHT
+    return (x, y, x + width, y + height)
+
+
+def _intersects(a: Rect, b: Rect) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+class SpatialGrid:
+    """Maps grid cells to the ids of the nodes whose rectangle overlaps them."""
+
+    def __init__(self, cell_size: float = SPATIAL_GRID_CELL_SIZE):
+        self.cell_size = cell_size
+        self._cells: Dict[Cell, Set[str]] = {}
+        # node_id → (rect, cells it was inserted into)
+        self._entries: Dict[str, Tuple[Rect, List[Cell]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _cell_range(self, rect: Rect) -> Tuple[int, int, int, int]:
+        size = self.cell_size
+        return (
+            math.floor(rect[0] / size), math.floor(rect[1] / size),
+            math.floor(rect[2] / size), math.floor(rect[3] / size),
+        )
+
+    def insert(self, node_id: str, rect: Rect):
+        """Index a node, replacing its previous rectangle if any."""
+        entry = self._entries.get(node_id)
+        if entry is not None:
+            if entry[0] == rect:
+                return
+            self.remove(node_id)
+
+        min_cx, min_cy, max_cx, max_cy = self._cell_range(rect)
+        cells = [(cx, cy) for cx in range(min_cx, max_cx + 1) for cy in range(min_cy, max_cy + 1)]
+        for cell in cells:
+            self._cells.setdefault(cell, set()).add(node_id)
+        self._entries[node_id] = (rect, cells)
+
+    def remove(self, node_id: str):
+        entry = self._entries.pop(node_id, None)
+        if entry is None:
+            return
+        for cell in entry[1]:
+            members = self._cells.get(cell)
+            if members is None:
+                continue
+            members.discard(node_id)
+            if not members:
+                del self._cells[cell]
+
+    def query(self, rect: Rect) -> List[str]:
+        """Ids of nodes whose rectangle intersects `rect`."""
+        min_cx, min_cy, max_cx, max_cy = self._cell_range(rect)
+        cell_count = (max_cx - min_cx + 1) * (max_cy - min_cy + 1)
+
+        # Zoomed far out the viewport covers more cells than there are nodes - just scan
+        if cell_count > len(self._entries):
+            return [node_id for node_id, (entry_rect, _) in self._entries.items() if _intersects(entry_rect, rect)]
+
+        seen: Set[str] = set()
+        matches = []
+        for cx in range(min_cx, max_cx + 1):
+            for cy in range(min_cy, max_cy + 1):
+                for node_id in self._cells.get((cx, cy), ()):
+                    if node_id in seen:
+                        continue
+                    seen.add(node_id)
+                    if _intersects(self._entries[node_id][0], rect):
+                        matches.append(node_id)
+        return matches
@@ -0,0 +1,206 @@
+"""
+Prefix index over board names and node titles across all boards.
+
+Backs GET /api/search/typeahead. Every name/title is indexed under each of
+its word starts ("Quantum entanglement" matches both "qua" and "ent"), in
+one sorted key list so a prefix lookup is a binary search plus a short scan.
+The index is loaded from the database on first use and then kept current by
+the board routes and the graph index's node hooks; changes are relayed to
+other workers through the broker.
+"""
+from typing import Dict, List, Optional, Set, Tuple
+from database import supabase
+from services.broker import broker
+import asyncio
+import bisect
+import re
+
+# Word starts indexed per name/title
+TYPEAHEAD_MAX_WORDS = 8
+# Matching keys examined per lookup before ranking (bounds very short prefixes)
+TYPEAHEAD_MAX_SCAN = 1000
+# Page size used when loading names/titles from the database
+TYPEAHEAD_LOAD_PAGE_SIZE = 1000
+
+_WORD_RE = re.compile(r"\w+")
+
+# (kind, id) of an indexed board or node
+ItemKey = Tuple[str, str]
+
+
+def normalize(text: str) -> str:
+    return " ".join(_WORD_RE.findall(text.lower()))
+
+
+class TypeaheadIndex:
+    """Sorted (key, kind, id) entries for every board name and node title."""
+
+    def __init__(self):
+        self._keys: List[Tuple[str, str, str]] = []
+        # (kind, id) → {"text", "board_id", "keys"}
+        self._items: Dict[ItemKey, dict] = {}
+        # board_id → ids of its indexed nodes
+        self._board_nodes: Dict[str, Set[str]] = {}
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        # Items changed while a load was in flight (the load's copy is older)
+        self._touched: Optional[Set[ItemKey]] = None
+
+        broker.subscribe("typeahead", self._on_remote_change)
+
+    # ---------------------------- Index maintenance ----------------------------
+
+    def _register(self, kind: str, item_id: str, text: Optional[str], board_id: str) -> List[str]:
+        """Record an item (not yet in the key list) and return its keys."""
+        if not text:
+            return []
+        words = normalize(text).split(" ")
+        keys = [" ".join(words[position:]) for position in range(min(len(words), TYPEAHEAD_MAX_WORDS))]
+        self._items[(kind, item_id)] = {"text": text, "board_id": board_id, "keys": keys}
+        if kind == "node":
+            self._board_nodes.setdefault(board_id, set()).add(item_id)
+        return keys
+
+    def _insert(self, kind: str, item_id: str, text: Optional[str], board_id: str):
+        self._remove((kind, item_id))
+        for key in self._register(kind, item_id, text, board_id):
+            bisect.insort(self._keys, (key, kind, item_id))
+
+    def _remove(self, item: ItemKey):
+        entry = self._items.pop(item, None)
+        if entry is None:
+            return
+        kind, item_id = item
+        for key in entry["keys"]:
+            position = bisect.bisect_left(self._keys, (key, kind, item_id))
+            if position < len(self._keys) and self._keys[position] == (key, kind, item_id):
+                del self._keys[position]
+        if kind == "node":
+            board_nodes = self._board_nodes.get(entry["board_id"])
+            if board_nodes is not None:
+                board_nodes.discard(item_id)
+
+    def _apply(self, change: dict):
+        action, kind, item_id = change["action"], change["kind"], change["id"]
+        if self._touched is not None:
+            self._touched.add((kind, item_id))
+        if action == "set":
+            self._insert(kind, item_id, change["text"], change["board_id"])
+        elif action == "remove":
+            self._remove((kind, item_id))
+        elif action == "remove_board":
+            for node_id in list(self._board_nodes.pop(item_id, ())):
+                self._remove(("node", node_id))
+            self._remove(("board", item_id))
+
+    def _change(self, change: dict):
+        self._apply(change)
+        broker.publish("typeahead", change)
+
+    def _on_remote_change(self, payload: dict):
+        self._apply(payload)
+
+    def set_board(self, board_id: str, name: Optional[str]):
+        self._change({"action": "set", "kind": "board", "id": board_id, "text": name, "board_id": board_id})
+
+    def set_node(self, board_id: str, node_id: str, title: Optional[str]):
+        self._change({"action": "set", "kind": "node", "id": node_id, "text": title, "board_id": board_id})
+
+    def remove_node(self, node_id: str):
+        self._change({"action": "remove", "kind": "node", "id": node_id})
+
+    def remove_board(self, board_id: str):
+        """Drop a board and all its node titles."""
+        self._change({"action": "remove_board", "kind": "board", "id": board_id})
+
+    # ---------------------------- Loading ----------------------------
+
+    async def _fetch_all(self, table: str, columns: str) -> List[dict]:
+        rows = []
+        start = 0
+        while True:
+            result = await supabase.table(table).select(columns).range(start, start + TYPEAHEAD_LOAD_PAGE_SIZE - 1).execute()
+            page = result.data or []
+            rows.extend(page)
+            if len(page) < TYPEAHEAD_LOAD_PAGE_SIZE:
+                return rows
+            start += TYPEAHEAD_LOAD_PAGE_SIZE
+
+    async def ensure_loaded(self):
+        """Load every board name and node title (once)."""
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if self._loaded:
+                return
+            self._touched = set()
+            try:
+                boards = await self._fetch_all("boards", "id,name")
+                nodes = await self._fetch_all("nodes", "id,board_id,title")
+                touched = self._touched
+                # Collect every key and sort once - insort per key is quadratic
+                entries = []
+                rows = [("board", board["id"], board.get("name"), board["id"]) for board in boards]
+                rows += [("node", node["id"], node.get("title"), node["board_id"]) for node in nodes]
+                for kind, item_id, text, board_id in rows:
+                    if (kind, item_id) in touched:
+                        continue
+                    self._remove((kind, item_id))
+                    entries.extend((key, kind, item_id) for key in self._register(kind, item_id, text, board_id))
+                self._keys.extend(entries)
+                self._keys.sort()
+                self._loaded = True
+                print(f"Typeahead index loaded: {len(boards)} boards, {len(nodes)} nodes")
+            finally:
+                self._touched = None
+
+    async def reload_board_nodes(self, board_id: str):
+        """Re-read one board's node titles (after a bulk change such as a reset)."""
+        for node_id in list(self._board_nodes.get(board_id, ())):
+            self.remove_node(node_id)
+        result = await supabase.table("nodes").select("id,title").eq("board_id", board_id).execute()
+        for node in result.data or []:
+            self.set_node(board_id, node["id"], node.get("title"))
+
+    # ---------------------------- Lookup ----------------------------
+
+    async def lookup(self, prefix: str, limit: int = 10) -> List[dict]:
+        """
+        Top `limit` boards/nodes whose name or title has a word starting with `prefix`.
+
+        Whole-title prefix matches rank before mid-title ones, then shorter
+        names first; each item appears once.
+        """
+        await self.ensure_loaded()
+        query = normalize(prefix)
+        if not query:
+            return []
+
+        candidates: Dict[ItemKey, tuple] = {}
+        start = bisect.bisect_left(self._keys, (query,))
+        for key, kind, item_id in self._keys[start:start + TYPEAHEAD_MAX_SCAN]:
+            if not key.startswith(query):
+                break
+            entry = self._items[(kind, item_id)]
+            rank = (key != entry["keys"][0], len(entry["text"]), kind != "board", entry["text"])
+            current = candidates.get((kind, item_id))
+            if current is None or rank < current:
+                candidates[(kind, item_id)] = rank
+
+        ranked = sorted(candidates.items(), key=lambda item: item[1])[:limit]
+        results = []
+        for (kind, item_id), _ in ranked:
+            entry = self._items[(kind, item_id)]
+            board = self._items.get(("board", entry["board_id"]))
+            results.append({
+                "kind": kind,
+                "id": item_id,
+                "board_id": entry["board_id"],
+                "text": entry["text"],
+                "board_name": board["text"] if board else None
+            })
+        return results
+
+
+# Create singleton instance
+typeahead = TypeaheadIndex()
@@ -1,15 +1,110 @@
-from typing import Dict, Set, Optional
+from typing import Dict, Set, Optional, Union
+from collections import deque
 from fastapi import WebSocket
+from services.ws_protocol import encode_binary, is_binary
+from services.broker import Broker, broker as default_broker, CONNECTED, WORKER_GONE
+import asyncio
 import json
+import os
+
+# Outbound frames buffered per connection before the slow-consumer policy kicks in
+WS_SEND_QUEUE_SIZE: int = int(os.environ.get("WS_SEND_QUEUE_SIZE", "256"))
+# What to do when a connection's queue is full:
+# "drop" - evict stale high-frequency frames to make room, disconnect only if none are left
+# "disconnect" - disconnect the laggard immediately
+WS_SLOW_CONSUMER_POLICY: str = os.environ.get("WS_SLOW_CONSUMER_POLICY", "drop")
+
+# Frames superseded by the next one of the same kind - safe to drop for a slow client
+DROPPABLE_MESSAGE_TYPES = {"node_moved", "cursor_moved", "cursors_snapshot"}
+
+
+def encode_message(message: dict) -> str:
+    """Encode a message to JSON text once, to be shared by every recipient."""
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+def coalesce_key(message: dict) -> Optional[tuple]:
+    """What a droppable frame is about: a newer frame with the same key replaces it in a full queue."""
+    message_type = message.get("type")
+    if message_type == "node_moved":
+        return message_type, message.get("node_id")
+    if message_type == "cursor_moved":
+        return message_type, (message.get("cursor_data") or {}).get("user_id")
+    # cursors_snapshot only carries the cursors that changed, so no snapshot replaces another
+    return None
+
+
+class SendQueue:
+    """
+    Bounded FIFO of (message_type, coalesce_key, payload) entries for one connection.
+    
+    put() never blocks. When the queue is full, a droppable frame makes room
+    by evicting a stale one: first the oldest frame with its own coalesce
+    key, then a frame a newer one in the queue supersedes, then the oldest
+    droppable frame. A slow client needs the latest positions, not the backlog.
+    """
+    
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: deque = deque()
+        self._ready = asyncio.Event()
+    
+    def qsize(self) -> int:
+        return len(self._entries)
+    
+    def put(self, message_type: Optional[str], key: Optional[tuple], payload: Union[str, bytes],
+            evict: bool = True) -> bool:
+        """Queue a frame; False if the queue is full and nothing could be evicted for it."""
+        if len(self._entries) >= self.maxsize:
+            index = self._stale_index(key) if evict else None
+            if index is None:
+                return False
+            del self._entries[index]
+        self._entries.append((message_type, key, payload))
+        self._ready.set()
+        return True
+    
+    def _stale_index(self, key: Optional[tuple]) -> Optional[int]:
+        """Index of the queued frame to evict for a new frame with `key`, or None"""
+        if key is not None:
+            for index, (_, queued_key, _) in enumerate(self._entries):
+                if queued_key == key:
+                    return index
+        # Walk from the newest so every superseded frame is seen after its replacement
+        newer_keys = set()
+        superseded = oldest = None
+        for index in range(len(self._entries) - 1, -1, -1):
+            queued_type, queued_key, _ = self._entries[index]
+            if queued_type not in DROPPABLE_MESSAGE_TYPES:
+                continue
+            oldest = index
+            if queued_key is not None:
+                if queued_key in newer_keys:
+                    superseded = index
+                newer_keys.add(queued_key)
+        return superseded if superseded is not None else oldest
+    
+    async def get(self) -> Union[str, bytes]:
+        while not self._entries:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._entries.popleft()[2]
 
 class ConnectionManager:
     """
     Manages WebSocket connections for real-time collaboration.
     
     Uses FastAPI's built-in WebSocket class (from Starlette).
+    
+    Each connection has its own bounded outbound queue drained by a writer
+    task, so broadcasting never waits on a slow client.
+    
+    Broadcasts and room counts are also shared with other server workers
+    through the pub/sub broker (see services/broker.py).
     """
     
-    def __init__(self):
+    def __init__(self, queue_size: int = WS_SEND_QUEUE_SIZE, slow_consumer_policy: str = WS_SLOW_CONSUMER_POLICY,
+                 broker: Broker = default_broker):
         # Dictionary mapping board_id → set of WebSocket connections
         # Example: {"board-001": {websocket1, websocket2}, "board-002": {websocket3}}
         self.active_connections: Dict[str, Set[WebSocket]] = {}
@@ -22,8 +117,33 @@ class ConnectionManager:
         
         # NEW: Dictionary mapping WebSocket → user_id (for cursor cleanup)
         self.connection_user_ids: Dict[WebSocket, str] = {}
+        
+        # Dictionary mapping WebSocket → outbound queue / writer task draining it
+        self.send_queues: Dict[WebSocket, SendQueue] = {}
+        self.writer_tasks: Dict[WebSocket, asyncio.Task] = {}
+        
+        # Connections being closed for falling behind or failed sends (cleaned up by their endpoint)
+        self.closing: Set[WebSocket] = set()
+        
+        # Connections that negotiated the binary protocol (everyone else gets JSON text)
+        self.binary_connections: Set[WebSocket] = set()
+        
+        self.queue_size = queue_size
+        self.slow_consumer_policy = slow_consumer_policy
+        self.dropped_messages = 0
+        self.slow_disconnects = 0
+        
+        # Dictionary mapping board_id → {worker_id → connections on that worker}
+        self.remote_counts: Dict[str, Dict[str, int]] = {}
+        
+        self.broker = broker
+        self.broker.subscribe("room_message", self._on_remote_message)
+        self.broker.subscribe("room_count", self._on_remote_count)
+        self.broker.subscribe("room_count_sync", self._on_count_sync)
+        self.broker.subscribe(WORKER_GONE, self._on_worker_gone)
+        self.broker.subscribe(CONNECTED, self._on_broker_connected)
     
-    async def connect(self, websocket: WebSocket, board_id: str, user_info: dict = None):
+    async def connect(self, websocket: WebSocket, board_id: str, user_info: dict = None, subprotocol: Optional[str] = None):
         """
         Add a new WebSocket connection to a board's room.
         
@@ -31,8 +151,16 @@ class ConnectionManager:
             websocket: FastAPI WebSocket connection
             board_id: Which board this user is viewing
             user_info: Optional user information (name, color, etc.)
+            subprotocol: Negotiated subprotocol (binary frames if it is the binary one)
         """
-        await websocket.accept()
+        await websocket.accept(subprotocol=subprotocol)
+        if is_binary(subprotocol):
+            self.binary_connections.add(websocket)
+        
+        # Start the writer that delivers everything queued for this connection
+        queue = SendQueue(self.queue_size)
+        self.send_queues[websocket] = queue
+        self.writer_tasks[websocket] = asyncio.create_task(self._writer(websocket, queue))
         
         # Initialize board room if it doesn't exist
         if board_id not in self.active_connections:
@@ -45,21 +173,17 @@ class ConnectionManager:
         if user_info:
             self.connection_users[websocket] = user_info
         
-        current_count = len(self.active_connections[board_id])
+        self._publish_count(board_id)
+        current_count = self.get_room_size(board_id)
         print(f"User connected to board {board_id}. Total users: {current_count}")
         
         # IMPORTANT: Send initial user count to the newly connected client
-        try:
-            await websocket.send_json({
-                "type": "user_count_update",
-                "board_id": board_id,
-                "user_count": current_count
-            })
-        except Exception as e:
-            print(f"Error sending initial user count to new client: {e}")
-            # If we can't send, connection is likely dead - remove it
-            self.disconnect(websocket)
-            raise
+        # (queued first, so it is delivered before any broadcast)
+        self._enqueue(websocket, "user_count_update", self._encode_for(websocket, {
+            "type": "user_count_update",
+            "board_id": board_id,
+            "user_count": current_count
+        }))
         
         # Notify others in the room that someone joined
         await self.broadcast_to_room(
@@ -104,6 +228,15 @@ class ConnectionManager:
         self.connection_boards.pop(websocket, None)
         self.connection_users.pop(websocket, None)
         self.connection_user_ids.pop(websocket, None)
+        self.send_queues.pop(websocket, None)
+        self.closing.discard(websocket)
+        self.binary_connections.discard(websocket)
+        self._publish_count(board_id)
+        
+        # Stop the writer (gone already if it hit a send error)
+        writer = self.writer_tasks.pop(websocket, None)
+        if writer is not None:
+            writer.cancel()
         
         print(f"User disconnected from board {board_id}")
         return user_id
@@ -116,11 +249,7 @@ class ConnectionManager:
             message: Dictionary with message data
             websocket: Target WebSocket connection
         """
-        try:
-            await websocket.send_json(message)
-        except Exception as e:
-            print(f"Error sending message: {e}")
-            self.disconnect(websocket)
+        self._enqueue(websocket, message.get("type"), self._encode_for(websocket, message))
     
     async def broadcast_to_room(self, board_id: str, message: dict, exclude: WebSocket = None):
         """
@@ -131,30 +260,134 @@ class ConnectionManager:
             message: Dictionary with message data
             exclude: Optional WebSocket to exclude from broadcast
         """
+        # Other workers deliver to their own connections in this room
+        self.broker.publish("room_message", {"board_id": board_id, "message": message})
+        self._deliver_local(board_id, message, exclude)
+    
+    def _deliver_local(self, board_id: str, message: dict, exclude: WebSocket = None):
+        """Queue a message for this worker's connections in a room."""
         if board_id not in self.active_connections:
             return
         
-        # Create a list of connections to send to (excluding the sender)
-        connections = self.active_connections[board_id]
-        if exclude:
-            connections = connections - {exclude}
+        # Encode once per wire format and share the same payload with every recipient
+        message_type = message.get("type")
+        key = coalesce_key(message) if message_type in DROPPABLE_MESSAGE_TYPES else None
+        payload = encode_message(message)
+        binary_payload = None
+        
+        # Enqueue for every connection (except the sender); each writer task delivers independently
+        for connection in self.active_connections[board_id]:
+            if connection is exclude:
+                continue
+            if connection in self.binary_connections:
+                if binary_payload is None:
+                    binary_payload = encode_binary(message, payload)
+                self._enqueue(connection, message_type, binary_payload, key)
+            else:
+                self._enqueue(connection, message_type, payload, key)
+    
+    def _encode_for(self, websocket: WebSocket, message: dict) -> Union[str, bytes]:
+        """Encode a message in the connection's negotiated format."""
+        payload = encode_message(message)
+        if websocket in self.binary_connections:
+            return encode_binary(message, payload)
+        return payload
+    
+    def _enqueue(self, websocket: WebSocket, message_type: Optional[str], payload: Union[str, bytes],
+                 key: Optional[tuple] = None):
+        """Queue an encoded message for a connection, applying the slow-consumer policy when full."""
+        queue = self.send_queues.get(websocket)
+        if queue is None or websocket in self.closing:
+            return
+        
+        full = queue.qsize() >= queue.maxsize
+        if queue.put(message_type, key, payload, evict=self.slow_consumer_policy == "drop"):
+            if full:
+                # A stale droppable frame made room
+                self.dropped_messages += 1
+            return
         
-        # Send to all connections (in parallel)
-        disconnected = []
-        for connection in connections:
+        # Nothing droppable is left to make room - drop the laggard instead
+        print(f"Disconnecting slow WebSocket client (queue full: {queue.qsize()} frames)")
+        self.slow_disconnects += 1
+        self.closing.add(websocket)
+        writer = self.writer_tasks.pop(websocket, None)
+        if writer is not None:
+            writer.cancel()
+        asyncio.create_task(self._close(websocket))
+    
+    async def _close(self, websocket: WebSocket, code: int = 1013, reason: str = "Client too slow"):
+        try:
+            await websocket.close(code=code, reason=reason)
+        except Exception:
+            # Already gone - the endpoint's finally block still cleans up
+            pass
+    
+    async def _writer(self, websocket: WebSocket, queue: SendQueue):
+        """Deliver queued (pre-encoded) messages to one connection in order."""
+        while True:
+            payload = await queue.get()
             try:
-                await connection.send_json(message)
+                if isinstance(payload, bytes):
+                    await websocket.send_bytes(payload)
+                else:
+                    await websocket.send_text(payload)
             except Exception as e:
-                print(f"Error broadcasting to connection: {e}")
-                disconnected.append(connection)
-        
-        # Clean up disconnected connections
-        for conn in disconnected:
-            self.disconnect(conn)
+                # Leave the room cleanup (and its user_id) to the endpoint's disconnect()
+                print(f"Error sending to connection: {e}")
+                self.closing.add(websocket)
+                self.writer_tasks.pop(websocket, None)
+                await self._close(websocket, code=1011, reason="Send failed")
+                return
     
     def get_room_size(self, board_id: str) -> int:
-        """Get number of users in a board's room."""
-        return len(self.active_connections.get(board_id, set()))
+        """Get number of users in a board's room (across all workers)."""
+        local = len(self.active_connections.get(board_id, set()))
+        return local + sum(self.remote_counts.get(board_id, {}).values())
+    
+    # ---------------------------- Broker events ----------------------------
+    
+    def _publish_count(self, board_id: str):
+        self.broker.publish("room_count", {
+            "board_id": board_id,
+            "worker": self.broker.worker_id,
+            "count": len(self.active_connections.get(board_id, set()))
+        })
+    
+    def _on_remote_message(self, payload: dict):
+        self._deliver_local(payload["board_id"], payload["message"])
+    
+    def _on_remote_count(self, payload: dict):
+        worker_counts = self.remote_counts.setdefault(payload["board_id"], {})
+        if payload["count"]:
+            worker_counts[payload["worker"]] = payload["count"]
+        else:
+            worker_counts.pop(payload["worker"], None)
+            if not worker_counts:
+                del self.remote_counts[payload["board_id"]]
+    
+    def _on_worker_gone(self, payload: dict):
+        for board_id in list(self.remote_counts):
+            self._on_remote_count({"board_id": board_id, "worker": payload["worker"], "count": 0})
+    
+    def _on_count_sync(self, payload: dict):
+        for board_id in self.active_connections:
+            self._publish_count(board_id)
+    
+    def _on_broker_connected(self, payload: dict):
+        # Counts from before a reconnect may be stale - ask every worker to re-announce
+        self.remote_counts.clear()
+        self.broker.publish("room_count_sync", {})
+        self._on_count_sync(payload)
+    
+    def stats(self) -> dict:
+        return {
+            "rooms": len(self.active_connections),
+            "connections": len(self.connection_boards),
+            "queued_messages": sum(queue.qsize() for queue in self.send_queues.values()),
+            "dropped_messages": self.dropped_messages,
+            "slow_disconnects": self.slow_disconnects,
+        }
 
 
 # Create a singleton instance (shared across the app)
@@ -0,0 +1,166 @@
+"""
+Wire encodings for the board WebSocket.
+
+JSON text frames are the default. A client can opt into a compact binary
+encoding by offering the `weaver.bin.v2` subprotocol when connecting:
+
+    new WebSocket(url, ["weaver.bin.v2"])
+
+Binary frames start with a one-byte tag. The high-frequency messages use
+fixed little-endian layouts; everything else is carried as tagged JSON:
+
+    0x00 JSON              tag | utf-8 JSON
+    0x01 node_moved        tag | f64 x | f64 y | u16 len | node_id
+    0x02 cursor_moved      tag | cursor
+    0x03 cursors_snapshot  tag | u16 count | cursor * count
+
+    cursor = f64 x | f64 y | f64 timestamp | u8 len | user_id
+             (NaN encodes a null x / y / timestamp)
+
+Coordinates are float64 - the same doubles JSON clients get and the database
+stores (v1 sent float32, which rounded large or fine-grained positions).
+"""
+from typing import Optional, Union
+import json
+import math
+import struct
+
+JSON_SUBPROTOCOL = "weaver.json"
+BINARY_SUBPROTOCOL = "weaver.bin.v2"
+
+TAG_JSON = 0x00
+TAG_NODE_MOVED = 0x01
+TAG_CURSOR_MOVED = 0x02
+TAG_CURSORS_SNAPSHOT = 0x03
+
+_NODE_MOVED = struct.Struct("<ddH")
+_CURSOR = struct.Struct("<dddB")
+_COUNT = struct.Struct("<H")
+
+Frame = Union[str, bytes]
+
+
+class ProtocolError(ValueError):
+    """Raised when a frame can't be decoded."""
+
+
+def negotiate(offered: list) -> Optional[str]:
+    """Pick the subprotocol to accept from the ones the client offered (None = plain JSON)."""
+    if BINARY_SUBPROTOCOL in offered:
+        return BINARY_SUBPROTOCOL
+    if JSON_SUBPROTOCOL in offered:
+        return JSON_SUBPROTOCOL
+    return None
+
+
+def is_binary(subprotocol: Optional[str]) -> bool:
+    return subprotocol == BINARY_SUBPROTOCOL
+
+
+# ---------------------------- Encoding ----------------------------
+
+def _nullable(value) -> float:
+    return math.nan if value is None else value
+
+
+def _restore(value: float):
+    return None if math.isnan(value) else value
+
+
+def _pack_cursor(cursor: dict) -> bytes:
+    user_id = str(cursor.get("user_id", "")).encode()
+    if len(user_id) > 0xFF:
+        raise ProtocolError("user_id too long for binary cursor frame")
+    return _CURSOR.pack(
+        _nullable(cursor.get("x")),
+        _nullable(cursor.get("y")),
+        _nullable(cursor.get("timestamp")),
+        len(user_id)
+    ) + user_id
+
+
+def encode_binary(message: dict, json_payload: Optional[str] = None) -> bytes:
+    """
+    Encode a message as a binary frame.
+
+    `json_payload` lets callers reuse JSON they already encoded for the
+    tagged-JSON fallback instead of serializing again.
+    """
+    message_type = message.get("type")
+    try:
+        if message_type == "node_moved":
+            node_id = str(message["node_id"]).encode()
+            return bytes([TAG_NODE_MOVED]) + _NODE_MOVED.pack(message["x"], message["y"], len(node_id)) + node_id
+
+        if message_type == "cursor_moved":
+            return bytes([TAG_CURSOR_MOVED]) + _pack_cursor(message["cursor_data"])
+
+        if message_type == "cursors_snapshot":
+            cursors = message["cursors"]
+            return b"".join(
+                [bytes([TAG_CURSORS_SNAPSHOT]), _COUNT.pack(len(cursors))]
+                + [_pack_cursor(cursor) for cursor in cursors]
+            )
+    except (KeyError, TypeError, struct.error, ProtocolError):
+        # Missing/odd fields - fall through to the JSON-tagged frame
+        pass
+
+    if json_payload is None:
+        json_payload = json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+    return bytes([TAG_JSON]) + json_payload.encode()
+
+
+# ---------------------------- Decoding ----------------------------
+
+def _unpack_cursor(data: bytes, offset: int):
+    try:
+        x, y, timestamp, length = _CURSOR.unpack_from(data, offset)
+    except struct.error as e:
+        raise ProtocolError(f"Truncated cursor: {e}")
+    offset += _CURSOR.size
+    user_id = data[offset:offset + length].decode()
+    cursor = {"user_id": user_id, "x": _restore(x), "y": _restore(y), "timestamp": _restore(timestamp)}
+    return cursor, offset + length
+
+
+def decode_binary(data: bytes) -> dict:
+    """Decode a binary frame back into the same dict the JSON protocol carries."""
+    if not data:
+        raise ProtocolError("Empty frame")
+
+    tag = data[0]
+    try:
+        if tag == TAG_JSON:
+            return json.loads(data[1:].decode())
+
+        if tag == TAG_NODE_MOVED:
+            x, y, length = _NODE_MOVED.unpack_from(data, 1)
+            start = 1 + _NODE_MOVED.size
+            return {"type": "node_moved", "node_id": data[start:start + length].decode(), "x": x, "y": y}
+
+        if tag == TAG_CURSOR_MOVED:
+            cursor, _ = _unpack_cursor(data, 1)
+            return {"type": "cursor_moved", "cursor_data": cursor}
+
+        if tag == TAG_CURSORS_SNAPSHOT:
+            (count,) = _COUNT.unpack_from(data, 1)
+            offset = 1 + _COUNT.size
+            cursors = []
+            for _ in range(count):
+                cursor, offset = _unpack_cursor(data, offset)
+                cursors.append(cursor)
+            return {"type": "cursors_snapshot", "cursors": cursors}
+    except (struct.error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ProtocolError(f"Malformed frame: {e}")
+
+    raise ProtocolError(f"Unknown frame tag: {tag}")
+
+
+def decode_frame(frame: Frame) -> dict:
+    """Decode an incoming text (JSON) or binary frame."""
+    if isinstance(frame, bytes):
+        return decode_binary(frame)
+    try:
+        return json.loads(frame)
+    except json.JSONDecodeError as e:
+        raise ProtocolError(f"Invalid JSON: {e}")
@@ -117,6 +117,50 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+-- Batch-update node positions (used by the write-behind drag buffer)
+-- positions: [{"id": "...", "board_id": "...", "x": 1.0, "y": 2.0}, ...]
+CREATE OR REPLACE FUNCTION update_node_positions(positions JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+    updated_count INTEGER;
+BEGIN
+    UPDATE nodes n
+    SET x = (p->>'x')::FLOAT,
+        y = (p->>'y')::FLOAT
+    FROM jsonb_array_elements(positions) AS p
+    WHERE n.id = p->>'id'
+    AND n.board_id = p->>'board_id';
+    
+    GET DIAGNOSTICS updated_count = ROW_COUNT;
+    RETURN updated_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Apply many partial node updates in one call (PATCH /nodes/bulk)
+-- updates: [{"id": "...", "x": 1.0, "title": "..."}, ...] - only keys present are changed
+-- Only nodes in board_id_param are touched; the updated rows are returned
+CREATE OR REPLACE FUNCTION bulk_update_nodes(board_id_param TEXT, updates JSONB)
+RETURNS SETOF nodes AS $$
+    UPDATE nodes n
+    SET x = CASE WHEN u ? 'x' THEN (u->>'x')::FLOAT ELSE n.x END,
+        y = CASE WHEN u ? 'y' THEN (u->>'y')::FLOAT ELSE n.y END,
+        width = CASE WHEN u ? 'width' THEN (u->>'width')::FLOAT ELSE n.width END,
+        height = CASE WHEN u ? 'height' THEN (u->>'height')::FLOAT ELSE n.height END,
+        title = CASE WHEN u ? 'title' THEN u->>'title' ELSE n.title END,
+        prompt = CASE WHEN u ? 'prompt' THEN u->>'prompt' ELSE n.prompt END,
+        response = CASE WHEN u ? 'response' THEN u->>'response' ELSE n.response END,
+        context = CASE WHEN u ? 'context' THEN u->>'context' ELSE n.context END,
+        role = CASE WHEN u ? 'role' THEN u->>'role' ELSE n.role END,
+        is_root = CASE WHEN u ? 'is_root' THEN (u->>'is_root')::BOOLEAN ELSE n.is_root END,
+        is_collapsed = CASE WHEN u ? 'is_collapsed' THEN (u->>'is_collapsed')::BOOLEAN ELSE n.is_collapsed END,
+        is_starred = CASE WHEN u ? 'is_starred' THEN (u->>'is_starred')::BOOLEAN ELSE n.is_starred END,
+        model = CASE WHEN u ? 'model' THEN u->>'model' ELSE n.model END
+    FROM jsonb_array_elements(updates) AS u
+    WHERE n.id = u->>'id'
+    AND n.board_id = board_id_param
+    RETURNING n.*;
+$$ LANGUAGE sql;
+
 -- Get all edges for a board
 CREATE OR REPLACE FUNCTION get_board_edges(board_id_param TEXT)
 RETURNS TABLE (
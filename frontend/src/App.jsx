@@ -71,6 +71,19 @@ function Flow() {
     sendCursorMessage
   );
 
+  // Remove a node's partial streamed answer (its stream failed or was cancelled)
+  const dropStreamingMessage = useCallback((nodeId) => {
+    setNodes((nds) =>
+      nds.map((node) => {
+        if (node.id !== nodeId) return node;
+        const messages = node.data.messages || [];
+        const last = messages[messages.length - 1];
+        if (!last || last.role !== "assistant" || !last.streaming) return node;
+        return { ...node, data: { ...node.data, messages: messages.slice(0, -1) } };
+      })
+    );
+  }, []);
+
   // ********** WEBSOCKET INTEGRATION - ADD THIS **********
   const { sendMessage, isConnected } = useWebSocket(boardId, {
     // Handle incoming node movements from other users
@@ -143,6 +156,45 @@ function Flow() {
       );
     }, []),
 
+    // Handle streamed LLM output: grow the node's answer as chunks arrive
+    // (the final node_updated replaces it with the stored response).
+    // Chunk 0 starts a new answer; anything but the next chunk is a duplicate
+    // or arrived out of order, and is ignored.
+    onNodeResponseDelta: useCallback((message) => {
+      setNodes((nds) =>
+        nds.map((node) => {
+          if (node.id !== message.node_id) return node;
+          const messages = node.data.messages || [];
+          const last = messages[messages.length - 1];
+          const isStreaming = last && last.role === "assistant" && last.streaming;
+          let updatedMessages;
+          if (message.index === 0) {
+            updatedMessages = [
+              ...(isStreaming ? messages.slice(0, -1) : messages),
+              { role: "assistant", content: message.delta, streaming: true, nextIndex: 1 },
+            ];
+          } else if (isStreaming && message.index === last.nextIndex) {
+            updatedMessages = [
+              ...messages.slice(0, -1),
+              { ...last, content: last.content + message.delta, nextIndex: last.nextIndex + 1 },
+            ];
+          } else {
+            return node;
+          }
+          return { ...node, data: { ...node.data, messages: updatedMessages } };
+        })
+      );
+    }, []),
+
+    // Handle a streamed answer that failed or was cancelled: drop the partial text
+    onNodeResponseFailed: useCallback((message) => {
+      dropStreamingMessage(message.node_id);
+    }, []),
+
+    onGenerationCancelled: useCallback((message) => {
+      dropStreamingMessage(message.node_id);
+    }, []),
+
     // Handle incoming node deletions from other users
     onNodeDeleted: useCallback((message) => {
       console.log("Node deleted by another user:", message);
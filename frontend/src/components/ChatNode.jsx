@@ -310,6 +310,7 @@ export default function ChatNode({ data, id, isConnectable }) {
   const [isLoading, setIsLoading] = useState(false);
   const [newMessageIndices, setNewMessageIndices] = useState(new Set());
   const isWaitingForLocalResponseRef = useRef(false); // Track if we're waiting for a response we initiated
+  const hasStreamedRef = useRef(false); // Track if the pending answer arrived as streamed deltas
   const isRoot = data.isRoot || false;
 
   // Title editing state
@@ -377,6 +378,8 @@ export default function ChatNode({ data, id, isConnectable }) {
         if (newMsg.role === "assistant") {
           // Check if this is a new message (not in old messages or different content)
           const oldMsg = oldMessages[idx];
+          // Streamed answers already appear as they are generated
+          if (newMsg.streaming) return;
           if (!oldMsg || oldMsg.content !== newMsg.content) {
             // This is a new or updated assistant message - trigger typewriter effect
             newAssistantIndices.add(idx);
@@ -389,6 +392,8 @@ export default function ChatNode({ data, id, isConnectable }) {
       const hasNewAssistantMessage = newAssistantIndices.size > 0;
       const lastMessage = newMessages[newMessages.length - 1];
       const isWaitingForResponse = lastMessage && lastMessage.role === "user";
+      const isStreaming = lastMessage && lastMessage.streaming;
+      if (isStreaming) hasStreamedRef.current = true;
       
       setMessages(newMessages);
       // Set typewriter flags for new assistant messages
@@ -413,8 +418,8 @@ export default function ChatNode({ data, id, isConnectable }) {
       
       // Only update loading state if this is an update from another user
       // (detected by having a new assistant message or waiting for response that we didn't initiate)
-      if (hasNewAssistantMessage) {
-        // Assistant response arrived, stop loading
+      if (hasNewAssistantMessage || isStreaming) {
+        // Assistant response arrived (or started streaming in), stop loading
         setIsLoading(false);
         isWaitingForLocalResponseRef.current = false; // Clear the flag
       } else if (isWaitingForResponse && oldMessages.length < newMessages.length && !isWaitingForLocalResponseRef.current) {
@@ -436,6 +441,7 @@ export default function ChatNode({ data, id, isConnectable }) {
     setInput("");
     setIsLoading(true); // Start loading animation
     isWaitingForLocalResponseRef.current = true; // Mark that we're waiting for our own response
+    hasStreamedRef.current = false;
 
     try {
       // Get board ID from node data or use a default
@@ -452,11 +458,19 @@ export default function ChatNode({ data, id, isConnectable }) {
         });
       }
 
-      // Call the API to get LLM response
-      const response = await nodeAPI.updateNode(boardId, id, {
-        id: id,
-        prompt: currentInput,
-      });
+      // Keep the question in node data so streamed deltas are appended after it
+      updateNode(id, { data: { ...data, messages: newMessages } });
+
+      // Call the API to get LLM response (streamed to the room as it is generated)
+      const response = await nodeAPI.updateNode(
+        boardId,
+        id,
+        {
+          id: id,
+          prompt: currentInput,
+        },
+        { stream: true }
+      );
 
       // Update local state with response
       const assistantMessage = {
@@ -469,18 +483,20 @@ export default function ChatNode({ data, id, isConnectable }) {
       setIsLoading(false); // Stop loading animation
       isWaitingForLocalResponseRef.current = false; // No longer waiting
       
-      // Mark the new assistant message as needing typewriter effect
-      setNewMessageIndices(new Set([finalMessages.length - 1]));
-      
-      // Clear the typewriter flag after typing completes (estimate: ~20ms per character)
-      const typingDuration = (response.response?.length || 0) * 20 + 500; // Add 500ms buffer
-      setTimeout(() => {
-        setNewMessageIndices((prev) => {
-          const next = new Set(prev);
-          next.delete(finalMessages.length - 1);
-          return next;
-        });
-      }, typingDuration);
+      // Mark the new assistant message as needing typewriter effect (a streamed answer is already shown)
+      if (!hasStreamedRef.current) {
+        setNewMessageIndices(new Set([finalMessages.length - 1]));
+        
+        // Clear the typewriter flag after typing completes (estimate: ~20ms per character)
+        const typingDuration = (response.response?.length || 0) * 20 + 500; // Add 500ms buffer
+        setTimeout(() => {
+          setNewMessageIndices((prev) => {
+            const next = new Set(prev);
+            next.delete(finalMessages.length - 1);
+            return next;
+          });
+        }, typingDuration);
+      }
 
       // Update local node data to reflect isResponded
       // Note: Backend will broadcast the update via WebSocket, so we don't need to broadcast here
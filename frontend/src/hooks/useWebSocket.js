@@ -74,7 +74,12 @@ export function useWebSocket(boardId, callbacks = {}) {
           onNodeMoved,
           onNodeCreated,
           onNodeUpdated,
+          onNodeResponseDelta,
+          onNodeResponseFailed,
           onNodeDeleted,
+          onJobCompleted,
+          onGenerationCancelled,
+          onPromptBatchItem,
           onEdgeCreated,
           onEdgeDeleted,
           onUserJoined,
@@ -97,10 +102,32 @@ export function useWebSocket(boardId, callbacks = {}) {
             onNodeUpdated?.(message);
             break;
 
+          case "node_response_delta":  // Streamed LLM output (?stream=true)
+            onNodeResponseDelta?.(message);
+            break;
+
+          case "node_response_failed":  // A streamed answer stopped before completing
+            onNodeResponseFailed?.(message);
+            break;
+
           case "node_deleted":
             onNodeDeleted?.(message);
             break;
 
+          case "job_completed":  // Background generation finished (?job=true)
+            onJobCompleted?.(message);
+            break;
+
+          // Superseded, node deleted, board reset or cancelled by a user
+          // (send {type: "cancel_generation", node_id} to cancel)
+          case "generation_cancelled":
+            onGenerationCancelled?.(message);
+            break;
+
+          case "prompt_batch_item":  // One node of a prompt batch finished
+            onPromptBatchItem?.(message);
+            break;
+
           case "edge_created":
             onEdgeCreated?.(message);
             break;
@@ -122,6 +149,12 @@ export function useWebSocket(boardId, callbacks = {}) {
             onCursorMoved?.(message);
             break;
 
+          case "cursors_snapshot":  // Batched cursors, one frame per server tick
+            message.cursors?.forEach((cursor_data) =>
+              onCursorMoved?.({ type: "cursor_moved", cursor_data })
+            );
+            break;
+
           case "error":
             onError?.(message);
             break;
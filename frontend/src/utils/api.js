@@ -31,8 +31,16 @@ async function apiCall(endpoint, options = {}) {
 // Board operations
 export const boardAPI = {
   // Get board with all nodes and edges
-  getBoard: (boardId) => apiCall(`/boards/${boardId}`),
+  // view "light" returns geometry and titles only (see nodeAPI.getNodeBodies)
+  getBoard: (boardId, { view = "full", includeContext = false } = {}) =>
+    apiCall(
+      `/boards/${boardId}?view=${view}&include_context=${includeContext}`
+    ),
   getBoards: () => apiCall("/boards/"),
+  // Get nodes/edges changed since a version returned by getBoard/getBoardChanges
+  // (full_sync_required means the board must be reloaded with getBoard)
+  getBoardChanges: (boardId, since) =>
+    apiCall(`/boards/${boardId}/changes?since=${encodeURIComponent(since)}`),
   // Create a new board
   createBoard: (name) =>
     apiCall("/boards/", {
@@ -45,6 +53,11 @@ export const boardAPI = {
       method: "PATCH",
       body: JSON.stringify({ name }),
     }),
+  // Full-text search over a board's nodes (ranked, with highlighted snippets)
+  searchBoard: (boardId, query, limit = 20) =>
+    apiCall(
+      `/boards/${boardId}/search?q=${encodeURIComponent(query)}&limit=${limit}`
+    ),
   // Save nodes and edges (bulk save)
   saveBoard: (boardId, nodes, edges) =>
     apiCall(`/boards/${boardId}/save`, {
@@ -58,6 +71,20 @@ export const nodeAPI = {
   // Get all nodes for a board
   getNodes: (boardId) => apiCall(`/boards/${boardId}/nodes`),
 
+  // Get only the nodes intersecting the viewport ({ minX, minY, maxX, maxY } in flow coordinates)
+  getNodesInViewport: (boardId, { minX, minY, maxX, maxY }) =>
+    apiCall(`/boards/${boardId}/nodes?bbox=${minX},${minY},${maxX},${maxY}`),
+
+  // Get prompt/response for nodes loaded in light view
+  getNodeBodies: (boardId, nodeIds, includeContext = false) =>
+    apiCall(`/boards/${boardId}/nodes/bodies`, {
+      method: "POST",
+      body: JSON.stringify({
+        node_ids: nodeIds,
+        include_context: includeContext,
+      }),
+    }),
+
   // Create a node
   createNode: (boardId, nodeData) =>
     apiCall(`/boards/${boardId}/nodes`, {
@@ -66,8 +93,9 @@ export const nodeAPI = {
     }),
 
   // Update a node (with optional LLM prompt)
-  updateNode: (boardId, nodeId, updateData) =>
-    apiCall(`/boards/${boardId}/nodes/${nodeId}`, {
+  // stream: relay the LLM answer to the room as "node_response_delta" messages
+  updateNode: (boardId, nodeId, updateData, { stream = false } = {}) =>
+    apiCall(`/boards/${boardId}/nodes/${nodeId}${stream ? "?stream=true" : ""}`, {
       method: "PATCH",
       body: JSON.stringify(updateData),
     }),
@@ -84,6 +112,31 @@ export const nodeAPI = {
     apiCall(`/boards/${boardId}/nodes/${nodeId}`, {
       method: "DELETE",
     }),
+
+  // Prompt a node in the background: answers 202 {job_id} right away, the
+  // result arrives as a "job_completed" WebSocket message (or poll getJob)
+  promptNodeAsJob: (boardId, nodeId, updateData) =>
+    apiCall(`/boards/${boardId}/nodes/${nodeId}?job=true`, {
+      method: "PATCH",
+      body: JSON.stringify(updateData),
+    }),
+
+  // Status of a background job
+  getJob: (boardId, jobId) => apiCall(`/boards/${boardId}/jobs/${jobId}`),
+
+  // Stop a node's running (or queued) generation
+  cancelGeneration: (boardId, nodeId) =>
+    apiCall(`/boards/${boardId}/nodes/${nodeId}/cancel`, {
+      method: "POST",
+    }),
+
+  // Prompt many nodes at once: prompts is [{node_id, prompt}]. Answers 202
+  // {job_id}; each node's outcome arrives as a "prompt_batch_item" WebSocket message
+  promptBatch: (boardId, prompts) =>
+    apiCall(`/boards/${boardId}/prompts/batch`, {
+      method: "POST",
+      body: JSON.stringify({ prompts }),
+    }),
 };
 
 // Edge operations
@@ -104,3 +157,12 @@ export const edgeAPI = {
       method: "DELETE",
     }),
 };
+
+// Search operations
+export const searchAPI = {
+  // Typeahead over board names and node titles across all boards
+  typeahead: (prefix, limit = 10) =>
+    apiCall(
+      `/search/typeahead?prefix=${encodeURIComponent(prefix)}&limit=${limit}`
+    ),
+};